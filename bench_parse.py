@@ -0,0 +1,191 @@
+# bench_parse.py
+"""
+弹幕解析/校验基准测试
+
+用 dm_synth.py 生成指定行数的合成XML（可混入错误行），逐个在独立子进程中运行
+各版本的 parse_danmaku / 校验实现，记录耗时、峰值内存(RSS)和每秒行数，
+结果写入JSON，可与历史结果对比以发现性能回退。
+
+用法：
+    python bench_parse.py --sizes 1000 100000 --malformed 0.01 --json parse.json
+    python bench_parse.py --sizes 100000 --compare parse.json
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import xml.etree.ElementTree as ET
+from queue import Queue
+
+from bench_send import ROOT, _Field, load_script
+import dm_synth
+from instrument import Instrumentation
+from metrics_exporter import RestoreMetrics
+
+CACHE_DIR = ROOT / ".bench_cache"
+
+# 名称 -> (脚本文件, 方法名)
+PARSE_PATHS = {
+    "safedm3.0.parse_danmaku": ("safedm3.0.py", "parse_danmaku"),
+    "safedm4.0.parse_danmaku": ("safedm4.0.py", "parse_danmaku"),
+    "safedm5.0.parse_danmaku": ("safedm5.0.py", "parse_danmaku"),
+    "safedm5.1.parse_danmaku": ("safedm5.1.py", "parse_danmaku"),
+    "safedm5.3.parse_danmaku": ("safedm5.3.py", "parse_danmaku"),
+    "6.1._parse_danmaku": ("danmaku_restorer_6.1_TEST.py", "_parse_danmaku"),
+    "safedm5.3.enhanced_validate": ("safedm5.3.py", "enhanced_validate"),
+}
+
+
+def peak_rss_mb():
+    """当前进程峰值RSS（MB），无resource模块时返回0"""
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _prepare_dicts(xml_path):
+    """为单独测试校验准备已解析的弹幕字典（不计时）"""
+    items = []
+    for _, elem in ET.iterparse(xml_path, events=("end",)):
+        if elem.tag != "d":
+            continue
+        try:
+            params = elem.attrib["p"].split(",")
+            items.append({
+                "time": float(params[0]),
+                "mode": int(params[1]),
+                "font_size": int(params[2]),
+                "color": int(params[3]),
+                "pool_type": int(params[5]),
+                "content": elem.text or ""
+            })
+        except (KeyError, ValueError, IndexError):
+            pass
+        elem.clear()
+    return items
+
+
+def build_call(name, xml_path):
+    """构造待测调用（脚本按文件加载，方法以替身self调用）"""
+    script, method = PARSE_PATHS[name]
+    module = load_script(script, "bench_target")
+    cls = module.BiliDanmakuRestorer
+    target = cls.__new__(cls)
+    target.instrument = Instrumentation()
+
+    if script.startswith("danmaku_restorer_6.1"):
+        target.xml_path = xml_path
+        target.loaded = None
+        target._update_stats = lambda counter, total: None
+    else:
+        target.xml_path = _Field(xml_path)
+        target.color_format = _Field(0)
+        target.log_queue = Queue()
+        target.metrics = RestoreMetrics()
+        target.window_size = 1000
+
+    if method == "enhanced_validate":
+        items = _prepare_dicts(xml_path)
+        return lambda: [dm for dm in items if not target.enhanced_validate(dm)]
+    if method == "_parse_danmaku":
+        return lambda: target._parse_danmaku()[0]
+    return getattr(target, method)
+
+
+def run_worker(name, xml_path):
+    call = build_call(name, xml_path)
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    result = call()
+    wall = time.perf_counter() - start
+    print(json.dumps({
+        "wall_s": wall,
+        "rows_out": len(result or []),
+        "peak_rss_mb": peak_rss_mb(),
+        "rss_growth_mb": peak_rss_mb() - baseline
+    }))
+
+
+def synth_file(rows, malformed, seed):
+    CACHE_DIR.mkdir(exist_ok=True)
+    path = CACHE_DIR / f"synth_{rows}_{malformed}_{seed}.xml"
+    if not path.exists():
+        dm_synth.write_xml(str(path), rows, malformed, seed)
+    return path
+
+
+def run_path(name, xml_path, rows):
+    proc = subprocess.run(
+        [sys.executable, __file__, "--worker", name, "--file", str(xml_path)],
+        capture_output=True, text=True, cwd=ROOT
+    )
+    if proc.returncode != 0:
+        return {"path": name, "rows": rows, "error": proc.stderr.strip().splitlines()[-1:]}
+    data = json.loads(proc.stdout.strip().splitlines()[-1])
+    data.update({
+        "path": name,
+        "rows": rows,
+        "rows_per_sec": round(rows / data["wall_s"], 1) if data["wall_s"] else 0.0
+    })
+    return data
+
+
+def compare(results, baseline_path):
+    with open(baseline_path, encoding="utf-8") as f:
+        old = {(r["path"], r["rows"]): r for r in json.load(f)["results"] if "error" not in r}
+    print("\n与历史结果对比（rows/sec 变化，负数为变慢）：")
+    for r in results:
+        prev = old.get((r["path"], r["rows"]))
+        if prev and "error" not in r and prev["rows_per_sec"]:
+            change = (r["rows_per_sec"] / prev["rows_per_sec"] - 1) * 100
+            print(f"  {r['path']:<30} {r['rows']:>9}  {change:+6.1f}%  "
+                  f"RSS {r['peak_rss_mb'] - prev['peak_rss_mb']:+.1f}MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="弹幕解析/校验基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--malformed", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", action="append", choices=sorted(PARSE_PATHS))
+    parser.add_argument("--json", default=None, help="结果输出文件")
+    parser.add_argument("--compare", default=None, help="与历史结果文件对比")
+    parser.add_argument("--worker", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--file", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args.file)
+        return
+
+    results = []
+    for rows in args.sizes:
+        xml_path = synth_file(rows, args.malformed, args.seed)
+        for name in args.only or PARSE_PATHS:
+            r = run_path(name, xml_path, rows)
+            results.append(r)
+            if "error" in r:
+                print(f"{name:<30} {rows:>9}  失败: {r['error']}")
+            else:
+                print(f"{name:<30} {rows:>9}  {r['wall_s']:>8.3f}s  {r['rows_per_sec']:>11.0f} 行/秒  "
+                      f"峰值RSS {r['peak_rss_mb']:>7.1f}MB  输出 {r['rows_out']}")
+
+    if args.compare:
+        compare(results, args.compare)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({
+                "timestamp": int(time.time()),
+                "python": platform.python_version(),
+                "malformed": args.malformed,
+                "results": results
+            }, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
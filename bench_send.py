@@ -0,0 +1,321 @@
+# bench_send.py
+"""
+发送流程吞吐量基准测试
+
+在子进程中启动本地模拟服务器（mock_bili_server.py），依次驱动：
+- danmaku_restorer_6.1_TEST.py 的 RestoreThread（发送循环在 dm_engine.SendJob 中）
+- safedm5.3.py 的 Tk 版 restore_process
+- safe mod.py 的 SecurityManager.safe_request
+并统计每条弹幕的吞吐量(条/秒)、p50/p99 延迟和CPU耗时。
+脚本内的刻意等待（_calculate_delay / calculate_delay / base_interval）会被置零，
+重试退避和熔断冷却缩短到毫秒级，只测量流程本身。
+
+用法：
+    python bench_send.py --items 200 --latency 0.02 --json bench_send.json
+"""
+import argparse
+import functools
+import importlib.util
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from queue import Queue
+
+import dm_engine
+from circuit_breaker import BreakerRegistry, CircuitOpenError
+from credential_monitor import CredentialMonitor
+from dead_letter import DeadLetterStore
+from instrument import Instrumentation
+from metrics_exporter import RestoreMetrics
+from word_filter import WordFilter
+from retry_queue import DEFAULT_BACKOFF, RetryScheduler
+
+ROOT = Path(__file__).resolve().parent
+SESSDATA = "mock_sessdata_0001"
+BILI_JCT = "mock_bili_jct"
+
+
+def load_script(filename, module_name):
+    """按文件路径加载脚本（文件名含空格或点号，无法直接import）"""
+    spec = importlib.util.spec_from_file_location(module_name, ROOT / filename)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def fast_retry(module):
+    """把脚本中的重试队列退避缩短到毫秒级"""
+    backoff = {name: (0.01, 0.05) for name in DEFAULT_BACKOFF}
+    module.RetryScheduler = functools.partial(RetryScheduler, backoff=backoff)
+
+
+class _MemoryWordFilter(WordFilter):
+    """不读写用户词表文件的敏感词过滤器"""
+
+    @classmethod
+    def from_files(cls, *args, **kwargs):
+        return cls()
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+def summarize(name, latencies, wall, cpu, items, ok, instrument=None):
+    return {
+        "path": name,
+        "items": items,
+        "ok": ok,
+        "items_per_sec": round(items / wall, 2) if wall else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "cpu_ms_per_item": round(cpu / items * 1000, 3) if items else 0.0,
+        "wall_s": round(wall, 3),
+        "stages": instrument.snapshot()["stages"] if instrument else {}
+    }
+
+
+def write_xml(path, items):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?><i>\n')
+        for i in range(items):
+            f.write(f'<d p="{i * 0.5:.3f},1,25,16777215,1700000000,0,abcd{i:04x},{i},5">bench {i}</d>\n')
+        f.write("</i>\n")
+
+
+class _Field:
+    """Tk控件的最小替身，仅提供 get()/current()/config()"""
+
+    def __init__(self, value=""):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+    def current(self):
+        return 0
+
+    def config(self, **kwargs):
+        pass
+
+
+class _ProgressRecorder(Queue):
+    """记录每次进度更新的时间点"""
+
+    def __init__(self):
+        super().__init__()
+        self.stamps = []
+
+    def put(self, item, block=True, timeout=None):
+        self.stamps.append(time.perf_counter())
+        super().put(item, block, timeout)
+
+
+def intervals(start, stamps):
+    points = [start] + stamps
+    return [b - a for a, b in zip(points, points[1:])]
+
+
+def bench_restore_thread(base_url, items):
+    module = load_script("danmaku_restorer_6.1_TEST.py", "restorer_61")
+    fast_retry(dm_engine)
+
+    stamps = []
+    config = {
+        'danmaku_list': [{"time": i * 0.5, "mode": 1, "font_size": 25, "color": 16777215,
+                          "content": f"bench {i}"} for i in range(items)],
+        'headers': {"Cookie": f"SESSDATA={SESSDATA};bili_jct={BILI_JCT};"},
+        'oid': 10000,
+        'csrf': BILI_JCT,
+        'min_delay': 0,
+        'retry_limit': 1,
+        'api_url': f"{base_url}/x/v2/dm/post",
+        'simulate_mode': False,
+        'server_clock': module.ServerClock(url=f"{base_url}/x/server/date", samples=1),
+        'instrument': Instrumentation(enabled=True),
+        'metrics': RestoreMetrics(),
+        'dead_letters': DeadLetterStore(Path(tempfile.gettempdir()) / "bench_dead_letter.jsonl"),
+        'breakers': BreakerRegistry(recovery_timeout=0.05),
+        'account': "bench",
+        'credential_monitor': CredentialMonitor(url=f"{base_url}/x/web-interface/nav"),
+        'word_filter': WordFilter(),
+        'sent_history': set(),
+        'save_checkpoint': lambda idx: None
+    }
+    config['credential_monitor'].add_account("bench", {"SESSDATA": SESSDATA, "bili_jct": BILI_JCT})
+    thread = module.RestoreThread(config)
+    thread.job._calculate_delay = lambda idx: 0
+    thread.update_progress.connect(lambda cur, total: stamps.append(time.perf_counter()))
+    config['server_clock'].sync()
+    start, cpu0 = time.perf_counter(), time.process_time()
+    thread.run()
+    wall, cpu = time.perf_counter() - start, time.process_time() - cpu0
+    config['dead_letters'].path.unlink(missing_ok=True)
+    return summarize("RestoreThread", intervals(start, stamps), wall, cpu, items,
+                     thread.job.success_count, config['instrument'])
+
+
+def bench_tk_restore_process(base_url, items):
+    module = load_script("safedm5.3.py", "safedm53")
+    module.API_BASE = base_url
+    module.WordFilter = _MemoryWordFilter
+    fast_retry(module)
+    app = module.BiliDanmakuRestorer.__new__(module.BiliDanmakuRestorer)
+    xml_file = tempfile.NamedTemporaryFile("w", suffix=".xml", delete=False)
+    xml_file.close()
+    write_xml(xml_file.name, items)
+    app.xml_path = _Field(xml_file.name)
+    app.color_format = _Field(0)
+    app.resume_mode = _Field(False)
+    app.auto_shutdown_choose = _Field(False)
+    app.sessdata_entry = _Field(SESSDATA)
+    app.bili_jct_entry = _Field(BILI_JCT)
+    app.buvid3_entry = _Field("mock_buvid3")
+    app.bvid_entry = _Field("BV1xx411c7mD")
+    app.part_combobox = _Field()
+    app.start_btn = _Field()
+    app.cid_list = [10000]
+    app.current_index = 0
+    app.window_size = max(items // 4, 1)
+    app.running = True
+    app.stop_event = threading.Event()
+    app.log_queue = Queue()
+    app.progress_queue = _ProgressRecorder()
+    app.calculate_delay = lambda idx: 0
+    app.profile_mode = _Field(True)
+    app.prefilter_mode = _Field("关闭")
+    app.dedup_mode = _Field(False)
+    app.send_order = _Field("文件顺序")
+    app.select_start = _Field("")
+    app.select_end = _Field("")
+    app.select_mode = _Field("全部")
+    app.select_pool = _Field("全部")
+    app.metrics = RestoreMetrics()
+    app.dead_letters = DeadLetterStore(xml_file.name + ".dead.jsonl")
+    app.breakers = BreakerRegistry(recovery_timeout=0.05)
+    app.credential_monitor = CredentialMonitor(url=f"{base_url}/x/web-interface/nav")
+    app.profile_path = Path(xml_file.name + ".profile.json")
+    # 断点写入临时文件，不覆盖（完成时也不删除）本机真实的续传记录
+    module.RestoreManager._cache_path = Path(xml_file.name + ".cache")
+    try:
+        start, cpu0 = time.perf_counter(), time.process_time()
+        app.restore_process()
+        wall, cpu = time.perf_counter() - start, time.process_time() - cpu0
+    finally:
+        os.unlink(xml_file.name)
+        app.profile_path.unlink(missing_ok=True)
+        app.dead_letters.path.unlink(missing_ok=True)
+        module.RestoreManager._cache_path.unlink(missing_ok=True)
+    stamps = app.progress_queue.stamps[:-1]  # 最后一次是finally中的100%
+    return summarize("Tk restore_process", intervals(start, stamps), wall, cpu, items,
+                     int(app.metrics.sent.get()), app.instrument)
+
+
+def bench_safe_request(base_url, items):
+    module = load_script("safe mod.py", "safe_mod")
+    import requests
+    security = module.SecurityManager(SESSDATA, BILI_JCT, "mock_buvid3",
+                                      instrument=Instrumentation(enabled=True),
+                                      breakers=BreakerRegistry(recovery_timeout=0.05))
+    security.base_interval = 0
+    session = requests.Session()
+    session.cookies.update({"SESSDATA": SESSDATA, "bili_jct": BILI_JCT})
+    latencies, ok = [], 0
+    start, cpu0 = time.perf_counter(), time.process_time()
+    for i in range(items):
+        t0 = time.perf_counter()
+        try:
+            response = security.safe_request(
+                session, "POST", f"{base_url}/x/v2/dm/post",
+                headers=security.get_headers("BV1xx411c7mD"),
+                data=security.get_secured_data(oid=10000, type=1, message=f"bench {i}")
+            )
+        except CircuitOpenError as e:
+            time.sleep(e.retry_after)
+            continue
+        latencies.append(time.perf_counter() - t0)
+        ok += response.status_code == 200 and response.json().get("code") == 0
+    wall, cpu = time.perf_counter() - start, time.process_time() - cpu0
+    return summarize("SecurityManager.safe_request", latencies, wall, cpu, items, ok,
+                     security.instrument)
+
+
+BENCHES = {
+    "restore_thread": bench_restore_thread,
+    "tk": bench_tk_restore_process,
+    "safe_request": bench_safe_request
+}
+
+
+def start_mock_server(args):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    cmd = [sys.executable, str(ROOT / "mock_bili_server.py"), "--port", str(port),
+           "--latency", str(args.latency), "--jitter", str(args.jitter),
+           "--p412", str(args.p412), "--p509", str(args.p509), "--p400", str(args.p400),
+           "--p101", str(args.p101)]
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL)
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return proc, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError("模拟服务器启动超时")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="发送流程吞吐量基准测试")
+    parser.add_argument("--items", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--p412", type=float, default=0.0)
+    parser.add_argument("--p509", type=float, default=0.0)
+    parser.add_argument("--p400", type=float, default=0.0)
+    parser.add_argument("--p101", type=float, default=0.0)
+    parser.add_argument("--only", choices=sorted(BENCHES), action="append", help="只运行指定路径")
+    parser.add_argument("--json", default=None, help="结果输出文件")
+    args = parser.parse_args()
+
+    proc, base_url = start_mock_server(args)
+    os.environ["BILI_API_BASE"] = base_url
+    results = []
+    try:
+        for name in args.only or BENCHES:
+            try:
+                results.append(BENCHES[name](base_url, args.items))
+            except ImportError as e:
+                results.append({"path": name, "skipped": f"缺少依赖: {e}"})
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    for r in results:
+        if "skipped" in r:
+            print(f"{r['path']:<30} 跳过（{r['skipped']}）")
+        else:
+            print(f"{r['path']:<30} {r['items_per_sec']:>9.1f} 条/秒  p50 {r['p50_ms']:>8.2f}ms  "
+                  f"p99 {r['p99_ms']:>8.2f}ms  CPU {r['cpu_ms_per_item']:>7.3f}ms/条  成功 {r['ok']}/{r['items']}")
+            for stage, s in r["stages"].items():
+                print(f"    {stage:<10} {s['total_s']:>8.3f}s  {s['share']:>6.1%}  平均 {s['mean_ms']:.3f}ms")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"timestamp": int(time.time()), "args": vars(args), "results": results},
+                      f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
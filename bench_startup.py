@@ -0,0 +1,162 @@
+# bench_startup.py
+"""
+界面冷启动基准测试
+
+每个界面脚本在新的子进程中冷启动（每次都是新解释器），分阶段计时：
+- 首屏      从启动子进程到主窗口显示并处理完首批事件（含解释器启动和顶层导入）
+- 导入      加载脚本模块（顶层 import）
+- 窗口      创建并显示主窗口
+- 就绪      从启动子进程到窗口显示后的后台预热 / 延迟初始化全部完成（不阻塞界面）
+
+取多次运行的中位数，结果可写入JSON并与历史结果对比。无显示环境时Qt使用 offscreen
+平台；Tk 需要 DISPLAY。窗口无法创建时只报告导入阶段。
+
+用法：
+    python bench_startup.py --runs 5 --json startup.json
+    python bench_startup.py --compare startup.json
+"""
+# 子进程的测量包含本文件的顶层导入，这里只导入轻量的标准库模块（不导入 bench_send）
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+
+# 名称 -> (脚本文件, 界面工具包)
+TARGETS = {
+    "6.1": ("danmaku_restorer_6.1_TEST.py", "qt"),
+    "safedm5.3": ("safedm5.3.py", "tk"),
+    "graph": ("graph.py", "qt"),
+}
+
+PHASES = ("first_frame_ms", "import_ms", "window_ms", "ready_ms")
+
+
+def run_worker(name, spawned_at):
+    import importlib.util
+    script, toolkit = TARGETS[name]
+    sys.path.insert(0, str(ROOT))
+    start = time.perf_counter()
+    spec = importlib.util.spec_from_file_location("bench_target", ROOT / script)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    imported = time.perf_counter()
+
+    try:
+        if toolkit == "qt":
+            from PyQt5.QtWidgets import QApplication
+            app = QApplication([])
+            window = module.BiliDanmakuRestorer()
+            window.show()
+            app.processEvents()
+        else:
+            import tkinter as tk
+            root = tk.Tk()
+            window = module.BiliDanmakuRestorer(root)
+            root.update()
+    except Exception as e:
+        # 窗口无法创建时仍报告导入阶段
+        print(json.dumps({"import_ms": (imported - start) * 1000, "error": f"{type(e).__name__}: {e}"}))
+        os._exit(0)
+    shown = time.perf_counter()
+    shown_at = time.time()
+
+    result = {
+        "first_frame_ms": (shown_at - spawned_at) * 1000,
+        "import_ms": (imported - start) * 1000,
+        "window_ms": (shown - imported) * 1000
+    }
+    # 与各脚本 __main__ 中窗口显示后的步骤一致
+    try:
+        if hasattr(module, "WARM_MODULES"):
+            module.warm_up(module.WARM_MODULES).join()
+        if hasattr(window, "init_visualization"):
+            window.init_visualization()
+        result["ready_ms"] = (time.time() - spawned_at) * 1000
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    print(json.dumps(result))
+    os._exit(0)  # 跳过界面清理和后台线程，只测启动
+
+
+def run_target(name, runs):
+    env = dict(os.environ)
+    if TARGETS[name][1] == "qt" and not env.get("DISPLAY"):
+        env.setdefault("QT_QPA_PLATFORM", "offscreen")
+    samples = []
+    for _ in range(runs):
+        spawned_at = time.time()
+        proc = subprocess.run(
+            [sys.executable, __file__, "--worker", name, "--spawned-at", repr(spawned_at)],
+            capture_output=True, text=True, cwd=ROOT, env=env, timeout=120
+        )
+        if proc.returncode != 0:
+            return {"target": name, "error": proc.stderr.strip().splitlines()[-1:]}
+        samples.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+    result = {"target": name, "runs": runs}
+    for phase in PHASES:
+        if all(phase in sample for sample in samples):
+            result[phase] = round(statistics.median(s[phase] for s in samples), 1)
+    if "error" in samples[-1]:
+        result["error"] = samples[-1]["error"]
+    return result
+
+
+def compare(results, baseline_path):
+    with open(baseline_path, encoding="utf-8") as f:
+        old = {r["target"]: r for r in json.load(f)["results"]}
+    print("\n与历史结果对比（毫秒变化，正数为变慢）：")
+    for r in results:
+        prev = old.get(r["target"])
+        phases = [phase for phase in PHASES if prev and phase in r and phase in prev]
+        if phases:
+            changes = "  ".join(f"{phase[:-3]} {r[phase] - prev[phase]:+.0f}" for phase in phases)
+            print(f"  {r['target']:<12} {changes}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="界面冷启动基准测试")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--only", action="append", choices=sorted(TARGETS))
+    parser.add_argument("--json", default=None, help="结果输出文件")
+    parser.add_argument("--compare", default=None, help="与历史结果文件对比")
+    parser.add_argument("--worker", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--spawned-at", type=float, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args.spawned_at)
+        return
+
+    results = []
+    for name in args.only or TARGETS:
+        r = run_target(name, args.runs)
+        results.append(r)
+        if "first_frame_ms" in r:
+            ready = f"就绪 {r['ready_ms']:>7.0f}ms" if "ready_ms" in r else f"延迟初始化失败: {r['error']}"
+            print(f"{name:<12} 首屏 {r['first_frame_ms']:>7.0f}ms  导入 {r['import_ms']:>6.0f}ms  "
+                  f"窗口 {r['window_ms']:>6.0f}ms  {ready}")
+        elif "import_ms" in r:
+            print(f"{name:<12} 导入 {r['import_ms']:>6.0f}ms  窗口创建失败: {r['error']}")
+        else:
+            print(f"{name:<12} 失败: {r['error']}")
+
+    if args.compare:
+        compare(results, args.compare)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({
+                "timestamp": int(time.time()),
+                "python": platform.python_version(),
+                "results": results
+            }, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
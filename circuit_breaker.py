@@ -0,0 +1,182 @@
+# circuit_breaker.py
+"""
+按账号和接口划分的熔断器
+
+账号开始收到 412 / -509 时继续发送只会延长封禁时间。熔断器连续记录到
+若干次此类失败后进入"打开"状态，期间直接拒绝请求；冷却结束后进入"半开"状态，
+只放行一个探测请求，成功则恢复，失败则重新打开并延长冷却时间。
+
+    breakers = BreakerRegistry()
+    breaker = breakers.get(account_key(sessdata), "/x/v2/dm/post")
+    if breaker.allow():
+        ... 发送 ...
+        breaker.record(reason)
+"""
+import threading
+import time
+from hashlib import md5
+from typing import Callable, Dict, Tuple
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# 指标中的状态编码
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+# 计入熔断的失败原因（dm_errors 原因标识）；内容类错误只影响单条弹幕，不计入
+TRIP_REASONS = {"blocked", "rate_limit", "network"}
+
+
+def account_key(sessdata: str) -> str:
+    """由SESSDATA生成账号标识（日志和指标中不出现凭证原文）"""
+    return md5(sessdata.encode()).hexdigest()[:8]
+
+
+class CircuitOpenError(Exception):
+    """熔断器打开，请求未发出"""
+
+    def __init__(self, key: Tuple[str, str], retry_after: float):
+        super().__init__(f"熔断中 {key[0]} {key[1]}，{retry_after:.0f}秒后探测")
+        self.key = key
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    单个账号+接口的熔断器
+    功能：
+    - closed: 正常放行，连续失败达到阈值后打开
+    - open: 拒绝所有请求，冷却时间按连续打开次数翻倍（有上限）
+    - half_open: 只放行一个探测请求
+    """
+
+    def __init__(self, failure_threshold: int = 3, recovery_timeout: float = 120,
+                 max_recovery_timeout: float = 1800, clock: Callable[[], float] = time.monotonic,
+                 on_change: Callable[[str], None] = None):
+        """
+        :param failure_threshold: 连续失败多少次后打开
+        :param recovery_timeout: 首次打开的冷却秒数
+        :param max_recovery_timeout: 冷却秒数上限
+        :param clock: 单调时钟函数
+        :param on_change: 状态变化回调，参数为新状态
+        """
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.max_recovery_timeout = max_recovery_timeout
+        self.clock = clock
+        self.on_change = on_change
+        self.state = CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def _cooldown(self) -> float:
+        return min(self.max_recovery_timeout, self.recovery_timeout * 2 ** max(0, self.trips - 1))
+
+    def _set_state(self, state: str) -> None:
+        if state != self.state:
+            self.state = state
+            if self.on_change:
+                self.on_change(state)
+
+    def retry_after(self) -> float:
+        """距离可以探测的秒数，未打开时为0"""
+        with self._lock:
+            if self.state != OPEN:
+                return 0.0
+            return max(0.0, self.opened_at + self._cooldown() - self.clock())
+
+    def allow(self) -> bool:
+        """
+        是否放行本次请求（放行后必须调用 record_success / record_failure）
+
+        :return: False 表示应立即放弃或推迟该请求
+        """
+        with self._lock:
+            if self.state == OPEN:
+                if self.clock() < self.opened_at + self._cooldown():
+                    return False
+                self._set_state(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self._probing:
+                    return False
+                self._probing = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.trips = 0
+            self._probing = False
+            self._set_state(CLOSED)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._probing = False
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.trips += 1
+                self.failures = 0
+                self.opened_at = self.clock()
+                self._set_state(OPEN)
+
+    def record_neutral(self) -> None:
+        """与账号健康无关的结果（如内容被过滤）：只结束探测，不改变计数"""
+        with self._lock:
+            if self.state == HALF_OPEN and self._probing:
+                self._probing = False
+                self.failures = 0
+                self.trips = 0
+                self._set_state(CLOSED)
+
+    def record(self, reason: str) -> None:
+        """
+        按 dm_errors 原因标识记录结果
+
+        :param reason: "ok" 为成功；TRIP_REASONS 中的原因计为失败；其余视为中性
+        """
+        if reason == "ok":
+            self.record_success()
+        elif reason in TRIP_REASONS:
+            self.record_failure()
+        else:
+            self.record_neutral()
+
+
+class BreakerRegistry:
+    """按 (账号, 接口) 懒创建熔断器，状态变化同步到指标"""
+
+    def __init__(self, metrics=None, clock: Callable[[], float] = time.monotonic, **options):
+        """
+        :param metrics: 指标集合（metrics_exporter.RestoreMetrics），为空时不记录
+        :param clock: 单调时钟函数
+        :param options: 传给 CircuitBreaker 的参数
+        """
+        self.metrics = metrics
+        self.clock = clock
+        self.options = options
+        self._breakers: Dict[Tuple[str, str], CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, account: str, endpoint: str) -> CircuitBreaker:
+        key = (account, endpoint)
+        with self._lock:
+            breaker = self._breakers.get(key)
+            if breaker is None:
+                breaker = CircuitBreaker(clock=self.clock,
+                                         on_change=lambda state, key=key: self._report(key, state),
+                                         **self.options)
+                self._breakers[key] = breaker
+                self._report(key, CLOSED)
+            return breaker
+
+    def states(self) -> Dict[Tuple[str, str], str]:
+        with self._lock:
+            return {key: b.state for key, b in self._breakers.items()}
+
+    def _report(self, key, state) -> None:
+        if self.metrics is not None:
+            self.metrics.breaker_state.set(STATE_VALUES[state], *key)
@@ -0,0 +1,148 @@
+# clock_sync.py
+import threading
+import time
+from datetime import datetime
+from typing import Callable, List, Optional, Tuple
+
+SERVER_DATE_URL = "https://api.bilibili.com/x/server/date"
+
+
+class ServerClock:
+    """
+    B站服务器时钟同步
+    功能：
+    - 多次采样 /x/server/date，估算服务器时钟偏移和往返延迟(RTT)
+    - 以单调时钟为基准推算服务器时间，不受本地系统时间跳变影响
+    - 后台线程定期重新校准
+
+    服务器时间只有秒级精度，每个样本只能说明"在 [t0, t1] 内某一时刻服务器处于第 N 秒"，
+    因此对所有样本的可行偏移区间取交集，采样间隔故意错开整秒以收窄区间。
+    """
+
+    def __init__(self, session=None, url: str = SERVER_DATE_URL, samples: int = 5,
+                 refresh_interval: float = 600, timeout: float = 3,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        初始化时钟同步
+
+        :param session: requests会话对象，为空时自动创建独立会话
+        :param url: 服务器时间接口
+        :param samples: 每次校准的采样次数
+        :param refresh_interval: 后台重新校准间隔（秒）
+        :param timeout: 单次采样超时（秒）
+        :param clock: 单调时钟函数
+        """
+        self.session = session
+        self.url = url
+        self.samples = samples
+        self.refresh_interval = refresh_interval
+        self.timeout = timeout
+        self.clock = clock
+        self.offset_ms = None       # 服务器毫秒时间 - 单调时钟毫秒
+        self.uncertainty_ms = None  # 偏移估计的半宽
+        self.rtt_ms = None          # 最小往返延迟
+        self.last_sync = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def synced(self) -> bool:
+        return self.offset_ms is not None
+
+    def now_ms(self) -> int:
+        """
+        获取当前服务器时间
+
+        :return: 服务器毫秒时间戳，未校准时退回本地时间
+        """
+        with self._lock:
+            offset = self.offset_ms
+        if offset is None:
+            return int(time.time() * 1000)
+        return int(self.clock() * 1000 + offset)
+
+    def sync(self) -> bool:
+        """
+        立即采样并更新偏移估计
+
+        :return: 是否至少获得一个有效样本
+        """
+        results = []
+        for i in range(self.samples):
+            sample = self._sample()
+            if sample:
+                results.append(sample)
+            if i < self.samples - 1:
+                time.sleep(0.23)  # 错开整秒边界
+        if not results:
+            return False
+
+        offset, uncertainty, rtt = self.estimate(results)
+        with self._lock:
+            self.offset_ms = offset
+            self.uncertainty_ms = uncertainty
+            self.rtt_ms = rtt
+            self.last_sync = self.clock()
+        return True
+
+    @staticmethod
+    def estimate(results: List[Tuple[float, float, int]]) -> Tuple[float, float, float]:
+        """
+        由采样结果估算偏移
+
+        :param results: [(发送时单调毫秒, 接收时单调毫秒, 服务器整秒毫秒), ...]
+        :return: (偏移, 不确定度, 最小RTT)
+        """
+        lo = max(server_ms - t1 for t0, t1, server_ms in results)
+        hi = min(server_ms + 1000 - t0 for t0, t1, server_ms in results)
+        rtt = min(t1 - t0 for t0, t1, _ in results)
+        if lo <= hi:
+            return (lo + hi) / 2, (hi - lo) / 2, rtt
+        # 区间无交集（服务器时间跳变或样本异常），退回RTT最小的样本
+        t0, t1, server_ms = min(results, key=lambda r: r[1] - r[0])
+        return server_ms + 500 - (t0 + t1) / 2, (t1 - t0) / 2 + 500, rtt
+
+    def start(self) -> None:
+        """首次校准并启动后台刷新线程"""
+        self.sync()
+        if self._thread and self._thread.is_alive() and not self._stop_event.is_set():
+            return
+        # 刚停止的线程可能还没退出：新线程使用新的停止事件，不受旧线程影响
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._refresh_loop, args=(self._stop_event,), daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+    def _refresh_loop(self, stop_event: threading.Event):
+        while not stop_event.wait(self.refresh_interval):
+            self.sync()
+
+    def _sample(self) -> Optional[Tuple[float, float, int]]:
+        if self.session is None:
+            import requests
+            self.session = requests.Session()
+        try:
+            t0 = self.clock() * 1000
+            response = self.session.get(self.url, timeout=self.timeout)
+            t1 = self.clock() * 1000
+            server_ms = self.parse_server_time(response.json()["data"])
+        except Exception:
+            return None
+        return t0, t1, server_ms
+
+    @staticmethod
+    def parse_server_time(data) -> int:
+        """
+        解析服务器时间字段
+
+        :param data: 接口data字段（"%Y-%m-%d %H:%M:%S"字符串、秒级整数或含now的字典）
+        :return: 整秒对应的毫秒时间戳
+        """
+        if isinstance(data, dict):
+            data = data["now"]
+        if isinstance(data, (int, float)):
+            return int(data) * 1000
+        return int(datetime.strptime(data, "%Y-%m-%d %H:%M:%S").timestamp()) * 1000
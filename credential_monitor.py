@@ -0,0 +1,182 @@
+# credential_monitor.py
+"""
+账号凭证巡检
+
+后台线程定期请求 /nav 检查各账号的登录状态；发送线程遇到 -101 / 412 时也可以
+直接上报。凭证失效或风控期间暂停该账号的发送，巡检确认恢复后自动继续。
+"""
+import threading
+from typing import Callable, Dict, Optional, Tuple
+
+NAV_URL = "https://api.bilibili.com/x/web-interface/nav"
+
+ACTIVE = "active"
+EXPIRED = "expired"   # SESSDATA失效（-101 / isLogin=false）
+RISK = "risk"         # 风控（412 / -412 / -352）
+
+RISK_CODES = {-412, -352}
+
+
+class CredentialMonitor:
+    """
+    账号凭证后台巡检
+    功能：
+    - 后台线程定期用共享连接请求 /nav，检查每个账号的登录状态
+    - 凭证失效或触发风控时暂停该账号，恢复后自动放行
+    - 发送线程通过 is_active() / wait_active() 判断是否可以发送
+
+    网络错误不改变账号状态，避免断网时误暂停。
+    """
+
+    def __init__(self, session=None, url: str = NAV_URL, interval: float = 300,
+                 timeout: float = 5, metrics=None,
+                 on_change: Callable[[str, str, str], None] = None):
+        """
+        初始化巡检
+
+        :param session: requests会话对象，为空时自动创建（所有账号共用一个连接池）
+        :param url: /nav 接口地址
+        :param interval: 巡检间隔（秒）
+        :param timeout: 单次请求超时（秒）
+        :param metrics: 指标集合（metrics_exporter.RestoreMetrics），为空时不记录
+        :param on_change: 状态变化回调 (账号标识, 新状态, 说明)
+        """
+        self.session = session
+        self.url = url
+        self.interval = interval
+        self.timeout = timeout
+        self.metrics = metrics
+        self.on_change = on_change
+        self._accounts: Dict[str, dict] = {}     # 账号标识 -> Cookie
+        self._states: Dict[str, str] = {}
+        self._events: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def add_account(self, account: str, cookies: dict) -> None:
+        """
+        注册或更新账号凭证（更新后下一轮巡检即可恢复）
+
+        :param account: 账号标识（circuit_breaker.account_key）
+        :param cookies: 包含 SESSDATA / bili_jct / buvid3 的字典
+        """
+        with self._lock:
+            self._accounts[account] = dict(cookies)
+            if account not in self._events:
+                event = threading.Event()
+                event.set()
+                self._events[account] = event
+                self._states[account] = ACTIVE
+        self._wake.set()
+
+    def state(self, account: str) -> str:
+        with self._lock:
+            return self._states.get(account, ACTIVE)
+
+    def is_active(self, account: str) -> bool:
+        with self._lock:
+            event = self._events.get(account)
+        return event is None or event.is_set()
+
+    def wait_active(self, account: str, timeout: Optional[float] = None) -> bool:
+        """
+        等待账号恢复
+
+        :return: 超时前是否已恢复
+        """
+        with self._lock:
+            event = self._events.get(account)
+        return event is None or event.wait(timeout)
+
+    def report(self, account: str, state: str, message: str = "") -> None:
+        """
+        由发送线程上报账号异常（如收到 -101），立即暂停并提前巡检
+
+        :param account: 账号标识
+        :param state: EXPIRED 或 RISK
+        :param message: 说明
+        """
+        self._set_state(account, state, message)
+        self._wake.set()
+
+    def probe(self, account: str) -> Optional[Tuple[str, str]]:
+        """
+        检查单个账号
+
+        :return: (状态, 说明)；网络错误时返回None
+        """
+        with self._lock:
+            cookies = self._accounts.get(account)
+        if cookies is None:
+            return None
+        if self.session is None:
+            import requests
+            self.session = requests.Session()
+        try:
+            response = self.session.get(self.url, cookies=cookies, timeout=self.timeout)
+            if response.status_code == 412:
+                return RISK, "请求被拦截(412)"
+            data = response.json()
+        except Exception:
+            return None
+        finally:
+            # 共享会话不保留任何账号的Cookie
+            self.session.cookies.clear()
+        code = data.get("code")
+        if code in RISK_CODES:
+            return RISK, data.get("message", "触发风控")
+        if code == -101 or not (data.get("data") or {}).get("isLogin", code == 0):
+            return EXPIRED, data.get("message", "账号未登录")
+        if code != 0:
+            return None
+        return ACTIVE, ""
+
+    def probe_all(self) -> None:
+        with self._lock:
+            accounts = list(self._accounts)
+        for account in accounts:
+            result = self.probe(account)
+            if result:
+                self._set_state(account, *result)
+
+    def start(self) -> None:
+        """立即巡检一次并启动后台线程"""
+        self.probe_all()
+        if self._thread and self._thread.is_alive() and not self._stop_event.is_set():
+            return
+        # 刚停止的线程可能还没退出：新线程使用新的停止事件，不受旧线程影响
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(self._stop_event,), daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self._wake.set()
+
+    def _run(self, stop_event: threading.Event):
+        while not stop_event.is_set():
+            # 有账号暂停时缩短巡检间隔，尽快恢复
+            with self._lock:
+                paused = any(s != ACTIVE for s in self._states.values())
+            self._wake.wait(min(self.interval, 30) if paused else self.interval)
+            self._wake.clear()
+            if not stop_event.is_set():
+                self.probe_all()
+
+    def _set_state(self, account: str, state: str, message: str) -> None:
+        with self._lock:
+            if account not in self._events:
+                return
+            changed = self._states.get(account) != state
+            self._states[account] = state
+            event = self._events[account]
+        if state == ACTIVE:
+            event.set()
+        else:
+            event.clear()
+        if self.metrics is not None:
+            self.metrics.account_health.set(1 if state == ACTIVE else 0, account)
+        if changed and self.on_change:
+            self.on_change(account, state, message)
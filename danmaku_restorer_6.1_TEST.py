@@ -1,19 +1,41 @@
+import os
 import sys
-import random
 import time
 import json
-import requests
-import xml.etree.ElementTree as ET
-from collections import defaultdict
+from bisect import bisect_right
+from collections import Counter, defaultdict
 from pathlib import Path
 from hashlib import md5
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QVBoxLayout, QHBoxLayout, QWidget, QLabel, QLineEdit,
     QPushButton, QComboBox, QCheckBox, QTextEdit, QFileDialog, QProgressBar, QMessageBox,
-    QTableWidget, QTableWidgetItem, QHeaderView, QTabWidget, QDialog, QAction, QMenuBar
+    QTableWidget, QTableWidgetItem, QHeaderView, QTabWidget, QDialog, QAction,
+    QInputDialog, QTableView
 )
-from PyQt5.QtCore import Qt, QThread, pyqtSignal
-from PyQt5.QtGui import QPainter, QFont
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QThread, QTimer, pyqtSignal
+from PyQt5.QtGui import QFont
+from clock_sync import ServerClock
+from instrument import Instrumentation
+from metrics_exporter import RestoreMetrics, start_from_env
+from dm_control import EngineClient, describe, list_sessions
+from dm_engine import STOP, EngineProcess, SendJob
+from dead_letter import DeadLetterStore
+from run_history import RunHistory
+from circuit_breaker import BreakerRegistry, account_key
+from credential_monitor import CredentialMonitor
+from word_filter import FLAG, REWRITE, WordFilter
+from dm_dedup import DedupConfig, dedup
+from dm_priority import STRATEGIES, prioritize
+from dm_scan import ScanReport
+from dm_warmup import warm_up
+from dm_store import (MODE_GROUP_NAMES, MODE_GROUPS, format_time, iter_chunks, iter_shards,
+                      parse_time)
+
+# 接口地址（可通过环境变量指向本地模拟服务器）
+API_BASE = os.environ.get("BILI_API_BASE", "https://api.bilibili.com")
+
+# 窗口显示后在后台预先导入（获取分P、发送、多进程解析、指标端点、耗时预估时才用到）
+WARM_MODULES = ("requests", "concurrent.futures.process", "http.server", "dm_planner")
 
 class RestoreThread(QThread):
     update_progress = pyqtSignal(int, int)  # (current, total)
@@ -23,81 +45,128 @@ class RestoreThread(QThread):
     def __init__(self, config):
         super().__init__()
         self.config = config
-        self._is_running = True
-        self.success_count = 0
+        self.job = SendJob(config, on_progress=self.update_progress.emit, on_log=self.log_message.emit)
+
+    def run(self):
+        self.finished.emit(self.job.run())
+
+    def stop(self):
+        self.job.stop()
+
+class AttachThread(QThread):
+    """连接到后台运行的任务（只接收事件，断开不影响任务）"""
+    update_progress = pyqtSignal(int, int)  # (current, total)
+    log_message = pyqtSignal(str, bool)     # (message, is_error)
+    finished = pyqtSignal(bool)             # 任务结束 (success)
+    disconnected = pyqtSignal(str)          # 连接断开 (原因)
+
+    def __init__(self, session):
+        super().__init__()
+        self.client = EngineClient(session)
+        self._detached = False
 
     def run(self):
-        success = False
         try:
-            total = len(self.config['danmaku_list'])
-            self.log_message.emit(f"开始处理 {total} 条弹幕", False)
-            
-            for idx, dm in enumerate(self.config['danmaku_list']):
-                if not self._is_running:
-                    break
-                
-                # 断点续传检查
-                if str(idx) in self.config['sent_history']:
-                    self.update_progress.emit(idx + 1, total)
-                    continue
-                
-                if self._send_danmaku_with_retry(dm, idx):
-                    self.success_count += 1
-                    self.config['sent_history'].add(str(idx))
-                    self.config['save_checkpoint'](idx)
-                
-                self.update_progress.emit(idx + 1, total)
-                time.sleep(self._calculate_delay(idx))
-            
-            success = self.success_count > 0
-            self.log_message.emit(f"完成 {self.success_count}/{total} 条", not success)
+            for kind, data in self.client.events():
+                if kind == "state":
+                    self.update_progress.emit(data.get("done", 0), max(data.get("total", 0), 1))
+                elif kind == "log":
+                    self.log_message.emit(*data)
+                elif kind == "finished":
+                    self.finished.emit(bool(data))
+                    return
+            self.disconnected.emit("已断开" if self._detached else "后台任务已退出")
+        except (OSError, ValueError) as e:
+            self.disconnected.emit(f"连接中断: {str(e)}")
+
+    def stop(self):
+        self._detached = True
+        self.client.close()
+
+
+class LoadThread(QThread):
+    """后台加载弹幕文件：逐块解析，边加载边显示预览和统计（选择其他文件时取消）"""
+    chunk_loaded = pyqtSignal(object, object, int, int)  # (DanmakuStore, 模式计数, 已处理字节, 总字节)
+    load_finished = pyqtSignal(object, float)            # (ScanReport, 耗时秒)
+    load_failed = pyqtSignal(str)
+
+    def __init__(self, path, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self._cancelled = False
+
+    def run(self):
+        report = ScanReport()
+        start = time.perf_counter()
+        try:
+            # 小块解析：正则匹配期间持有GIL，块越小界面线程等待越短
+            for store, done, total in iter_chunks(self.path, report, chunk=1 << 18):
+                if self._cancelled:
+                    return
+                # 与 _parse_danmaku 一致：空内容的弹幕不计入统计
+                counter = Counter(mode for mode, content in zip(store.mode, store.content) if content)
+                self.chunk_loaded.emit(store, counter, done, total)
         except Exception as e:
-            self.log_message.emit(f"线程错误: {str(e)}", True)
-        finally:
-            self.finished.emit(success)
+            if not self._cancelled:
+                self.load_failed.emit(str(e))
+            return
+        if not self._cancelled:
+            self.load_finished.emit(report, time.perf_counter() - start)
 
-    def _send_danmaku_with_retry(self, dm, idx):
-        for attempt in range(self.config['retry_limit']):
-            try:
-                if self.config['simulate_mode']:
-                    self.log_message.emit(f"[模拟] {dm['content']}", False)
-                    return True
-                
-                response = requests.post(
-                    self.config['api_url'],
-                    headers=self.config['headers'],
-                    data={
-                        "oid": self.config['oid'],
-                        "type": 1,
-                        "mode": dm["mode"],
-                        "fontsize": dm["font_size"],
-                        "color": dm["color"],
-                        "message": dm["content"],
-                        "csrf": self.config['csrf'],
-                        "timestamp": int(time.time()*1000)
-                    },
-                    timeout=15
-                )
-                
-                if response.status_code == 412:
-                    raise Exception("请求被拦截(412)")
-                
-                if response.json().get("code") == 0:
-                    return True
-                else:
-                    raise Exception(response.json().get("message", "未知错误"))
-            except Exception as e:
-                delay = 2 ** attempt
-                self.log_message.emit(f"弹幕#{idx} 尝试 {attempt+1}/{self.config['retry_limit']} 失败: {str(e)}，{delay}秒后重试", True)
-                time.sleep(delay)
-        return False
+    def cancel(self):
+        self._cancelled = True
 
-    def _calculate_delay(self, idx):
-        base_delay = self.config['min_delay']
-        return base_delay * (1 + (idx % 3)/2) + random.uniform(0, 0.3)
 
-    def stop(self):
-        self._is_running = False
+class DanmakuTableModel(QAbstractTableModel):
+    """
+    预览表格模型：直接引用逐块加载的列式存储，表格只取可见行，条数不受限制
+    """
+    HEADERS = ("时间", "内容", "类型")
+
+    def __init__(self, type_name, parent=None):
+        super().__init__(parent)
+        self.type_name = type_name
+        self.stores = []
+        self.offsets = []  # 每块的起始行号
+        self.total = 0
+
+    def clear(self):
+        self.beginResetModel()
+        self.stores, self.offsets, self.total = [], [], 0
+        self.endResetModel()
+
+    def append(self, store):
+        if not len(store):
+            return
+        self.beginInsertRows(QModelIndex(), self.total, self.total + len(store) - 1)
+        self.stores.append(store)
+        self.offsets.append(self.total)
+        self.total += len(store)
+        self.endInsertRows()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.total
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+        k = bisect_right(self.offsets, index.row()) - 1
+        store, i = self.stores[k], index.row() - self.offsets[k]
+        column = index.column()
+        if column == 0:
+            return f"{store.time[i]:.1f}s"
+        if column == 1:
+            return store.content[i][:50]
+        return self.type_name(store.mode[i])
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return None
+
 
 class BiliDanmakuRestorer(QMainWindow):
     def __init__(self):
@@ -105,14 +174,32 @@ class BiliDanmakuRestorer(QMainWindow):
         self.setWindowTitle("B站弹幕补档工具 v6.1")
         self.setGeometry(100, 100, 1280, 800)
         self.checkpoint_file = Path.home() / ".bili_dm_checkpoint.json"
+        self.profile_file = Path.home() / ".bili_dm_profile.json"
+        self.instrument = Instrumentation()
+        self.metrics = RestoreMetrics()
+        self.metrics_server = start_from_env(self.metrics)
+        self.dead_letters = DeadLetterStore()
+        self.run_history = RunHistory()
+        self.plan = None  # 最近一次完成时间预估（dm_planner.Plan）
+        self.progress_origin = None  # 本次任务首次进度 (时间, 已完成)，用于估计剩余时间
+        self.dedup_config = DedupConfig()
+        self.breakers = BreakerRegistry(metrics=self.metrics)
+        self.credential_monitor = CredentialMonitor(url=f"{API_BASE}/x/web-interface/nav",
+                                                    metrics=self.metrics)
         self._init_ui()
         self._apply_stylesheet()
         self._setup_menu()
         
         # 初始化状态
         self.xml_path = ""
+        self.loader = None
+        self.loaded = None  # (路径, 文件大小, 修改时间, 扫描报告)：后台加载完成的文件，开始任务时直接复用
         self.current_cid = ""
         self.worker_thread = None
+        self.engine = None
+        self.attached = None
+        self.engine_timer = QTimer(self)
+        self.engine_timer.timeout.connect(self._poll_engine)
         self.min_delay = 1.5
         self.retry_limit = 3
         self.sent_history = set()
@@ -191,11 +278,62 @@ class BiliDanmakuRestorer(QMainWindow):
         # 选项
         self.check_simulate = QCheckBox("模拟模式（不实际发送）")
         self.check_resume = QCheckBox("启用断点续传")
+        self.check_profile = QCheckBox("性能统计（分阶段计时）")
+        self.check_dedup = QCheckBox("折叠重复弹幕（5秒内相同内容只发一条）")
+        self.check_engine = QCheckBox("独立进程运行（界面卡顿或崩溃不影响任务）")
+        # 选区（留空表示全部）
+        self.input_select_start = QLineEdit()
+        self.input_select_start.setPlaceholderText("起始时间，如 12:00")
+        self.input_select_end = QLineEdit()
+        self.input_select_end.setPlaceholderText("结束时间，如 18:30")
+        self.combo_select_mode = QComboBox()
+        self.combo_select_mode.addItem("全部模式", None)
+        for key, name in MODE_GROUP_NAMES.items():
+            self.combo_select_mode.addItem(name, key)
+        self.combo_select_pool = QComboBox()
+        self.combo_select_pool.addItem("全部弹幕池", None)
+        for pool in (0, 1, 2):
+            self.combo_select_pool.addItem(f"弹幕池 {pool}", pool)
+        select_row = QHBoxLayout()
+        for widget in (self.input_select_start, self.input_select_end,
+                       self.combo_select_mode, self.combo_select_pool):
+            select_row.addWidget(widget)
+        
+        self.combo_order = QComboBox()
+        for strategy, label in STRATEGIES.items():
+            self.combo_order.addItem(label, strategy)
+        self.combo_prefilter = QComboBox()
+        self.combo_prefilter.addItem("关闭", None)
+        self.combo_prefilter.addItem("跳过命中弹幕", FLAG)
+        self.combo_prefilter.addItem("命中词替换为*", REWRITE)
         
         layout.addWidget(self.btn_fetch)
         layout.addWidget(self.btn_xml)
         layout.addWidget(self.check_simulate)
         layout.addWidget(self.check_resume)
+        layout.addWidget(self.check_profile)
+        layout.addWidget(self.check_dedup)
+        layout.addWidget(self.check_engine)
+        layout.addWidget(QLabel("选区（时间段 / 模式 / 弹幕池）:"))
+        layout.addLayout(select_row)
+        layout.addWidget(QLabel("发送顺序:"))
+        layout.addWidget(self.combo_order)
+        layout.addWidget(QLabel("敏感词预筛:"))
+        layout.addWidget(self.combo_prefilter)
+        
+        # 完成时间预估（按任务历史和当前选区、发送间隔）
+        self.input_deadline = QLineEdit()
+        self.input_deadline.setPlaceholderText("截止时长（小时，可选）")
+        self.btn_plan = QPushButton("⏱ 预估耗时")
+        self.btn_plan.clicked.connect(self._show_plan)
+        plan_row = QHBoxLayout()
+        plan_row.addWidget(self.input_deadline)
+        plan_row.addWidget(self.btn_plan)
+        self.lbl_plan = QLabel("加载弹幕文件后显示预计耗时")
+        self.lbl_plan.setWordWrap(True)
+        layout.addWidget(QLabel("完成时间预估:"))
+        layout.addLayout(plan_row)
+        layout.addWidget(self.lbl_plan)
         tab.setLayout(layout)
         self.tab_widget.addTab(tab, "⚙ 配置")
 
@@ -203,11 +341,12 @@ class BiliDanmakuRestorer(QMainWindow):
         tab = QWidget()
         layout = QVBoxLayout()
         
-        # 弹幕表格
-        self.table_danmaku = QTableWidget()
-        self.table_danmaku.setColumnCount(3)
-        self.table_danmaku.setHorizontalHeaderLabels(["时间", "内容", "类型"])
+        # 弹幕表格（模型按需取可见行，大文件加载中也可滚动）
+        self.preview_model = DanmakuTableModel(self._get_danmaku_type, self)
+        self.table_danmaku = QTableView()
+        self.table_danmaku.setModel(self.preview_model)
         self.table_danmaku.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
+        self.table_danmaku.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
         
         # 统计面板
         self.table_stats = QTableWidget()
@@ -231,6 +370,18 @@ class BiliDanmakuRestorer(QMainWindow):
         resume_action.triggered.connect(self._show_resume_manager)
         file_menu.addAction(resume_action)
         
+        attach_action = QAction("连接后台任务", self)
+        attach_action.triggered.connect(self._attach_engine)
+        file_menu.addAction(attach_action)
+        
+        detach_action = QAction("断开后台任务", self)
+        detach_action.triggered.connect(self._detach_engine)
+        file_menu.addAction(detach_action)
+        
+        debug_action = QAction("调试面板", self)
+        debug_action.triggered.connect(self._show_debug_panel)
+        file_menu.addAction(debug_action)
+        
         about_action = QAction("关于", self)
         about_action.triggered.connect(self._show_about)
         file_menu.addAction(about_action)
@@ -252,7 +403,6 @@ class BiliDanmakuRestorer(QMainWindow):
         if path:
             self.xml_path = path
             self._load_preview()
-            self._log(f"已加载弹幕文件: {Path(path).name}")
 
     def _fetch_parts(self):
         bvid = self.input_目标bv号.text().strip()
@@ -261,9 +411,10 @@ class BiliDanmakuRestorer(QMainWindow):
             return
         
         try:
+            import requests
             headers = self._build_headers()
             response = requests.get(
-                f"https://api.bilibili.com/x/web-interface/view?bvid={bvid}",
+                f"{API_BASE}/x/web-interface/view?bvid={bvid}",
                 headers=headers,
                 timeout=10
             )
@@ -280,8 +431,13 @@ class BiliDanmakuRestorer(QMainWindow):
         except Exception as e:
             self._log(f"获取分P失败: {str(e)}", True)
 
+    def _is_restoring(self):
+        return bool(self.worker_thread and self.worker_thread.isRunning()) or \
+            bool(self.engine and self.engine.finished is None) or \
+            bool(self.attached and self.attached.isRunning())
+
     def _toggle_restore(self):
-        if self.worker_thread and self.worker_thread.isRunning():
+        if self._is_restoring():
             self._stop_restore()
         else:
             self._start_restore()
@@ -299,19 +455,71 @@ class BiliDanmakuRestorer(QMainWindow):
                 self.sent_history = set()
                 self._clean_checkpoint()
             
+            self.instrument = Instrumentation(enabled=self.check_profile.isChecked())
+            self.credential_monitor.add_account(account_key(self.input_sessdata.text()), {
+                "SESSDATA": self.input_sessdata.text(),
+                "bili_jct": self.input_bili_jct.text(),
+                "buvid3": self.input_buvid3.text()
+            })
+            # 时间段/模式/弹幕池选区（在已解析的列式存储上二分查找，只转换选中的行）
+            selection = self._get_selection()
+            if all(v is None for v in selection.values()):
+                selection = None
+            danmaku_list, total = self._parse_danmaku(selection)
+            if self.scan_report.damaged or self.scan_report.repaired or self.scan_report.clamped:
+                self._log(self.scan_report.summary())
+            if selection is not None:
+                self._log(f"选区：{len(danmaku_list)}/{total} 条")
+            
+            # 折叠重复/刷屏弹幕（相同设置下两次运行的序号一致，断点续传不受影响）
+            if self.check_dedup.isChecked():
+                with self.instrument.stage("validate"):
+                    result = dedup(danmaku_list, self.dedup_config)
+                danmaku_list = result.kept
+                if result.dropped:
+                    self.metrics.skipped.inc("duplicate", amount=result.dropped)
+                    result.write_report()
+                    self._log(result.summary())
+            
+            # 发送顺序（配额中途用尽时，已补的是价值最高的部分）
+            danmaku_list = prioritize(danmaku_list, self.combo_order.currentData())
+            
+            # 敏感词预筛（用户词表 + 历史被拒内容），每次任务重新加载词表
+            word_filter = WordFilter.from_files()
+            action = self.combo_prefilter.currentData()
+            if action:
+                with self.instrument.stage("validate"):
+                    flagged = word_filter.screen(danmaku_list, action)
+                if flagged:
+                    self._log(f"敏感词预筛：{flagged} 条命中（{self.combo_prefilter.currentText()}）")
+            
             config = {
-                'danmaku_list': self._parse_danmaku(),
+                'danmaku_list': danmaku_list,
                 'headers': self._build_headers(),
                 'oid': self.combo_parts.currentData(),
                 'csrf': self.input_bili_jct.text(),
                 'min_delay': self.min_delay,
                 'retry_limit': self.retry_limit,
-                'api_url': "https://api.bilibili.com/x/v2/dm/post",
+                'api_url': f"{API_BASE}/x/v2/dm/post",
                 'simulate_mode': self.check_simulate.isChecked(),
+                'server_clock': ServerClock(url=f"{API_BASE}/x/server/date"),
+                'instrument': self.instrument,
+                'metrics': self.metrics,
                 'sent_history': self.sent_history,
-                'save_checkpoint': self._save_checkpoint
+                'dead_letters': self.dead_letters,
+                'breakers': self.breakers,
+                'account': account_key(self.input_sessdata.text()),
+                'credential_monitor': self.credential_monitor,
+                'word_filter': word_filter,
+                'save_checkpoint': self._save_checkpoint,
+                'history': self.run_history
             }
             
+            if self.check_engine.isChecked():
+                self._start_engine(config)
+                return
+            
+            self.progress_origin = None
             self.worker_thread = RestoreThread(config)
             self.worker_thread.update_progress.connect(self._update_progress)
             self.worker_thread.log_message.connect(self._log)
@@ -324,7 +532,95 @@ class BiliDanmakuRestorer(QMainWindow):
         except Exception as e:
             self._log(f"启动失败: {str(e)}", True)
 
+    def _start_engine(self, config):
+        """在独立进程中运行任务：进度从共享内存读取，日志和完成事件由定时器收取"""
+        spec = {key: config[key] for key in ('danmaku_list', 'headers', 'oid', 'csrf', 'min_delay',
+                                             'retry_limit', 'api_url', 'simulate_mode', 'account')}
+        spec.update({
+            'cookies': {
+                "SESSDATA": self.input_sessdata.text(),
+                "bili_jct": self.input_bili_jct.text(),
+                "buvid3": self.input_buvid3.text()
+            },
+            'clock_url': f"{API_BASE}/x/server/date",
+            'nav_url': f"{API_BASE}/x/web-interface/nav",
+            'sent_history': list(self.sent_history),
+            'checkpoint_file': str(self.checkpoint_file),
+            'bvid': self.input_目标bv号.text(),
+            'page': self.combo_parts.currentIndex() + 1,
+            'dead_letter_path': str(self.dead_letters.path),
+            'profile': self.instrument.enabled,
+            'profile_path': str(self.profile_file.with_suffix(".engine.json")),
+            'history_path': str(self.run_history.path)
+        })
+        self.progress_origin = None
+        self.engine = EngineProcess(spec).start()
+        self._engine_seq = 0
+        self.engine_timer.start(16)
+        self.btn_start.setText("⏹ 停止")
+        self.btn_start.setStyleSheet("background-color: #ff4444;")
+        self._log(f"任务已在独立进程中启动 (pid={self.engine.process.pid})")
+
+    def _poll_engine(self):
+        """按界面刷新率读取引擎进度（共享内存，不阻塞）并处理事件"""
+        seq = self.engine.ring.seq()
+        if seq != self._engine_seq:
+            self._engine_seq = seq
+            _, done, total, *_ = self.engine.progress()
+            self._update_progress(done, total)
+        for kind, *args in self.engine.poll_events():
+            if kind == "log":
+                self._log(*args)
+            elif kind == "finished":
+                self.engine_timer.stop()
+                self._on_restore_finished(args[0])
+
+    def _attach_engine(self):
+        """连接到后台运行中的任务（本窗口或其他窗口启动、界面已关闭的任务均可）"""
+        if self._is_restoring():
+            QMessageBox.information(self, "提示", "当前已有任务在运行")
+            return
+        sessions = list_sessions()
+        if not sessions:
+            QMessageBox.information(self, "提示", "没有运行中的后台任务")
+            return
+        labels = [describe(session) for session in sessions]
+        label, ok = QInputDialog.getItem(self, "连接后台任务", "选择任务:", labels, 0, False)
+        if not ok:
+            return
+        session = sessions[labels.index(label)]
+        self.progress_origin = None
+        self.attached = AttachThread(session)
+        self.attached.update_progress.connect(self._update_progress)
+        self.attached.log_message.connect(self._log)
+        self.attached.finished.connect(self._on_restore_finished)
+        self.attached.disconnected.connect(self._on_detached)
+        self.attached.start()
+        self.btn_start.setText("⏹ 停止")
+        self.btn_start.setStyleSheet("background-color: #ff4444;")
+        self._log(f"已连接后台任务 pid={session['pid']}（断开不影响任务）")
+
+    def _detach_engine(self):
+        if self.attached and self.attached.isRunning():
+            self.attached.stop()
+
+    def _on_detached(self, reason):
+        self.btn_start.setText("▶ 开始")
+        self.btn_start.setStyleSheet("")
+        self._log(f"后台任务连接：{reason}")
+
     def _stop_restore(self):
+        if self.attached and self.attached.isRunning():
+            try:
+                self.attached.client.command(STOP)
+                self._log("已通知后台任务停止，当前弹幕处理完后退出")
+            except OSError as e:
+                self._log(f"停止后台任务失败: {str(e)}", True)
+            return
+        if self.engine and self.engine.finished is None:
+            self.engine.stop()
+            self._log("已通知引擎进程停止，当前弹幕处理完后退出")
+            return
         if self.worker_thread:
             self.worker_thread.stop()
             self.worker_thread.quit()
@@ -332,32 +628,52 @@ class BiliDanmakuRestorer(QMainWindow):
             self.btn_start.setStyleSheet("")
             self._log("操作已中止")
 
-    def _parse_danmaku(self):
+    def _parse_danmaku(self, selection=None):
+        """
+        解析弹幕文件
+
+        :param selection: DanmakuStore.select 参数，为空时返回全部
+        :return: (选区内的弹幕列表, 文件中的有效弹幕数)
+        """
         if not self.xml_path:
             raise Exception("未选择弹幕文件")
         
         danmaku_list = []
         type_counter = defaultdict(int)
         
-        for event, elem in ET.iterparse(self.xml_path, events=('end',)):
-            if elem.tag == 'd':
-                try:
-                    params = elem.attrib['p'].split(',')
-                    dm = {
-                        "time": float(params[0]),
-                        "mode": int(params[1]),
-                        "font_size": int(params[2]),
-                        "color": int(params[3]),
-                        "content": elem.text.strip()[:100]
-                    }
+        # 内存映射快速解析到列式存储（大文件按字节范围分片多进程解析，逐片转换后释放）；
+        # 非常规写法的片段容错扫描，损坏的字节段跳过并报告
+        # 后台加载已完成时直接复用预览中的存储，不再重新解析
+        stores = self._loaded_stores()
+        report = self.loaded[3] if stores is not None else ScanReport()
+        with self.instrument.stage("parse"):
+            for store in stores if stores is not None else iter_shards(self.xml_path, report=report):
+                # 统计整份文件，只转换选区内的行
+                for mode, content in zip(store.mode, store.content):
+                    if content:
+                        type_counter[mode] += 1
+                rows = store.select(**selection) if selection is not None else None
+                for dm in store.to_dicts(rows):
+                    if not dm["content"]:
+                        continue
+                    dm["content"] = dm["content"][:100]
                     danmaku_list.append(dm)
-                    type_counter[dm['mode']] += 1
-                    elem.clear()
-                except Exception as e:
-                    continue
+        self.scan_report = report
         
-        self._update_stats(type_counter, len(danmaku_list))
-        return danmaku_list
+        total = sum(type_counter.values())
+        self._update_stats(type_counter, total)
+        return danmaku_list, total
+
+    def _get_selection(self):
+        """读取选区输入，返回 DanmakuStore.select 参数（时间格式错误时抛出ValueError）"""
+        mode = self.combo_select_mode.currentData()
+        pool = self.combo_select_pool.currentData()
+        return {
+            'start': parse_time(self.input_select_start.text()),
+            'end': parse_time(self.input_select_end.text()),
+            'modes': MODE_GROUPS[mode] if mode else None,
+            'pools': {pool} if pool is not None else None
+        }
 
     def _update_stats(self, counter, total):
         self.table_stats.setRowCount(0)
@@ -400,8 +716,9 @@ class BiliDanmakuRestorer(QMainWindow):
 
     def _network_check(self):
         try:
+            import requests
             response = requests.get(
-                "https://api.bilibili.com/x/web-interface/nav",
+                f"{API_BASE}/x/web-interface/nav",
                 headers=self._build_headers(),
                 timeout=10
             )
@@ -418,31 +735,137 @@ class BiliDanmakuRestorer(QMainWindow):
             self._log(f"网络检测失败: {str(e)}", True)
 
     def _load_preview(self):
-        self.table_danmaku.setRowCount(0)
+        """在后台线程加载当前文件，逐块刷新预览和统计（正在加载的旧文件先取消）"""
+        self._cancel_loading()
+        self.loaded = None
+        self.preview_model.clear()
+        self.table_stats.setRowCount(0)
+        self.load_counter = Counter()
+        self.load_count = 0
+        
+        # 以窗口为父对象：取消后线程跑完当前块再自行销毁
+        loader = LoadThread(self.xml_path, self)
+        loader.finished.connect(loader.deleteLater)
+        # 取消后已排队的信号仍可能送达，按线程对象过滤
+        loader.chunk_loaded.connect(lambda *args: self._on_chunk_loaded(loader, *args))
+        loader.load_finished.connect(lambda *args: self._on_load_finished(loader, *args))
+        loader.load_failed.connect(lambda *args: self._on_load_failed(loader, *args))
+        self.loader = loader
+        loader.start()
+        self.statusBar().showMessage(f"正在加载 {Path(self.xml_path).name} …")
+
+    def _cancel_loading(self):
+        if self.loader and self.loader.isRunning():
+            self.loader.cancel()
+        self.loader = None
+
+    def _on_chunk_loaded(self, loader, store, counter, done, total):
+        if loader is not self.loader:
+            return
+        self.preview_model.append(store)
+        self.load_counter.update(counter)
+        self.load_count += sum(counter.values())
+        if self.load_count:
+            self._update_stats(self.load_counter, self.load_count)
+        progress = f"{done / total:.0%}，" if done and total else ""
+        self.statusBar().showMessage(f"正在加载 {Path(loader.path).name}：{progress}{self.preview_model.total} 条")
+
+    def _on_load_finished(self, loader, report, elapsed):
+        if loader is not self.loader:
+            return
+        self.loader = None
+        stat = os.stat(loader.path)
+        self.loaded = (loader.path, stat.st_size, stat.st_mtime_ns, report)
+        self.table_danmaku.resizeColumnToContents(0)
+        self.statusBar().showMessage(f"已加载 {self.preview_model.total} 条（{elapsed:.1f}秒）", 5000)
+        self._log(f"已加载弹幕文件: {Path(loader.path).name}（{self.load_count} 条有效弹幕）")
+        if report.damaged or report.repaired:
+            self._log(report.summary())
+        self._show_plan()
+
+    def _on_load_failed(self, loader, message):
+        if loader is not self.loader:
+            return
+        self.loader = None
+        self.statusBar().clearMessage()
+        self._log(f"预览加载失败: {message}", True)
+
+    def _loaded_stores(self):
+        """后台加载完成且文件未改动时返回已解析的存储块，否则返回None"""
+        if not self.loaded:
+            return None
+        path, size, mtime_ns, _ = self.loaded
         try:
-            tree = ET.parse(self.xml_path)
-            for idx, elem in enumerate(tree.findall('.//d')):
-                if idx >= 200:  # 限制预览数量
-                    break
-                
-                params = elem.attrib['p'].split(',')
-                self.table_danmaku.insertRow(idx)
-                self.table_danmaku.setItem(idx, 0, QTableWidgetItem(f"{float(params[0]):.1f}s"))
-                self.table_danmaku.setItem(idx, 1, QTableWidgetItem(elem.text.strip()[:50]))
-                self.table_danmaku.setItem(idx, 2, QTableWidgetItem(self._get_danmaku_type(int(params[1]))))
-            
-            self.table_danmaku.resizeColumnsToContents()
-        except Exception as e:
-            self._log(f"预览加载失败: {str(e)}", True)
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if path != self.xml_path or (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns):
+            return None
+        return self.preview_model.stores
+
+    def _selected_count(self):
+        """已加载文件在当前选区内的条数，文件未加载完成时返回None"""
+        stores = self._loaded_stores()
+        if stores is None:
+            return None
+        selection = self._get_selection()
+        if all(v is None for v in selection.values()):
+            return sum(len(store) for store in stores)
+        return sum(len(store.select(**selection)) for store in stores)
+
+    def _show_plan(self):
+        """按任务历史预估当前文件和选区的完成时间，填写截止时长时给出所需账号数"""
+        from dm_planner import Planner
+        try:
+            count = self._selected_count()
+            deadline = self.input_deadline.text().strip()
+            deadline_s = float(deadline) * 3600 if deadline else None
+        except ValueError as e:
+            self._log(f"预估失败: {str(e)}", True)
+            return
+        if count is None:
+            self.lbl_plan.setText("请先选择弹幕文件并等待加载完成")
+            return
+        if not count:
+            self.lbl_plan.setText("选区内没有弹幕")
+            return
+        sessdata = self.input_sessdata.text()
+        try:
+            self.plan = Planner(self.run_history).plan(count, self.min_delay, self.retry_limit,
+                                                       account_key(sessdata) if sessdata else None)
+            text = self.plan.summary(deadline_s)
+        except (OSError, ValueError) as e:
+            self._log(f"预估失败: {str(e)}", True)
+            return
+        self.lbl_plan.setText(text)
+        self._log(text)
 
     def _update_progress(self, current, total):
         self.progress_bar.setMaximum(total)
         self.progress_bar.setValue(current)
-        self.lbl_progress.setText(f"处理中: {current}/{total} ({current/total:.1%})")
+        # 剩余时间：按本次任务的实测速率，开始阶段进度太少时参考预估
+        now = time.monotonic()
+        if self.progress_origin is None or current < self.progress_origin[1]:
+            self.progress_origin = (now, current)
+        started, first = self.progress_origin
+        if current - first >= 5:
+            remaining = (total - current) * (now - started) / (current - first)
+        elif self.plan:
+            remaining = (total - current) * self.plan.per_item_s
+        else:
+            remaining = None
+        eta = f"，剩余约 {format_time(remaining)}" if remaining is not None and current < total else ""
+        self.lbl_progress.setText(f"处理中: {current}/{total} ({current/total:.1%}){eta}")
 
     def _on_restore_finished(self, success):
         self.btn_start.setText("▶ 开始")
         self.btn_start.setStyleSheet("")
+        if self.instrument.enabled:
+            try:
+                self.instrument.export_json(self.profile_file)
+                self._log(f"性能统计已保存: {self.profile_file}")
+            except Exception as e:
+                self._log(f"保存性能统计失败: {str(e)}", True)
         if success:
             QMessageBox.information(self, "完成", "弹幕恢复任务已完成")
         else:
@@ -457,6 +880,7 @@ class BiliDanmakuRestorer(QMainWindow):
                 cache_dir.rmdir()
                 self._log("缓存已清除")
         except Exception as e:
+            self._log(f"清除缓存失败: {str(e)}", True)
 
     def _apply_stylesheet(self):
         self.setStyleSheet("""
@@ -546,6 +970,7 @@ class BiliDanmakuRestorer(QMainWindow):
                 json.dump(data, f, indent=2)
             
             temp_file.replace(self.checkpoint_file)
+            self.metrics.observe_checkpoint(current_index)
         except Exception as e:
             self._log(f"保存进度失败: {str(e)}", True)
 
@@ -633,6 +1058,31 @@ class BiliDanmakuRestorer(QMainWindow):
         dialog.setLayout(layout)
         dialog.exec_()
 
+    def _show_debug_panel(self):
+        """实时显示各阶段耗时（每秒刷新）"""
+        dialog = QDialog(self)
+        dialog.setWindowTitle("调试面板")
+        dialog.resize(560, 360)
+        
+        layout = QVBoxLayout()
+        text = QTextEdit()
+        text.setReadOnly(True)
+        text.setFont(QFont("Consolas", 10))
+        layout.addWidget(text)
+        dialog.setLayout(layout)
+        
+        def refresh():
+            if self.instrument.enabled:
+                text.setPlainText(self.instrument.format_table())
+            else:
+                text.setPlainText("未启用性能统计（在配置页勾选后重新开始任务）")
+        
+        timer = QTimer(dialog)
+        timer.timeout.connect(refresh)
+        timer.start(1000)
+        refresh()
+        dialog.show()
+
     def _clean_checkpoint_and_close(self, dialog):
         self._clean_checkpoint()
         QMessageBox.information(dialog, "成功", "历史进度已清除")
@@ -662,12 +1112,20 @@ if __name__ == "__main__":
     # 初始化窗口
     window = BiliDanmakuRestorer()
     window.show()
+    QTimer.singleShot(0, lambda: warm_up(WARM_MODULES))
     
     # 退出清理
     def cleanup():
+        if window.loader and window.loader.isRunning():
+            window.loader.cancel()
+            window.loader.wait(2000)
         if window.worker_thread and window.worker_thread.isRunning():
             window.worker_thread.stop()
             window.worker_thread.wait(2000)
+        if window.attached and window.attached.isRunning():
+            window.attached.stop()
+            window.attached.wait(2000)
+        # 独立进程中的任务不随界面退出（可通过“文件 > 连接后台任务”或 dm_control.py 重新连接）
     
     app.aboutToQuit.connect(cleanup)
     sys.exit(app.exec_())
@@ -0,0 +1,167 @@
+# dead_letter.py
+"""
+死信存储
+
+因内容或目标问题（敏感词、视频不存在、oid无效）无法发送、或重试次数耗尽的弹幕
+逐行追加到 JSONL 文件，任务结束后可按 oid / 原因筛选，修改内容后导出为XML重新补档。
+
+用法：
+    python dead_letter.py list
+    python dead_letter.py export --oid 123456 --reason filter -o retry.xml
+    python dead_letter.py export --oid 123456 -o retry.xml --remove
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+DEFAULT_PATH = Path.home() / ".bili_dm_dead_letter.jsonl"
+
+
+class DeadLetterStore:
+    """
+    追加写入的死信文件
+    功能：
+    - add() 每条一行JSON，进程崩溃也不会丢失已写入的记录
+    - entries() 按 oid / 原因筛选
+    - take() 取出匹配的记录并从文件中移除，用于批量重发
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    def add(self, dm: dict, oid, code, reason: str, message: str = "") -> None:
+        """
+        写入一条死信
+
+        :param dm: 弹幕字典（time/mode/font_size/color/content/pool_type）
+        :param oid: 目标CID
+        :param code: 错误码
+        :param reason: 原因标识（见 dm_errors）
+        :param message: 说明文字
+        """
+        record = {
+            "oid": str(oid),
+            "code": code,
+            "reason": reason,
+            "message": message,
+            "failed_at": int(time.time()),
+            "dm": dm
+        }
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+    def entries(self, oid=None, reason: Optional[str] = None) -> List[dict]:
+        """
+        读取死信
+
+        :param oid: 只返回该CID的记录
+        :param reason: 只返回该原因的记录
+        """
+        if not self.path.exists():
+            return []
+        with self._lock:
+            records = self._read()
+        return [r for r in records if self._match(r, oid, reason)]
+
+    def take(self, oid=None, reason: Optional[str] = None) -> List[dict]:
+        """
+        取出匹配的死信，其余记录写回文件
+
+        :return: 被取出的记录
+        """
+        if not self.path.exists():
+            return []
+        with self._lock:
+            records = self._read()
+            taken = [r for r in records if self._match(r, oid, reason)]
+            rest = [r for r in records if not self._match(r, oid, reason)]
+            tmp = self.path.with_suffix(".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(r, ensure_ascii=False) + "\n" for r in rest)
+            os.replace(tmp, self.path)
+        return taken
+
+    def summary(self) -> Counter:
+        """(oid, 原因) -> 条数"""
+        return Counter((r["oid"], r["reason"]) for r in self.entries())
+
+    def _read(self) -> List[dict]:
+        records = []
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue  # 写入中断留下的半行
+        return records
+
+    @staticmethod
+    def _match(record, oid, reason) -> bool:
+        return ((oid is None or record["oid"] == str(oid)) and
+                (reason is None or record["reason"] == reason))
+
+
+def write_xml(path, records: Iterable[dict]) -> int:
+    """
+    把死信导出为B站格式XML，可直接作为补档文件载入
+
+    :return: 导出条数
+    """
+    # saxutils 会连带导入 urllib.request，只在导出时加载
+    from xml.sax.saxutils import escape, quoteattr
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?><i>\n')
+        for r in sorted(records, key=lambda r: r["dm"].get("time", 0)):
+            dm = r["dm"]
+            p = (f"{dm.get('time', 0)},{dm.get('mode', 1)},{dm.get('font_size', 25)},"
+                 f"{dm.get('color', 16777215)},{r['failed_at']},{dm.get('pool_type', 0)},0,{count},"
+                 f"{dm.get('weight', 0)}")
+            f.write(f"<d p={quoteattr(p)}>{escape(dm.get('content', ''))}</d>\n")
+            count += 1
+        f.write("</i>\n")
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="死信查看与导出")
+    parser.add_argument("--file", default=str(DEFAULT_PATH), help="死信文件路径")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="按CID和原因汇总")
+    export = sub.add_parser("export", help="导出为XML以便重新补档")
+    export.add_argument("--oid", default=None)
+    export.add_argument("--reason", default=None)
+    export.add_argument("-o", "--output", required=True)
+    export.add_argument("--remove", action="store_true", help="导出后从死信文件中移除")
+    args = parser.parse_args()
+
+    store = DeadLetterStore(args.file)
+    if args.command == "list":
+        summary = store.summary()
+        if not summary:
+            print("没有死信记录")
+        for (oid, reason), count in sorted(summary.items()):
+            print(f"CID {oid:<12} {reason:<14} {count:>6} 条")
+        return
+
+    if args.remove:
+        records = store.take(args.oid, args.reason)
+    else:
+        records = store.entries(args.oid, args.reason)
+    count = write_xml(args.output, records)
+    print(f"已导出 {count} 条到 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
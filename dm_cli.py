@@ -0,0 +1,134 @@
+# dm_cli.py
+"""
+弹幕文件命令行工具
+
+用法：
+    python dm_cli.py stats danmaku.xml
+    python dm_cli.py select danmaku.xml --start 12:00 --end 18:30 --mode scroll --pool 0 -o part.xml
+    python dm_cli.py scan damaged.xml -o repaired.xml
+    python dm_cli.py stats huge.xml -j 0
+    python dm_cli.py plan danmaku.xml --start 12:00 --min-delay 1.5 --deadline 6
+"""
+import argparse
+import sys
+from collections import Counter
+
+from dm_scan import ScanReport
+from dm_store import MODE_GROUP_NAMES, MODE_GROUPS, format_time, load_xml_parallel, parse_time
+
+
+def load_args(parser):
+    parser.add_argument("file")
+    parser.add_argument("-j", "--workers", type=int, default=1,
+                        help="解析进程数（0为CPU核数），大文件按字节范围分片并行解析")
+
+
+def load(args, report: ScanReport = None):
+    return load_xml_parallel(args.file, args.workers or None, report)
+
+
+def selection_args(parser):
+    parser.add_argument("--start", default=None, help="起始时间（HH:MM:SS / MM:SS / 秒）")
+    parser.add_argument("--end", default=None, help="结束时间")
+    parser.add_argument("--mode", action="append", choices=sorted(MODE_GROUPS),
+                        help="弹幕模式，可重复指定")
+    parser.add_argument("--pool", action="append", type=int, help="弹幕池，可重复指定")
+
+
+def selection_from_args(args) -> dict:
+    """命令行参数 -> DanmakuStore.select 参数"""
+    return {
+        "start": parse_time(args.start),
+        "end": parse_time(args.end),
+        "modes": set().union(*(MODE_GROUPS[m] for m in args.mode)) if args.mode else None,
+        "pools": set(args.pool) if args.pool is not None else None
+    }
+
+
+def cmd_stats(args):
+    store = load(args)
+    rows = store.select(**selection_from_args(args))
+    print(f"弹幕 {len(rows)} / {len(store)} 条")
+    if not rows:
+        return
+    times = [store.time[i] for i in rows]
+    print(f"时间范围 {format_time(min(times))} - {format_time(max(times))}")
+    modes = Counter(store.mode[i] for i in rows)
+    for group, members in MODE_GROUPS.items():
+        count = sum(modes[m] for m in members)
+        if count:
+            print(f"  {MODE_GROUP_NAMES[group]:<4} {count:>8} 条")
+    pools = Counter(store.pool[i] for i in rows)
+    for pool, count in sorted(pools.items()):
+        print(f"  弹幕池{pool} {count:>8} 条")
+
+
+def cmd_select(args):
+    store = load(args)
+    rows = store.select(**selection_from_args(args))
+    count = store.write_xml(args.output, rows)
+    print(f"已选出 {count} / {len(store)} 条，写入 {args.output}")
+
+
+def cmd_scan(args):
+    report = ScanReport()
+    store = load(args, report)
+    print(report.summary())
+    for start, end, reason in report.damaged:
+        print(f"  字节 {start}-{end}  {reason}")
+    if args.output:
+        count = store.write_xml(args.output)
+        print(f"已写入 {count} 条到 {args.output}")
+
+
+def cmd_plan(args):
+    from circuit_breaker import account_key
+    from dm_planner import Planner
+    from run_history import RunHistory
+    store = load(args)
+    rows = store.select(**selection_from_args(args))
+    print(f"弹幕 {len(rows)} / {len(store)} 条")
+    if not rows:
+        return
+    account = account_key(args.sessdata) if args.sessdata else None
+    planner = Planner(RunHistory(args.history)) if args.history else Planner()
+    plan = planner.plan(len(rows), args.min_delay, args.retry_limit, account)
+    print(plan.summary(args.deadline * 3600 if args.deadline else None))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="弹幕文件命令行工具")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    stats = sub.add_parser("stats", help="统计选区内的弹幕")
+    load_args(stats)
+    selection_args(stats)
+    stats.set_defaults(func=cmd_stats)
+
+    select = sub.add_parser("select", help="按时间段/模式/弹幕池导出子集XML")
+    load_args(select)
+    selection_args(select)
+    select.add_argument("-o", "--output", required=True)
+    select.set_defaults(func=cmd_select)
+
+    scan = sub.add_parser("scan", help="容错扫描，列出损坏的字节范围，可导出修复后的XML")
+    load_args(scan)
+    scan.add_argument("-o", "--output", default=None)
+    scan.set_defaults(func=cmd_scan)
+
+    plan = sub.add_parser("plan", help="按任务历史预估选区的完成时间和所需账号数")
+    load_args(plan)
+    selection_args(plan)
+    plan.add_argument("--min-delay", type=float, default=1.5, help="发送间隔（秒）")
+    plan.add_argument("--retry-limit", type=int, default=3)
+    plan.add_argument("--deadline", type=float, default=None, help="截止时长（小时），计算所需账号数")
+    plan.add_argument("--sessdata", default=None, help="只参考该账号的历史")
+    plan.add_argument("--history", default=None, help="任务历史文件（默认 ~/.bili_dm_history.jsonl）")
+    plan.set_defaults(func=cmd_plan)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
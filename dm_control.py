@@ -0,0 +1,401 @@
+# dm_control.py
+"""
+补档任务控制端口
+
+引擎进程在 127.0.0.1 上开一个HTTP控制端口，任务信息（端口、令牌）写入
+~/.bili_dm_sessions/<pid>.json。任何界面都可以随时连接、查看、断开，任务不受影响：
+- GET  /state?token=...    当前状态（JSON）
+- GET  /events?token=...   事件流（SSE）：state / log / finished，断线后按 Last-Event-ID 补发日志
+- POST /stop|/pause|/resume?token=...
+- GET  /                   dm.html（浏览器打开 http://127.0.0.1:端口/?token=... 即可查看）
+
+    python dm_control.py list
+    python dm_control.py tail [pid]
+    python dm_control.py stop|pause|resume [pid]
+"""
+import argparse
+import json
+import os
+import secrets
+import socket
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+SESSION_DIR = Path.home() / ".bili_dm_sessions"
+PAGE_PATH = Path(__file__).with_name("dm.html")
+
+HEARTBEAT = 15.0   # SSE 空闲时的心跳间隔（秒），也是断开检测的最长延迟
+
+
+class EventHub:
+    """
+    引擎状态与日志的汇集点（发送线程写入，控制端口的各连接读取）
+
+    日志按序号保留最近 backlog 条，连接时先补发；状态只保留最新一份。
+    """
+
+    def __init__(self, backlog: int = 500):
+        self._cond = threading.Condition()
+        self._events = deque(maxlen=backlog)   # (序号, 类型, 数据)
+        self._seq = 0
+        self._version = 0
+        self.state: dict = {}
+
+    def publish(self, kind: str, data) -> None:
+        with self._cond:
+            self._seq += 1
+            self._events.append((self._seq, kind, data))
+            self._cond.notify_all()
+
+    def update(self, **state) -> None:
+        with self._cond:
+            self.state.update(state)
+            self._version += 1
+            self._cond.notify_all()
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            return dict(self.state)
+
+    def wait(self, since: int, version: int, timeout: float) -> Tuple[List[tuple], Optional[dict], int]:
+        """
+        等待新事件或状态变化
+
+        :param since: 已收到的最后一个事件序号
+        :param version: 已收到的状态版本
+        :return: (新事件, 新状态或None, 当前状态版本)
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > since or self._version != version, timeout)
+            events = [e for e in self._events if e[0] > since]
+            state = dict(self.state) if self._version != version else None
+            return events, state, self._version
+
+
+class ControlServer:
+    """在后台线程提供控制端口"""
+
+    def __init__(self, hub: EventHub, commands: Dict[str, Callable[[], None]],
+                 host: str = "127.0.0.1", port: int = 0, token: str = None):
+        """
+        :param hub: 状态与日志
+        :param commands: 命令名 -> 处理函数（stop / pause / resume）
+        :param port: 0 表示由系统分配
+        :param token: 访问令牌，为空时随机生成
+        """
+        self.hub = hub
+        self.commands = commands
+        self.token = token or secrets.token_urlsafe(16)
+        self._closing = threading.Event()
+        from http.server import ThreadingHTTPServer
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        self.url = f"http://{host}:{self.port}"
+        self.session_path = None
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def start(self, **info) -> "ControlServer":
+        """启动并登记任务（info 为写入任务文件的附加信息，如 bvid / oid）"""
+        self._thread.start()
+        self.session_path = register(dict(info, pid=os.getpid(), port=self.port,
+                                          token=self.token, started=int(time.time())))
+        return self
+
+    def stop(self, grace: float = 1.0) -> None:
+        """注销任务；等待 grace 秒让已连接的界面收到最后的事件"""
+        unregister(self.session_path)
+        self._closing.set()
+        time.sleep(grace)
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _make_handler(self):
+        from http.server import BaseHTTPRequestHandler
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _authorized(self, query):
+                if secrets.compare_digest(query.get("token", [""])[0], server.token):
+                    return True
+                self.send_error(403)
+                return False
+
+            def _send_body(self, body: bytes, content_type: str, status: int = 200):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                query = parse_qs(url.query)
+                if url.path == "/" and PAGE_PATH.exists():
+                    self._send_body(PAGE_PATH.read_bytes(), "text/html; charset=utf-8")
+                elif url.path not in ("/state", "/events"):
+                    self.send_error(404)
+                elif not self._authorized(query):
+                    return
+                elif url.path == "/state":
+                    body = json.dumps(server.hub.snapshot(), ensure_ascii=False).encode("utf-8")
+                    self._send_body(body, "application/json; charset=utf-8")
+                else:
+                    since = self.headers.get("Last-Event-ID") or query.get("since", ["0"])[0]
+                    self._stream(int(since) if since.isdigit() else 0)
+
+            def do_POST(self):
+                url = urlsplit(self.path)
+                handler = server.commands.get(url.path.strip("/"))
+                if handler is None:
+                    self.send_error(404)
+                    return
+                if self._authorized(parse_qs(url.query)):
+                    handler()
+                    self._send_body(b'{"ok": true}', "application/json")
+
+            def _stream(self, since):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+                self.send_header("Cache-Control", "no-cache")
+                self.end_headers()
+                version = -1
+                try:
+                    while not server._closing.is_set():
+                        events, state, version = server.hub.wait(since, version, HEARTBEAT)
+                        chunks = []
+                        if state is not None:
+                            chunks.append(_sse("state", state))
+                        for seq, kind, data in events:
+                            chunks.append(_sse(kind, data, seq))
+                            since = seq
+                        self.wfile.write("".join(chunks).encode("utf-8") if chunks else b": ping\n\n")
+                        self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # 界面已断开，任务继续
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def _sse(kind: str, data, seq: int = None) -> str:
+    head = f"id: {seq}\n" if seq is not None else ""
+    return f"{head}event: {kind}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def register(info: dict) -> Path:
+    SESSION_DIR.mkdir(exist_ok=True)
+    path = SESSION_DIR / f"{info['pid']}.json"
+    temp = path.with_suffix(".tmp")
+    temp.write_text(json.dumps(info, ensure_ascii=False), encoding="utf-8")
+    temp.replace(path)
+    return path
+
+
+def unregister(path: Optional[Path]) -> None:
+    if path is not None:
+        try:
+            path.unlink()
+        except OSError:
+            pass
+
+
+def pid_alive(pid: int) -> bool:
+    """进程是否仍在运行（Windows 上 os.kill 会结束进程，改用 OpenProcess 查询）"""
+    if os.name == "nt":
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)   # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return kernel32.GetLastError() == 5             # 无权限查询说明进程存在
+        code = ctypes.c_ulong()
+        try:
+            return not kernel32.GetExitCodeProcess(handle, ctypes.byref(code)) or code.value == 259  # STILL_ACTIVE
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def list_sessions() -> List[dict]:
+    """
+    正在运行的任务
+
+    进程已退出或控制端口拒绝连接的视为已结束，顺手清理其任务文件；引擎忙碌、响应超时的
+    任务保留并标记 reachable=False（任务文件删除后就再也连不上了，不能因一次超时误删）
+
+    :return: [{pid, port, token, started, bvid, ..., reachable}, ...]，按启动时间排序
+    """
+    sessions = []
+    for path in SESSION_DIR.glob("*.json") if SESSION_DIR.exists() else ():
+        try:
+            info = json.loads(path.read_text(encoding="utf-8"))
+            alive = pid_alive(info["pid"])
+        except OSError:
+            continue   # 暂时无法读取，下次再看
+        except (ValueError, KeyError):
+            alive = False   # 任务文件损坏（登记是原子写入，不会读到写了一半的文件）
+        if not alive:
+            unregister(path)
+            continue
+        try:
+            EngineClient(info).state(timeout=1)
+            info["reachable"] = True
+        except ConnectionRefusedError:
+            unregister(path)
+            continue
+        except (OSError, ValueError):
+            info["reachable"] = False
+        sessions.append(info)
+    return sorted(sessions, key=lambda s: s.get("started", 0))
+
+
+def describe(session: dict) -> str:
+    started = time.strftime("%m-%d %H:%M", time.localtime(session.get("started", 0)))
+    text = f"pid {session['pid']}  {session.get('bvid', '')} P{session.get('page', '?')}  {started} 启动"
+    return text if session.get("reachable", True) else text + "（暂无响应）"
+
+
+class EngineClient:
+    """
+    连接到运行中的任务
+
+        client = EngineClient(list_sessions()[0])
+        for kind, data in client.events():
+            ...
+    """
+
+    def __init__(self, session: dict):
+        self.session = session
+        self.base = f"http://127.0.0.1:{session['port']}"
+        self.params = {"token": session["token"]}
+        self._sock = None
+
+    def _request(self, method: str, path: str, timeout: float) -> bytes:
+        import http.client
+        conn = http.client.HTTPConnection("127.0.0.1", self.session["port"], timeout=timeout)
+        try:
+            conn.request(method, f"{path}?{urlencode(self.params)}")
+            response = conn.getresponse()
+            body = response.read()
+        except http.client.HTTPException as e:
+            raise ConnectionError(f"控制端口响应异常: {e}") from e
+        finally:
+            conn.close()
+        if response.status != 200:
+            raise ConnectionError(f"控制端口拒绝请求: HTTP {response.status}")
+        return body
+
+    def state(self, timeout: float = 5) -> dict:
+        """当前状态；连接失败时抛出 OSError"""
+        return json.loads(self._request("GET", "/state", timeout))
+
+    def command(self, name: str) -> None:
+        """发送 stop / pause / resume；连接失败时抛出 OSError"""
+        self._request("POST", f"/{name}", 5)
+
+    def events(self, since: int = 0) -> Iterator[Tuple[str, object]]:
+        """
+        事件流：("state", 状态) / ("log", [内容, 是否错误]) / ("finished", 是否成功)
+
+        任务结束或 close() 后返回；连接异常时抛出 OSError
+        """
+        import http.client
+        # 读超时大于心跳间隔：超时即说明引擎已无响应
+        conn = http.client.HTTPConnection("127.0.0.1", self.session["port"], timeout=HEARTBEAT * 2)
+        kind, data = "message", []
+        try:
+            conn.connect()
+            # 响应读完前连接对象会交出套接字，这里保留一份以便 close() 从其他线程打断读取
+            self._sock = conn.sock
+            conn.request("GET", "/events?" + urlencode(dict(self.params, since=since)))
+            response = conn.getresponse()
+            if response.status != 200:
+                raise ConnectionError(f"控制端口拒绝连接: HTTP {response.status}")
+            while True:
+                line = response.readline()
+                if not line:
+                    return
+                line = line.decode("utf-8").rstrip("\r\n")
+                if line.startswith("event:"):
+                    kind = line[6:].strip()
+                elif line.startswith("data:"):
+                    data.append(line[5:].strip())
+                elif not line and data:
+                    payload = json.loads("\n".join(data))
+                    yield kind, payload
+                    if kind == "finished":
+                        return
+                    kind, data = "message", []
+        except (OSError, ValueError, http.client.HTTPException):
+            if self._sock is None:
+                return  # close() 已在其他线程断开
+            raise
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        """断开事件流（任务继续运行）"""
+        sock, self._sock = self._sock, None
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
+
+
+def _pick(pid: Optional[int]) -> dict:
+    sessions = list_sessions()
+    for session in sessions:
+        if pid is None or session["pid"] == pid:
+            return session
+    raise SystemExit("没有找到运行中的补档任务")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="查看和控制后台补档任务")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="列出运行中的任务")
+    for name, text in (("tail", "跟随日志和进度"), ("stop", "停止任务"),
+                       ("pause", "暂停发送"), ("resume", "继续发送")):
+        sub.add_parser(name, help=text).add_argument("pid", type=int, nargs="?")
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        for session in list_sessions():
+            print(f"{describe(session)}  http://127.0.0.1:{session['port']}/?token={session['token']}")
+        return
+    client = EngineClient(_pick(args.pid))
+    if args.command != "tail":
+        client.command(args.command)
+        return
+    status = ""   # 进度行原地刷新，日志插在它上方
+    try:
+        for kind, data in client.events():
+            if kind == "state":
+                status = (f"进度 {data.get('done', 0)}/{data.get('total', 0)}  成功 {data.get('success', 0)}  "
+                          f"死信 {data.get('dead', 0)}  {data.get('status', '')}")
+            elif kind == "log":
+                print(f"\r{data[0]}".ljust(len(status) + 1))
+            elif kind == "finished":
+                print(f"\n任务已结束（{'成功' if data else '未完成'}）")
+                return
+            print(f"\r{status}", end="", flush=True)
+    except KeyboardInterrupt:
+        print("\n已断开，任务继续运行")
+
+
+if __name__ == "__main__":
+    main()
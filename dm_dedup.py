@@ -0,0 +1,130 @@
+# dm_dedup.py
+"""
+重复/刷屏弹幕折叠
+
+存档里常有大量相同内容（233333、awsl）集中在相近时间点，每条都要花一次发送配额。
+按可配置的键（归一化内容、模式、颜色）建立哈希索引，同一键在时间窗口内只保留前 keep 条，
+其余折叠掉，并生成折叠报告。
+
+    result = dedup(danmaku_list, DedupConfig(window=5, keep=1))
+    danmaku_list = result.kept
+"""
+import json
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Hashable, List, Sequence
+
+from word_filter import normalize
+
+REPORT_PATH = Path.home() / ".bili_dm_dedup_report.json"
+
+_REPEAT = re.compile(r"(.)\1{2,}")
+_SPACE = re.compile(r"\s+")
+
+
+class DedupConfig:
+    """
+    去重键与窗口
+    """
+
+    def __init__(self, window: float = 5.0, keep: int = 1, use_mode: bool = True,
+                 use_color: bool = False, collapse_repeats: bool = True):
+        """
+        :param window: 时间窗口（秒），从该键首条保留弹幕的时间算起；0 表示只折叠同一时刻
+        :param keep: 每个窗口内最多保留的条数
+        :param use_mode: 键中包含弹幕模式
+        :param use_color: 键中包含颜色
+        :param collapse_repeats: 连续重复字符压缩为两个（"2333333" 与 "23333" 视为相同）
+        """
+        self.window = window
+        self.keep = keep
+        self.use_mode = use_mode
+        self.use_color = use_color
+        self.collapse_repeats = collapse_repeats
+
+
+class DedupResult:
+    """
+    去重结果
+
+    :param kept: 保留的弹幕（原有顺序）
+    :param dropped: 折叠条数
+    :param collapsed: 归一化内容 -> 被折叠条数
+    """
+
+    def __init__(self, kept: List[dict], dropped: int = 0, collapsed: Counter = None):
+        self.kept = kept
+        self.kept_count = len(kept)
+        self.dropped = dropped
+        self.collapsed = collapsed or Counter()
+
+    def summary(self, top: int = 5) -> str:
+        if not self.dropped:
+            return "没有可折叠的重复弹幕"
+        head = "，".join(f"{text}×{count}" for text, count in self.collapsed.most_common(top))
+        return f"折叠 {self.dropped} 条重复弹幕，保留 {self.kept_count} 条（{head}）"
+
+    def write_report(self, path=REPORT_PATH) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({
+                "kept": self.kept_count,
+                "dropped": self.dropped,
+                "collapsed": dict(self.collapsed.most_common())
+            }, f, ensure_ascii=False, indent=2)
+
+
+def content_key(text: str, collapse_repeats: bool = True) -> str:
+    """归一化内容：全角转半角、大小写折叠、去空白，可选压缩重复字符"""
+    text = _SPACE.sub("", normalize(text))
+    if collapse_repeats:
+        text = _REPEAT.sub(r"\1\1", text)
+    return text
+
+
+def dedup(danmaku_list: List[dict], config: DedupConfig = None) -> DedupResult:
+    """
+    折叠重复弹幕（按时间顺序判断窗口，输出保持原有顺序）
+
+    :param danmaku_list: 解析后的弹幕列表（需含 time/mode/color/content）
+    :param config: 去重配置
+    :return: DedupResult
+    """
+    config = config or DedupConfig()
+    texts = {}   # 原文 -> 归一化内容（重复内容只归一化一次）
+    keys = []
+    for dm in danmaku_list:
+        text = texts.get(dm["content"])
+        if text is None:
+            text = texts[dm["content"]] = content_key(dm["content"], config.collapse_repeats)
+        keys.append((text,
+                     dm.get("mode") if config.use_mode else None,
+                     dm.get("color") if config.use_color else None))
+    drop = duplicate_mask([dm["time"] for dm in danmaku_list], keys, config)
+
+    collapsed = Counter(key[0] for key, dropped in zip(keys, drop) if dropped)
+    kept = [dm for dm, dropped in zip(danmaku_list, drop) if not dropped]
+    return DedupResult(kept, len(danmaku_list) - len(kept), collapsed)
+
+
+def duplicate_mask(times: Sequence[float], keys: Sequence[Hashable], config: DedupConfig = None) -> bytearray:
+    """
+    按时间顺序判断窗口，标记应折叠的条目（调用方只保存键时使用，如内容哈希）
+
+    :param times: 各条的时间
+    :param keys: 各条的去重键，相同键视为重复
+    :param config: 去重配置（只使用 window / keep）
+    :return: 与输入等长，1 表示折叠
+    """
+    config = config or DedupConfig()
+    index = {}   # 键 -> [窗口起始时间, 窗口内已保留条数]
+    drop = bytearray(len(times))
+    for i in sorted(range(len(times)), key=times.__getitem__):
+        entry = index.get(keys[i])
+        if entry is None or times[i] - entry[0] > config.window:
+            index[keys[i]] = [times[i], 1]
+        elif entry[1] < config.keep:
+            entry[1] += 1
+        else:
+            drop[i] = 1
+    return drop
@@ -0,0 +1,128 @@
+# dm_density.py
+"""
+弹幕时间密度金字塔
+
+按多个区间宽度（1秒到1分钟）预先统计每种弹幕模式的条数，查询时按可见范围选一层，
+直接切片求和，不需要回到原始数据重新分箱：3小时直播缩放到其中10分钟也是即时的。
+发送过程中 add() / add_many() 增量更新各层。
+
+    density = DensityPyramid.from_store(store)
+    x, heights, width = density.query(600, 1200, max_bins=800)
+"""
+from typing import Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+
+LEVELS = (1, 5, 15, 60)    # 每层的区间宽度（秒）
+MODES = 10                 # 弹幕模式取值 0-9
+MAX_SECONDS = 48 * 3600    # 超出的时间计入最后一个区间，避免异常数据撑大数组
+
+
+class DensityPyramid:
+    """
+    多分辨率时间密度
+
+    :param levels: 各层区间宽度（秒），从细到粗
+    :param capacity: 初始覆盖的秒数，add() 超出时自动扩容
+    """
+
+    def __init__(self, levels: Sequence[int] = LEVELS, capacity: int = 3600):
+        self.levels = tuple(levels)
+        self.capacity = max(int(capacity), 1)
+        self._counts = [np.zeros((MODES, -(-self.capacity // w)), dtype=np.int64) for w in self.levels]
+        self.total = 0
+        self.end = 0.0   # 最大时间（秒）
+
+    @classmethod
+    def from_arrays(cls, times, modes, levels: Sequence[int] = LEVELS) -> "DensityPyramid":
+        """由时间、模式两列整体构建（一次 bincount 得到最细一层，其余层由其合并）"""
+        times = np.asarray(times, dtype=np.float64)
+        if not len(times):
+            return cls(levels)
+        seconds = _seconds(times)
+        modes = np.clip(np.asarray(modes, dtype=np.int64), 0, MODES - 1)
+        pyramid = cls(levels, int(seconds.max()) + 1)
+        span = pyramid.capacity
+        base = np.bincount(modes * span + seconds, minlength=MODES * span).reshape(MODES, span)
+        for counts, w in zip(pyramid._counts, pyramid.levels):
+            padded = np.zeros((MODES, counts.shape[1] * w), dtype=np.int64)
+            padded[:, :span] = base
+            counts[:] = padded.reshape(MODES, -1, w).sum(axis=2)
+        pyramid.total = len(times)
+        pyramid.end = float(times.max())
+        return pyramid
+
+    @classmethod
+    def from_store(cls, store, levels: Sequence[int] = LEVELS) -> "DensityPyramid":
+        """由 DanmakuStore 构建（直接引用其数组内存，不复制）"""
+        if not len(store):
+            return cls(levels)
+        return cls.from_arrays(np.frombuffer(store.time, dtype=np.float64),
+                               np.frombuffer(store.mode, dtype=np.int8), levels)
+
+    def _grow(self, seconds: int) -> None:
+        capacity = max(seconds, self.capacity * 2)
+        for i, w in enumerate(self.levels):
+            grown = np.zeros((MODES, -(-capacity // w)), dtype=np.int64)
+            grown[:, :self._counts[i].shape[1]] = self._counts[i]
+            self._counts[i] = grown
+        self.capacity = capacity
+
+    def add(self, time: float, mode: int, count: int = 1) -> None:
+        """增量计入一条（各层各加一次）"""
+        second = min(max(int(time), 0), MAX_SECONDS - 1)
+        if second >= self.capacity:
+            self._grow(second + 1)
+        mode = min(max(int(mode), 0), MODES - 1)
+        for counts, w in zip(self._counts, self.levels):
+            counts[mode, second // w] += count
+        self.total += count
+        self.end = max(self.end, time)
+
+    def add_many(self, times: Iterable[float], modes: Iterable[int]) -> None:
+        """批量增量计入"""
+        times = np.fromiter(times, dtype=np.float64)
+        if not len(times):
+            return
+        seconds = _seconds(times)
+        top = int(seconds.max()) + 1
+        if top > self.capacity:
+            self._grow(top)
+        modes = np.clip(np.fromiter(modes, dtype=np.int64, count=len(times)), 0, MODES - 1)
+        for counts, w in zip(self._counts, self.levels):
+            np.add.at(counts, (modes, seconds // w), 1)
+        self.total += len(times)
+        self.end = max(self.end, float(times.max()))
+
+    def level_for(self, span: float, max_bins: int) -> int:
+        """区间数不超过 max_bins 的最细一层"""
+        for i, w in enumerate(self.levels):
+            if span / w <= max_bins:
+                return i
+        return len(self.levels) - 1
+
+    def query(self, start: float, end: float, modes: Optional[Iterable[int]] = None,
+              max_bins: int = 800, level: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray, int]:
+        """
+        可见范围内的密度
+
+        :param start: 起始时间（秒）
+        :param end: 结束时间（秒）
+        :param modes: 只统计这些模式，为空时全部
+        :param max_bins: 最多区间数（按可见范围自动选层）
+        :param level: 指定层（不自动选择）
+        :return: (区间起点, 条数, 区间宽度)
+        """
+        i = self.level_for(end - start, max_bins) if level is None else level
+        w = self.levels[i]
+        counts = self._counts[i]
+        first = max(int(start // w), 0)
+        last = min(int(end // w) + 1, counts.shape[1])
+        if first >= last:
+            return np.zeros(0), np.zeros(0, dtype=np.int64), w
+        rows = counts[sorted(set(modes))] if modes is not None else counts
+        return np.arange(first, last) * float(w), rows[:, first:last].sum(axis=0), w
+
+
+def _seconds(times: np.ndarray) -> np.ndarray:
+    return np.clip(times, 0, MAX_SECONDS - 1).astype(np.int64)
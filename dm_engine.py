@@ -0,0 +1,606 @@
+# dm_engine.py
+"""
+补档发送引擎
+
+SendJob 是与界面无关的发送循环（重试队列、熔断、账号巡检、死信），可以：
+- 在 QThread 中运行（RestoreThread）
+- 在独立进程中运行（EngineProcess）：解析、JSON解码、日志等不再与界面争抢GIL，
+  界面崩溃也不会中断任务
+
+独立进程模式下，进度写入共享内存环形缓冲区（界面按刷新率读取最新一条，不经过管道），
+日志和完成事件走事件管道，停止/暂停/继续走命令管道。引擎另开控制端口（dm_control），
+启动它的界面关闭后，可从任意界面重新连接到仍在运行的任务。
+"""
+import functools
+import json
+import multiprocessing
+import os
+import random
+import struct
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+import dm_errors
+from circuit_breaker import OPEN, BreakerRegistry
+from clock_sync import ServerClock
+from credential_monitor import CredentialMonitor, EXPIRED
+from dead_letter import DeadLetterStore
+from dm_control import ControlServer, EventHub
+from instrument import Instrumentation
+from metrics_exporter import RestoreMetrics
+from retry_queue import RetryScheduler, error_class
+from run_history import RunHistory
+from word_filter import WordFilter
+
+# 环形缓冲区：头部为已写入条数，每条记录 (时间戳, 已完成, 总数, 成功, 死信, 重试队列长度, 最近一次请求耗时)
+_HEADER = struct.Struct("<Q")
+_RECORD = struct.Struct("<dIIIIId")
+RING_SLOTS = 256
+
+STOP = "stop"
+PAUSE = "pause"
+RESUME = "resume"
+
+
+class SendJob:
+    """
+    补档发送循环
+    功能：
+    - 失败的弹幕进入延迟重试队列，主循环继续发送新弹幕
+    - 熔断期间不发出请求，账号异常时暂停、恢复后自动继续
+    - 无法发送的弹幕写入死信
+    """
+
+    def __init__(self, config: dict, on_progress: Callable[[int, int], None] = None,
+                 on_log: Callable[[str, bool], None] = None):
+        """
+        :param config: 任务配置（弹幕列表、请求参数及 metrics / breakers / credential_monitor 等组件）；
+                       可选 history（RunHistory，真实发送结束时记录统计）；
+                       虚拟时钟模拟（dm_simulate）另有 clock / rng / poll_interval / transport；
+                       simulate_mode 为真时按任务历史估计的服务器模型在虚拟时钟下运行
+        :param on_progress: 进度回调 (已完成, 总数)
+        :param on_log: 日志回调 (内容, 是否错误)
+        """
+        self.simulation = None   # 模拟模式下服务器模型的依据说明
+        if config['simulate_mode']:
+            # 真实的发送间隔、重试和熔断对接服务器模型，等待只推进虚拟时钟，几秒内跑完
+            # （dm_simulate 依赖本模块，用到时才导入）
+            from dm_planner import Planner
+            from dm_simulate import virtual_config
+            model, self.simulation, _ = Planner(config.get('history')).model(config['account'])
+            config = virtual_config(config, model)
+        self.config = config
+        # 时钟与随机数（默认即 time / random 模块，模拟时替换为虚拟时钟和固定种子）
+        self.clock = config.get('clock', time)
+        self.rng = config.get('rng', random)
+        # 等待熔断冷却 / 重试到期时每次最多睡多久（以便及时响应停止），虚拟时钟下一次等完
+        self.poll_interval = config.get('poll_interval', 0.5)
+        self.on_progress = on_progress or (lambda done, total: None)
+        self.on_log = on_log or (lambda text, is_error: None)
+        self._is_running = True
+        self._resumed = threading.Event()
+        self._resumed.set()
+        self.success_count = 0
+        self.dead_count = 0
+        self.retry_depth = 0
+        self.last_latency = 0.0   # 最近一次发送请求耗时（秒）
+        self.outcomes = Counter()  # 原因标识 -> 次数
+        self.latency_total = 0.0
+        self.paused_s = 0.0        # 用户暂停的时长
+
+    def stop(self):
+        self._is_running = False
+        self._resumed.set()
+
+    def pause(self):
+        self._resumed.clear()
+
+    def resume(self):
+        self._resumed.set()
+
+    def run(self) -> bool:
+        """
+        执行任务（阻塞到完成或停止）
+
+        :return: 是否至少成功发送一条
+        """
+        success = False
+        metrics = self.config['metrics']
+        wall_started = time.perf_counter()
+        try:
+            if 'transport' not in self.config:
+                self.config['server_clock'].start()
+                if not self.config['server_clock'].synced:
+                    self.on_log("服务器时间同步失败，使用本地时间", True)
+                monitor = self.config['credential_monitor']
+                monitor.start()
+            else:
+                monitor = None
+            danmaku_list = self.config['danmaku_list']
+            total = len(danmaku_list)
+            metrics.total.set(total)
+            self.on_log(f"开始处理 {total} 条弹幕", False)
+
+            # 失败的弹幕进入延迟重试队列，主循环继续发送新弹幕
+            retry_queue = RetryScheduler(max_attempts=self.config['retry_limit'], clock=self.clock.monotonic,
+                                         rng=self.config.get('rng'))
+            account = self.config['account']
+            breaker = self.config['breakers'].get(account, "/x/v2/dm/post")
+            fresh = iter(range(total))
+            done = 0
+            paused = False
+            started = self.clock.monotonic()
+
+            while self._is_running:
+                # 用户暂停（独立进程模式下由命令管道控制）
+                if not self._resumed.is_set():
+                    waited = self.clock.monotonic()
+                    self._resumed.wait(0.5)
+                    self.paused_s += self.clock.monotonic() - waited
+                    continue
+
+                # 账号凭证失效或风控期间暂停，巡检恢复后自动继续
+                if monitor and not monitor.is_active(account):
+                    if not paused:
+                        self.on_log(f"账号状态异常({monitor.state(account)})，暂停发送，恢复后自动继续", True)
+                        paused = True
+                    with self.config['instrument'].stage("wait"):
+                        monitor.wait_active(account, 0.5)
+                    continue
+                if paused:
+                    self.on_log("账号已恢复，继续发送", False)
+                    paused = False
+
+                # 熔断期间不发出任何请求
+                cooldown = breaker.retry_after()
+                if cooldown > 0:
+                    with self.config['instrument'].stage("breaker"):
+                        self.clock.sleep(min(self.poll_interval, cooldown))
+                    continue
+
+                entry = retry_queue.pop_due()
+                if entry:
+                    idx, attempt = entry
+                else:
+                    idx = next(fresh, None)
+                    if idx is None:
+                        if not retry_queue:
+                            break
+                        with self.config['instrument'].stage("retry"):
+                            self.clock.sleep(min(self.poll_interval, retry_queue.next_due_in()))
+                        continue
+                    attempt = 0
+
+                    # 断点续传检查
+                    if str(idx) in self.config['sent_history']:
+                        metrics.skipped.inc("resume")
+                        done += 1
+                        self.on_progress(done, total)
+                        continue
+
+                dm = danmaku_list[idx]
+                if dm.get("filtered"):
+                    self.config['dead_letters'].add(dm, self.config['oid'], -400, "prefilter",
+                                                    "命中本地敏感词: " + ",".join(dm["filtered"]))
+                    metrics.skipped.inc("prefilter")
+                    self.dead_count += 1
+                    done += 1
+                    metrics.observe_progress(done)
+                    self.on_progress(done, total)
+                    continue
+                if not breaker.allow():
+                    retry_queue.defer(idx, attempt, breaker.retry_after())
+                    continue
+                sent_at = self.clock.perf_counter()
+                status, resp_json, error = self._send_danmaku(dm)
+                self.last_latency = self.clock.perf_counter() - sent_at
+                self.latency_total += self.last_latency
+                outcome, code, reason, text = dm_errors.classify(status, resp_json, error)
+                self.outcomes[reason] += 1
+                breaker.record(reason)
+                if breaker.state == OPEN:
+                    self.on_log(f"账号连续被拦截/限流，暂停发送 {breaker.retry_after():.0f} 秒后单条探测", True)
+                if outcome == dm_errors.SUCCESS:
+                    self.success_count += 1
+                    self.config['sent_history'].add(str(idx))
+                    self.config['save_checkpoint'](idx)
+                    done += 1
+                elif outcome == dm_errors.RETRY:
+                    delay = retry_queue.schedule(idx, error_class(status, resp_json, error), attempt + 1)
+                    if delay is None:
+                        self.on_log(f"弹幕#{idx} 尝试 {attempt+1} 次后放弃: {text}", True)
+                        self.config['dead_letters'].add(dm, self.config['oid'], code, reason, text)
+                        self.dead_count += 1
+                        done += 1
+                    else:
+                        self.on_log(f"弹幕#{idx} 尝试 {attempt+1}/{self.config['retry_limit']} 失败: {text}，{delay:.0f}秒后重试", True)
+                elif outcome == dm_errors.PAUSE_ACCOUNT:
+                    # 凭证失效时继续发送只会全部失败：交给巡检暂停账号，该条恢复后重发
+                    # （计入尝试次数：巡检认为账号正常而该条始终返回-101时不会无限重发）
+                    if monitor and attempt + 1 < self.config['retry_limit']:
+                        monitor.report(account, EXPIRED, text)
+                        retry_queue.defer(idx, attempt + 1, 0)
+                    elif monitor:
+                        monitor.report(account, EXPIRED, text)
+                        self.on_log(f"弹幕#{idx} 尝试 {attempt+1} 次均返回账号异常({text})，已写入死信", True)
+                        self.config['dead_letters'].add(dm, self.config['oid'], code, reason, text)
+                        self.dead_count += 1
+                        done += 1
+                    else:
+                        self.on_log(f"账号异常({text})，任务已暂停，请更新凭证后继续", True)
+                        self._is_running = False
+                else:
+                    self.on_log(f"弹幕#{idx} 无法发送({text})，已写入死信", True)
+                    self.config['dead_letters'].add(dm, self.config['oid'], code, reason, text)
+                    if reason == "filter":
+                        self.config['word_filter'].learn(dm["content"])
+                    self.dead_count += 1
+                    done += 1
+                self.retry_depth = len(retry_queue)
+                metrics.retry_queue_depth.set(self.retry_depth)
+
+                metrics.observe_progress(done)
+                self.on_progress(done, total)
+                delay = self._calculate_delay(idx)
+                metrics.send_interval.set(delay)
+                with self.config['instrument'].stage("wait"):
+                    self.clock.sleep(delay)
+
+            self._record_history(self.clock.monotonic() - started)
+            success = self.success_count > 0
+            self.on_log(f"完成 {self.success_count}/{total} 条", not success)
+            if self.simulation:
+                from dm_simulate import job_report
+                report = job_report(self, time.perf_counter() - wall_started)
+                self.on_log(f"[模拟] 服务器模型依据：{self.simulation}\n{report.summary()}", False)
+            elif self.dead_count:
+                self.on_log(
+                    f"{self.dead_count} 条写入死信: {self.config['dead_letters'].path}"
+                    "（可用 dead_letter.py export 导出修改后重新补档）", True)
+        except Exception as e:
+            self.on_log(f"线程错误: {str(e)}", True)
+        finally:
+            self.config['server_clock'].stop()
+            self.config['credential_monitor'].stop()
+        return success
+
+    def _record_history(self, elapsed: float) -> None:
+        """真实发送的统计写入任务历史（模拟模式和未发出请求的任务不记录）"""
+        history = self.config.get('history')
+        requests = sum(self.outcomes.values())
+        if history is None or not requests:
+            return
+        try:
+            history.record(self.config['account'], self.success_count, self.dead_count,
+                           elapsed - self.paused_s, requests, self.outcomes,
+                           self.latency_total / requests, self.config['min_delay'])
+        except OSError as e:
+            self.on_log(f"任务历史写入失败: {str(e)}", True)
+
+    def _send_danmaku(self, dm):
+        """
+        发送单条弹幕（不重试，结果由 dm_errors.classify 判定去向）
+
+        :return: (HTTP状态码, 响应JSON, 异常)
+        """
+        inst = self.config['instrument']
+        metrics = self.config['metrics']
+        transport = self.config.get('transport')
+        if transport is None:
+            import requests  # 首次真实发送时才导入（界面启动时由预热线程提前加载）
+        with inst.stage("build"):
+            data = {
+                "oid": self.config['oid'],
+                "type": 1,
+                "mode": dm["mode"],
+                "fontsize": dm["font_size"],
+                "color": dm["color"],
+                "message": dm["content"],
+                "csrf": self.config['csrf'],
+                "timestamp": self.config['server_clock'].now_ms()
+            }
+        with inst.stage("network"):
+            sent_at = self.clock.perf_counter()
+            if transport is not None:
+                # 虚拟时钟模拟：由服务器模型处理并推进虚拟时钟，不经过网络
+                status, resp_json = transport(data)
+            else:
+                try:
+                    response = requests.post(
+                        self.config['api_url'],
+                        headers=self.config['headers'],
+                        data=data,
+                        timeout=15
+                    )
+                except Exception as e:
+                    metrics.observe_exception(e)
+                    return None, None, e
+                status = response.status_code
+                try:
+                    resp_json = response.json() if status != 412 else None
+                except ValueError:
+                    resp_json = None
+            metrics.observe_response(status, resp_json, self.clock.perf_counter() - sent_at)
+
+        inst.count(f"http_{status}")
+        if resp_json is not None:
+            inst.count(f"code_{resp_json.get('code')}")
+        return status, resp_json, None
+
+    def _calculate_delay(self, idx):
+        base_delay = self.config['min_delay']
+        return base_delay * (1 + (idx % 3)/2) + self.rng.uniform(0, 0.3)
+
+
+class ProgressRing:
+    """
+    共享内存进度环形缓冲区（单写多读）
+
+    写入方先写记录再更新计数；读取方读计数后取对应槽位，读完再核对计数，
+    期间被覆盖（落后一整圈）时重读。
+    """
+
+    def __init__(self, buffer, slots: int = RING_SLOTS):
+        """
+        :param buffer: 可写缓冲区（multiprocessing.RawArray 或 memoryview），大小至少 ProgressRing.size(slots)
+        :param slots: 槽位数
+        """
+        self.buffer = memoryview(buffer).cast("B")
+        self.slots = slots
+        self._seq = _HEADER.unpack_from(self.buffer, 0)[0]
+
+    @staticmethod
+    def size(slots: int = RING_SLOTS) -> int:
+        return _HEADER.size + _RECORD.size * slots
+
+    def push(self, done: int, total: int, success: int, dead: int, retry_depth: int,
+             latency: float = 0.0) -> None:
+        offset = _HEADER.size + (self._seq % self.slots) * _RECORD.size
+        _RECORD.pack_into(self.buffer, offset, time.time(), done, total, success, dead, retry_depth, latency)
+        self._seq += 1
+        _HEADER.pack_into(self.buffer, 0, self._seq)
+
+    def seq(self) -> int:
+        return _HEADER.unpack_from(self.buffer, 0)[0]
+
+    def read_since(self, seq: int) -> Tuple[List[tuple], int]:
+        """
+        读取 seq 之后的记录（最多一圈）
+
+        :return: ([(时间戳, 已完成, 总数, 成功, 死信, 重试队列长度, 请求耗时), ...], 最新计数)
+        """
+        while True:
+            end = self.seq()
+            start = max(seq, end - self.slots + 1)
+            records = [_RECORD.unpack_from(self.buffer, _HEADER.size + (i % self.slots) * _RECORD.size)
+                       for i in range(start, end)]
+            if self.seq() - start < self.slots:
+                return records, end
+
+    def latest(self) -> Optional[tuple]:
+        records, _ = self.read_since(max(self.seq() - 1, 0))
+        return records[-1] if records else None
+
+
+class Checkpoint:
+    """
+    断点记录（格式与界面版 _save_checkpoint 一致：已发送序号、BV号、分P、进度）
+    """
+
+    def __init__(self, path, bvid: str, cid, sent_history: set, metrics=None, every: int = 10):
+        self.path = Path(path)
+        self.bvid = bvid
+        self.cid = cid
+        self.sent_history = sent_history
+        self.metrics = metrics
+        self.every = every
+
+    def save(self, current_index: int) -> None:
+        if current_index % self.every != 0:
+            return
+        data = {
+            "sent": list(self.sent_history),
+            "bvid": self.bvid,
+            "cid": self.cid,
+            "timestamp": int(time.time()),
+            "progress": current_index
+        }
+        # 写入临时文件后重命名，确保原子性操作
+        temp_file = self.path.with_suffix(".tmp")
+        with open(temp_file, 'w') as f:
+            json.dump(data, f, indent=2)
+        temp_file.replace(self.path)
+        if self.metrics is not None:
+            self.metrics.observe_checkpoint(current_index)
+
+
+def build_config(spec: dict) -> dict:
+    """
+    由可序列化的任务描述构建 SendJob 配置（在引擎进程中创建各组件）
+
+    :param spec: danmaku_list / headers / oid / csrf / min_delay / retry_limit / api_url /
+                 simulate_mode / account 原样使用，另需 cookies / clock_url / nav_url /
+                 sent_history / checkpoint_file / bvid / dead_letter_path / profile，
+                 可选 page（分P序号，写入任务文件供其他界面显示）、history_path（任务历史文件）
+    """
+    metrics = RestoreMetrics()
+    sent_history = set(spec['sent_history'])
+    monitor = CredentialMonitor(url=spec['nav_url'], metrics=metrics)
+    monitor.add_account(spec['account'], spec['cookies'])
+    config = {key: spec[key] for key in ('danmaku_list', 'headers', 'oid', 'csrf', 'min_delay',
+                                         'retry_limit', 'api_url', 'simulate_mode', 'account')}
+    config.update({
+        'server_clock': ServerClock(url=spec['clock_url']),
+        'instrument': Instrumentation(enabled=spec['profile']),
+        'metrics': metrics,
+        'sent_history': sent_history,
+        'dead_letters': DeadLetterStore(spec['dead_letter_path']),
+        'breakers': BreakerRegistry(metrics=metrics),
+        'credential_monitor': monitor,
+        'word_filter': WordFilter.from_files(),
+        'history': RunHistory(spec['history_path']) if spec.get('history_path') else None,
+        'save_checkpoint': Checkpoint(spec['checkpoint_file'], spec['bvid'], spec['oid'],
+                                      sent_history, metrics).save
+    })
+    return config
+
+
+def _send(conn, message) -> None:
+    # 界面进程已退出时丢弃事件，任务继续
+    try:
+        conn.send(message)
+    except (OSError, ValueError):
+        pass
+
+
+def run_engine(spec: dict, commands, events, buffer) -> None:
+    """
+    引擎进程入口
+
+    :param spec: 任务描述（见 build_config）
+    :param commands: 命令管道接收端（STOP / PAUSE / RESUME）
+    :param events: 事件管道发送端（("log", 内容, 是否错误) / ("finished", 是否成功)）
+    :param buffer: 进度环形缓冲区的共享内存
+    """
+    if hasattr(os, "setsid"):
+        # 脱离界面进程的会话：关闭启动界面的终端不会结束任务
+        try:
+            os.setsid()
+        except OSError:
+            pass
+    config = build_config(spec)
+    ring = ProgressRing(buffer)
+    hub = EventHub()
+    hub.update(status="running", done=0, total=len(spec['danmaku_list']), success=0, dead=0,
+               retry_depth=0, bvid=spec['bvid'], oid=spec['oid'])
+
+    def log(text, is_error):
+        hub.publish("log", [text, is_error])
+        _send(events, ("log", text, is_error))
+
+    def progress(done, total):
+        ring.push(done, total, job.success_count, job.dead_count, job.retry_depth, job.last_latency)
+        hub.update(done=done, total=total, success=job.success_count, dead=job.dead_count,
+                   retry_depth=job.retry_depth)
+
+    def control(command):
+        if command == STOP:
+            job.stop()
+            hub.update(status="stopping")
+        elif command == PAUSE:
+            job.pause()
+            hub.update(status="paused")
+        elif command == RESUME:
+            job.resume()
+            hub.update(status="running")
+
+    job = SendJob(config, on_progress=progress, on_log=log)
+
+    def listen():
+        while True:
+            try:
+                control(commands.recv())
+            except (EOFError, OSError):
+                return
+
+    threading.Thread(target=listen, daemon=True).start()
+    # 控制端口：其他界面（Qt / Tk / dm.html / dm_control.py）可随时连接、断开
+    server = None
+    try:
+        server = ControlServer(hub, {name: functools.partial(control, name) for name in (STOP, PAUSE, RESUME)})
+        server.start(bvid=spec['bvid'], oid=spec['oid'], page=spec.get('page'))
+        log(f"控制端口: {server.url}/?token={server.token}", False)
+    except OSError as e:
+        log(f"控制端口启动失败（任务照常运行）: {e}", True)
+    success = job.run()
+    if spec['profile']:
+        try:
+            config['instrument'].export_json(spec['profile_path'])
+        except OSError:
+            pass
+    hub.update(status="finished")
+    hub.publish("finished", success)
+    _send(events, ("finished", success))
+    if server is not None:
+        server.stop()
+
+
+class EngineProcess:
+    """
+    独立进程中的补档任务（界面侧句柄）
+
+        engine = EngineProcess(spec).start()
+        # 界面定时器中
+        for kind, *args in engine.poll_events(): ...
+        progress = engine.progress()
+    """
+
+    def __init__(self, spec: dict, slots: int = RING_SLOTS):
+        # spawn：不继承界面进程的Qt/Tk状态
+        self._ctx = multiprocessing.get_context("spawn")
+        self.spec = spec
+        self.buffer = self._ctx.RawArray("B", ProgressRing.size(slots))
+        self.ring = ProgressRing(self.buffer, slots)
+        self._commands, self._command_sender = self._ctx.Pipe(duplex=False)
+        self._event_receiver, self._events = self._ctx.Pipe(duplex=False)
+        self.process = None
+        self.finished = None
+
+    def start(self) -> "EngineProcess":
+        # 非守护进程：界面进程异常退出时任务继续
+        self.process = self._ctx.Process(target=run_engine, name="dm-engine", daemon=False,
+                                         args=(self.spec, self._commands, self._events, self.buffer))
+        self.process.start()
+        # 退出时 multiprocessing 会等待所有子进程结束，关闭窗口后界面进程会一直挂到任务完成；
+        # 从子进程登记中移除，界面可以随时退出（is_alive / join 仍可用）
+        multiprocessing.process._children.discard(self.process)
+        # 子进程已持有管道另一端
+        self._commands.close()
+        self._events.close()
+        return self
+
+    def send(self, command: str) -> None:
+        try:
+            self._command_sender.send(command)
+        except OSError:
+            pass
+
+    def stop(self) -> None:
+        self.send(STOP)
+
+    def pause(self) -> None:
+        self.send(PAUSE)
+
+    def resume(self) -> None:
+        self.send(RESUME)
+
+    def progress(self) -> Optional[tuple]:
+        """最新进度记录 (时间戳, 已完成, 总数, 成功, 死信, 重试队列长度, 请求耗时)，尚无进度时返回None"""
+        return self.ring.latest()
+
+    def poll_events(self) -> List[tuple]:
+        """取出所有待处理事件（不阻塞）；进程意外退出时补一个 finished 事件"""
+        events = []
+        try:
+            while self._event_receiver.poll():
+                events.append(self._event_receiver.recv())
+        except (EOFError, OSError):
+            pass
+        for event in events:
+            if event[0] == "finished":
+                self.finished = event[1]
+        if self.finished is None and self.process is not None and not self.process.is_alive():
+            self.finished = False
+            events.append(("log", f"引擎进程异常退出(exitcode={self.process.exitcode})", True))
+            events.append(("finished", False))
+        return events
+
+    def is_alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    def join(self, timeout: float = None) -> None:
+        if self.process is not None:
+            self.process.join(timeout)
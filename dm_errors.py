@@ -0,0 +1,94 @@
+# dm_errors.py
+"""
+B站弹幕接口错误码表
+
+与 safedm5.3 diagnose_error 的诊断规则一致，供日志、指标和结果分类共用。
+
+classify() 把一次发送结果归入四种去向：
+- success        发送成功
+- retry          暂时性错误（网络、5xx、412、-509、时间戳），稍后重试
+- pause_account  账号凭证问题（-101、CSRF），重试只会继续失败，应暂停该账号
+- dead_letter    内容或目标问题（敏感词、视频不存在、oid无效），写入死信等待人工处理
+"""
+from typing import Optional, Tuple
+
+# 412 为HTTP状态码（风控拦截），其余为响应JSON中的code
+HTTP_BLOCKED = 412
+
+# code -> [(message关键字, 原因标识, 中文说明), ...]；关键字为None表示无条件匹配
+DIAGNOSIS = {
+    -400: [
+        ("oid", "oid", "CID无效或视频不可用"),
+        ("csrf", "csrf", "CSRF Token验证失败"),
+        ("timestamp", "timestamp", "时间戳不同步"),
+        ("filter", "filter", "触发敏感词过滤"),
+    ],
+    -101: [(None, "auth", "认证信息失效")],
+    -111: [(None, "csrf_format", "CSRF Token格式错误")],
+    -404: [(None, "not_found", "视频不存在")],
+    -509: [(None, "rate_limit", "触发频率限制")],
+}
+
+SUCCESS = "success"
+RETRY = "retry"
+PAUSE_ACCOUNT = "pause_account"
+DEAD_LETTER = "dead_letter"
+
+# 原因标识 -> 去向；未列出的原因（含unknown）按暂时性错误重试
+ROUTES = {
+    "ok": SUCCESS,
+    "auth": PAUSE_ACCOUNT,
+    "csrf": PAUSE_ACCOUNT,
+    "csrf_format": PAUSE_ACCOUNT,
+    "oid": DEAD_LETTER,
+    "not_found": DEAD_LETTER,
+    "filter": DEAD_LETTER,
+    "encoding": DEAD_LETTER,
+}
+
+
+def diagnose(resp_json: dict) -> Tuple[int, str, str]:
+    """
+    诊断接口返回
+
+    :param resp_json: 接口响应JSON
+    :return: (code, 原因标识, 中文说明)；无法识别时原因标识为"unknown"
+    """
+    code = resp_json.get("code", -1)
+    message = resp_json.get("message", "")
+    data = resp_json.get("data") or {}
+    if code == 0:
+        return 0, "ok", "成功"
+    for keyword, reason, text in DIAGNOSIS.get(code, []):
+        if keyword is None or keyword in message:
+            return code, reason, text
+    if code == -400 and isinstance(data, dict) and data.get("message") == "啥都没有啊":
+        return code, "encoding", "内容编码错误"
+    return code, "unknown", f"未知错误代码: {code}"
+
+
+def blocked() -> Tuple[int, str, str]:
+    """HTTP 412 风控拦截"""
+    return HTTP_BLOCKED, "blocked", "请求被拦截(412)"
+
+
+def classify(status: Optional[int] = None, resp_json: Optional[dict] = None,
+             exc: Optional[Exception] = None) -> Tuple[str, int, str, str]:
+    """
+    判定一次发送结果的去向
+
+    :param status: HTTP状态码，请求未完成时为None
+    :param resp_json: 响应JSON，无法解析时为None
+    :param exc: 请求异常
+    :return: (去向, code, 原因标识, 中文说明)
+    """
+    if status == HTTP_BLOCKED:
+        return (RETRY,) + blocked()
+    if status is None:
+        return RETRY, -1, "network", str(exc) if exc else "请求未完成"
+    if resp_json is None:
+        if status >= 400:
+            return RETRY, status, "network", f"HTTP {status}"
+        return RETRY, status, "bad_response", "响应解析失败"
+    code, reason, text = diagnose(resp_json)
+    return ROUTES.get(reason, RETRY), code, reason, text
@@ -0,0 +1,163 @@
+# dm_plan.py
+"""
+整份文件的发送计划
+
+分批流式发送时，如果选区、折叠重复和发送顺序只在每批内计算，跨批的重复不会被折叠，
+"权重优先"也只是批内顺序。这里先扫描整份文件一次，选区内的每条只保存时间、权重、
+内容哈希和字节位置（几十字节），在整份文件上完成折叠和排序，再按计划顺序分批从文件
+读回内容发送。内存只与条数和批大小有关，与弹幕内容无关。
+
+    plan = SendPlan.build(path, parse_row, selection, DedupConfig(), WEIGHT)
+    for rows in plan.batches(1000):
+        window = plan.load(rows, parse_row)
+"""
+import hashlib
+import mmap
+from array import array
+from collections import Counter
+from typing import Callable, Iterator, List, Optional
+
+from dm_dedup import DedupConfig, DedupResult, content_key, duplicate_mask
+from dm_priority import FILE, send_order
+from dm_scan import ScanReport, scan_bytes, scan_file
+from dm_store import in_selection
+
+# (p属性, 文本) -> 弹幕字典；字段不足时返回None，无效时抛出 ValueError
+RowParser = Callable[[str, Optional[str]], Optional[dict]]
+
+
+def _key_hash(text: str) -> int:
+    """64位内容哈希（不随进程变化，两次运行的折叠结果一致，断点续传不受影响）"""
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little", signed=True)
+
+
+class _Rows:
+    """按序号取 {time, weight} 的只读视图，供 dm_priority 排序"""
+
+    def __init__(self, plan: "SendPlan", rows):
+        self.plan = plan
+        self.rows = rows
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __getitem__(self, j: int) -> dict:
+        i = self.rows[j]
+        return {"time": self.plan.time[i], "weight": self.plan.weight[i]}
+
+
+class SendPlan:
+    """
+    发送计划
+    功能：
+    - build() 扫描整份文件，逐条解析校验，选区内的行只保存数值列和字节位置
+    - 折叠重复和发送顺序在整份文件上计算，结果确定（相同文件和设置下两次运行一致）
+    - batches() 按发送顺序分批，load() 从文件读回一批的内容
+
+    :param path: 弹幕文件路径
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.time = array("d")
+        self.weight = array("b")     # 与 DanmakuStore 一致按 int8 保存，超出范围的按边界值排序
+        self.key = array("q")
+        self.start = array("q")
+        self.length = array("l")
+        self.order = array("l")      # 发送顺序（行号）
+        self.scanned = 0             # 扫描到的元素数
+        self.dedup = DedupResult([])
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    @classmethod
+    def build(cls, path, parse_row: RowParser, selection: Optional[dict] = None,
+              dedup: Optional[DedupConfig] = None, strategy: str = FILE, report: ScanReport = None,
+              on_invalid: Callable[[ValueError], None] = None) -> "SendPlan":
+        """
+        生成发送计划
+
+        :param path: 弹幕文件路径
+        :param parse_row: 解析函数（与 load() 使用同一个）
+        :param selection: DanmakuStore.select 参数，为空时全部
+        :param dedup: 折叠重复配置，为空时不折叠
+        :param strategy: 发送顺序（dm_priority 策略名）
+        :param report: 扫描报告
+        :param on_invalid: 无效行回调
+        """
+        plan = cls(path)
+        if selection is not None and all(v is None for v in selection.values()):
+            selection = None
+        for p, text, start, end in scan_file(path, report, with_spans=True):
+            plan.scanned += 1
+            try:
+                dm = parse_row(p, text)
+            except ValueError as e:
+                if on_invalid is not None:
+                    on_invalid(e)
+                continue
+            if dm is None or (selection is not None and not in_selection(dm, **selection)):
+                continue
+            plan.time.append(dm["time"])
+            plan.weight.append(min(max(dm.get("weight", 0), -128), 127))
+            if dedup is not None:
+                plan.key.append(_key_hash("\x00".join((
+                    content_key(dm["content"], dedup.collapse_repeats),
+                    str(dm["mode"]) if dedup.use_mode else "",
+                    str(dm["color"]) if dedup.use_color else ""))))
+            plan.start.append(start)
+            plan.length.append(end - start)
+
+        rows = range(len(plan.time))
+        if dedup is not None:
+            drop = duplicate_mask(plan.time, plan.key, dedup)
+            plan.dedup = plan._collapsed(drop, parse_row, dedup)
+            rows = [i for i in rows if not drop[i]]
+        plan.order = array("l", (rows[j] for j in send_order(_Rows(plan, rows), strategy)))
+        return plan
+
+    def _collapsed(self, drop: bytearray, parse_row: RowParser, config: DedupConfig) -> DedupResult:
+        """折叠统计：每个被折叠的键读回一条内容作为报告中的文本"""
+        counts, sample = Counter(), {}
+        for i, dropped in enumerate(drop):
+            if dropped:
+                counts[self.key[i]] += 1
+                sample.setdefault(self.key[i], i)
+        collapsed = Counter()
+        for dm, key in zip(self._read(sample.values(), parse_row), sample):
+            text = content_key(dm["content"], config.collapse_repeats) if dm is not None else ""
+            collapsed[text] += counts[key]
+        result = DedupResult([], sum(counts.values()), collapsed)
+        result.kept_count = len(drop) - result.dropped
+        return result
+
+    def batches(self, size: int) -> Iterator[array]:
+        """按发送顺序每 size 条一批"""
+        for i in range(0, len(self.order), size):
+            yield self.order[i:i + size]
+
+    def load(self, rows, parse_row: RowParser) -> List[dict]:
+        """
+        从文件读回若干行的弹幕（按给出的顺序）
+
+        :param rows: 行号
+        :param parse_row: 解析函数（与 build() 使用同一个）
+        """
+        # 只有文件在生成计划后被改动才会读不回来（断点指纹包含修改时间，不会错位续传）
+        return [dm for dm in self._read(rows, parse_row) if dm is not None]
+
+    def _read(self, rows, parse_row: RowParser) -> List[Optional[dict]]:
+        rows = list(rows)
+        if not rows:
+            return []
+        window = []
+        with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for i in rows:
+                start = self.start[i]
+                element, _ = scan_bytes(mm[start:start + self.length[i]])
+                try:
+                    window.append(parse_row(*element[0]) if element else None)
+                except ValueError:
+                    window.append(None)
+        return window
@@ -0,0 +1,135 @@
+# dm_planner.py
+"""
+完成时间与账号数预估
+
+从任务历史（run_history）估计服务器模型参数：请求耗时，以及 412 拦截、-509 限流、
+-400 等结果的比例。再用虚拟时钟模拟（dm_simulate）按本次的发送间隔和重试设置
+跑一段样本，得到每条的平均耗时，推算整个任务的完成时间，以及在截止时间内完成
+需要几个账号并行（每个账号各跑一份任务）。没有历史时使用默认模型。
+
+    plan = Planner().plan(count=len(rows), min_delay=1.5, account=account_key(sessdata))
+    print(plan.summary(deadline_s=6 * 3600))
+"""
+import math
+from typing import List, Optional, Tuple
+
+from dm_simulate import simulate, synthetic_list
+from dm_store import format_time
+from mock_bili_server import MockConfig
+from run_history import RunHistory
+
+SAMPLE = 2000          # 模拟的样本条数（更大的任务按比例推算）
+RECENT_RUNS = 20       # 只参考最近的任务
+DEFAULT_LATENCY = 0.15
+
+
+class Plan:
+    """
+    预估结果
+
+    :param count: 待发送条数
+    :param per_item_s: 每条平均耗时（秒，单账号）
+    :param success_ratio: 预计成功比例
+    :param source: 依据说明
+    :param observed_per_hour: 历史实测每小时处理条数，无历史时为None
+    """
+
+    def __init__(self, count: int, per_item_s: float, success_ratio: float, source: str,
+                 observed_per_hour: Optional[float] = None):
+        self.count = count
+        self.per_item_s = per_item_s
+        self.success_ratio = success_ratio
+        self.source = source
+        self.observed_per_hour = observed_per_hour
+
+    @property
+    def per_hour(self) -> float:
+        return 3600 / self.per_item_s if self.per_item_s else 0.0
+
+    def eta_s(self, accounts: int = 1) -> float:
+        """完成时间（秒），accounts 个账号平分任务"""
+        return self.count * self.per_item_s / max(accounts, 1)
+
+    def accounts_for(self, deadline_s: float) -> int:
+        """在 deadline_s 秒内完成需要的账号数"""
+        if deadline_s <= 0:
+            raise ValueError("截止时间必须大于0")
+        return max(1, math.ceil(self.eta_s() / deadline_s))
+
+    def summary(self, deadline_s: Optional[float] = None) -> str:
+        lines = [
+            f"{self.count} 条预计耗时 {format_time(self.eta_s())}"
+            f"（约 {self.per_hour:.0f} 条/小时，预计成功 {self.success_ratio:.1%}）",
+            f"依据：{self.source}"
+        ]
+        if self.observed_per_hour is not None:
+            lines.append(f"历史实测约 {self.observed_per_hour:.0f} 条/小时（含账号暂停等等待）")
+        if deadline_s:
+            accounts = self.accounts_for(deadline_s)
+            lines.append(f"{format_time(deadline_s)} 内完成需要 {accounts} 个账号"
+                         f"（{accounts} 个账号约 {format_time(self.eta_s(accounts))}）")
+        return "\n".join(lines)
+
+
+def model_from_runs(runs: List[dict]) -> MockConfig:
+    """由历史记录估计服务器模型（各结果按请求次数加权）"""
+    requests = sum(r["requests"] for r in runs)
+    outcomes = {}
+    for r in runs:
+        for reason, n in r["outcomes"].items():
+            outcomes[reason] = outcomes.get(reason, 0) + n
+    latency = sum(r["latency_s"] * r["requests"] for r in runs) / requests
+    return MockConfig(
+        latency=latency,
+        p412=outcomes.get("blocked", 0) / requests,
+        p509=outcomes.get("rate_limit", 0) / requests,
+        p400=(outcomes.get("filter", 0) + outcomes.get("timestamp", 0)) / requests
+    )
+
+
+class Planner:
+    """
+    完成时间预估
+
+    :param history: 任务历史
+    :param sample: 模拟样本条数
+    """
+
+    def __init__(self, history: RunHistory = None, sample: int = SAMPLE):
+        self.history = history or RunHistory()
+        self.sample = sample
+
+    def model(self, account: Optional[str] = None) -> Tuple[MockConfig, str, Optional[float]]:
+        """
+        由任务历史估计服务器模型
+
+        :param account: 账号标识，有该账号的历史时只参考该账号
+        :return: (服务器模型, 依据说明, 历史实测每小时处理条数或None)
+        """
+        runs = self.history.runs(account, RECENT_RUNS) if account else []
+        source = "该账号最近 {} 次任务"
+        if not runs:
+            runs = self.history.runs(recent=RECENT_RUNS)
+            source = "所有账号最近 {} 次任务"
+        if not runs:
+            return MockConfig(latency=DEFAULT_LATENCY), "无历史记录，按默认模型", None
+        processed = sum(r["success"] + r["dead"] for r in runs)
+        elapsed = sum(r["elapsed_s"] for r in runs)
+        observed = processed / elapsed * 3600 if elapsed else None
+        return model_from_runs(runs), source.format(len(runs)), observed
+
+    def plan(self, count: int, min_delay: float = 1.5, retry_limit: int = 3,
+             account: Optional[str] = None) -> Plan:
+        """
+        预估一次任务
+
+        :param count: 待发送条数
+        :param min_delay: 发送间隔设置
+        :param retry_limit: 每条最多尝试次数
+        :param account: 账号标识，有该账号的历史时只参考该账号
+        """
+        model, source, observed = self.model(account)
+        report = simulate(synthetic_list(min(count, self.sample) or 1), model, min_delay, retry_limit)
+        done = max(report.done, 1)
+        return Plan(count, report.virtual_s / done, report.success / done,
+                    f"{source}（模拟 {done} 条）", observed)
@@ -0,0 +1,102 @@
+# dm_priority.py
+"""
+发送顺序调度
+
+默认按文件顺序发送，配额中途用尽时已补的未必是最有价值的部分。这里把解析后的列表
+重新排序，使前面的弹幕价值最高：
+- file      文件顺序（不调整）
+- weight    按屏蔽权重（p属性第9项，越高越不容易被屏蔽）从高到低
+- coverage  把视频时间轴切成等长区间，每次从已安排条数最少的区间取一条，
+            先让整条时间轴都有弹幕，再逐步加密；区间内按权重从高到低
+- custom    按调用方给出的评分函数从高到低
+
+排序稳定且确定（同分按时间、再按原序号），相同设置下两次运行的列表一致，断点续传不受影响。
+"""
+import heapq
+from typing import Callable, List, Optional
+
+FILE = "file"
+WEIGHT = "weight"
+COVERAGE = "coverage"
+CUSTOM = "custom"
+
+STRATEGIES = {
+    FILE: "文件顺序",
+    WEIGHT: "权重优先",
+    COVERAGE: "时间轴覆盖优先",
+}
+
+
+def _weight(dm: dict) -> int:
+    return dm.get("weight", 0)
+
+
+def order_by_score(danmaku_list: List[dict], score: Callable[[dict], float]) -> List[int]:
+    """按评分从高到低的序号列表（同分按时间先后）"""
+    return sorted(range(len(danmaku_list)),
+                  key=lambda i: (-score(danmaku_list[i]), danmaku_list[i]["time"], i))
+
+
+def order_by_coverage(danmaku_list: List[dict], bin_seconds: float = 10.0,
+                      score: Callable[[dict], float] = _weight) -> List[int]:
+    """
+    时间轴覆盖优先的序号列表
+
+    :param bin_seconds: 区间长度（秒）
+    :param score: 区间内的排序评分
+    """
+    bins = {}
+    for i, dm in enumerate(danmaku_list):
+        bins.setdefault(int(dm["time"] // bin_seconds), []).append(i)
+    for members in bins.values():
+        # 倒序存放，pop() 取出的是区间内评分最高的一条
+        members.sort(key=lambda i: (score(danmaku_list[i]), -danmaku_list[i]["time"], -i))
+
+    # 小顶堆 (已安排条数, 区间号)：条数相同时先排视频靠前的区间
+    heap = [(0, b) for b in bins]
+    heapq.heapify(heap)
+    order = []
+    while heap:
+        count, b = heapq.heappop(heap)
+        members = bins[b]
+        order.append(members.pop())
+        if members:
+            heapq.heappush(heap, (count + 1, b))
+    return order
+
+
+def prioritize(danmaku_list: List[dict], strategy: str = FILE, bin_seconds: float = 10.0,
+               score: Optional[Callable[[dict], float]] = None) -> List[dict]:
+    """
+    按策略重新排列弹幕
+
+    :param danmaku_list: 解析后的弹幕列表
+    :param strategy: FILE / WEIGHT / COVERAGE / CUSTOM
+    :param bin_seconds: COVERAGE 的区间长度（秒）
+    :param score: CUSTOM 的评分函数；COVERAGE 时用于区间内排序
+    :return: 新列表（元素为原字典）
+    """
+    if strategy == FILE:
+        return list(danmaku_list)
+    return [danmaku_list[i] for i in send_order(danmaku_list, strategy, bin_seconds, score)]
+
+
+def send_order(danmaku_list, strategy: str = FILE, bin_seconds: float = 10.0,
+               score: Optional[Callable[[dict], float]] = None) -> List[int]:
+    """
+    按策略排列后的序号列表（参数同 prioritize；danmaku_list 只需支持 len() 和按序号取字典）
+    """
+    if strategy == FILE:
+        return list(range(len(danmaku_list)))
+    if strategy == WEIGHT:
+        order = order_by_score(danmaku_list, _weight)
+    elif strategy == COVERAGE:
+        order = order_by_coverage(danmaku_list, bin_seconds, score or _weight)
+    elif strategy == CUSTOM:
+        if score is None:
+            raise ValueError("custom 排序需要提供评分函数")
+        order = order_by_score(danmaku_list, score)
+    else:
+        raise ValueError(f"未知排序策略: {strategy}")
+    return order
+
@@ -0,0 +1,161 @@
+# dm_scan.py
+"""
+容错弹幕扫描器
+
+存档XML常见损坏：尾部截断、个别 <d> 中混入控制字符或非UTF-8字节。ElementTree
+遇到任何一处都会中止整个文件。这里直接在字节层面按 <d 边界切分，每段独立匹配：
+- 完好的元素照常取出 p 属性和文本
+- 损坏的段记录字节范围和原因后跳过，从下一个 <d 重新同步
+- 文本中的非法控制字符直接去掉（计入修复条数），换行与 XML 解析器一样统一为 \n
+
+    report = ScanReport()
+    for p, text in scan_file(path, report):
+        ...
+    print(report.summary())
+"""
+import re
+from typing import Iterator, List, Optional, Tuple
+
+_D_TAG = re.compile(rb"<d[\s>/]")
+_ELEMENT = re.compile(rb"""<d\s[^>]*?\bp\s*=\s*(["'])(.*?)\1[^>]*?(?:/>|>(.*?)</d\s*>)""", re.S)
+_CONTROL = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+_ENTITY = re.compile(r"&(#[0-9]+|#x[0-9a-fA-F]+|lt|gt|amp|quot|apos);")
+_NAMED = {"lt": "<", "gt": ">", "amp": "&", "quot": '"', "apos": "'"}
+
+TRUNCATED = "truncated"    # 文件在元素中途结束
+MALFORMED = "malformed"    # 标签不完整或缺少 p 属性
+ENCODING = "encoding"      # 非UTF-8字节
+INVALID = "invalid"        # p 属性字段不是数字或超出范围（由解析方记录）
+
+
+class ScanReport:
+    """
+    扫描报告
+
+    :param recovered: 取出的元素数
+    :param repaired: 去掉控制字符后取出的元素数
+    :param clamped: 权重或时间戳超出范围、按边界值保存的元素数（由解析方记录）
+    :param damaged: [(起始字节, 结束字节, 原因), ...]
+    """
+
+    def __init__(self):
+        self.recovered = 0
+        self.repaired = 0
+        self.clamped = 0
+        self.damaged: List[Tuple[int, int, str]] = []
+
+    def merge(self, other: "ScanReport") -> None:
+        """累加另一分片的报告（字节范围均为文件内偏移，按文件顺序合并）"""
+        self.recovered += other.recovered
+        self.repaired += other.repaired
+        self.clamped += other.clamped
+        self.damaged.extend(other.damaged)
+
+    def summary(self, top: int = 5) -> str:
+        if not self.damaged:
+            text = f"扫描完成：{self.recovered} 条"
+        else:
+            ranges = "，".join(f"{start}-{end}({reason})" for start, end, reason in self.damaged[:top])
+            more = f" 等 {len(self.damaged)} 处" if len(self.damaged) > top else ""
+            text = f"扫描完成：{self.recovered} 条，跳过损坏字节 {ranges}{more}"
+        if self.repaired:
+            text += f"，{self.repaired} 条已去除控制字符"
+        if self.clamped:
+            text += f"，{self.clamped} 条权重/时间戳超出范围已按边界值保存"
+        return text
+
+
+def _entity(match) -> str:
+    name = match.group(1)
+    if name[0] != "#":
+        return _NAMED[name]
+    try:
+        return chr(int(name[2:], 16) if name[1] in "xX" else int(name[1:]))
+    except (ValueError, OverflowError):
+        return match.group(0)
+
+
+def normalize_newlines(text: str) -> str:
+    """与 XML 解析器一致：\r\n 和单独的 \r 统一为 \n（在实体还原之前，&#13; 保留为 \r）"""
+    return text.replace("\r\n", "\n").replace("\r", "\n") if "\r" in text else text
+
+
+def unescape(text: str) -> str:
+    """XML实体还原（未知实体保留原样）"""
+    return _ENTITY.sub(_entity, text) if "&" in text else text
+
+
+def scan_bytes(data: bytes, report: ScanReport = None, offset: int = 0, final: bool = True,
+               spans: Optional[list] = None) -> Tuple[List[Tuple[str, Optional[str]]], int]:
+    """
+    扫描一段字节
+
+    :param data: 字节内容
+    :param report: 扫描报告，为空时不记录
+    :param offset: data 在文件中的起始字节（报告中的范围为文件内偏移）
+    :param final: 是否为文件结尾；否则最后一段可能不完整，留给下一块
+    :param spans: 为列表时按顺序追加每条取出元素的字节范围（文件内偏移）
+    :return: ([(p属性, 文本), ...], 已处理到的位置)
+    """
+    report = report if report is not None else ScanReport()
+    rows = []
+    starts = [m.start() for m in _D_TAG.finditer(data)]
+    if not final:
+        # 最后一个 <d 之后的内容可能被块边界截断
+        if not starts:
+            return rows, max(len(data) - 2, 0)
+        consumed = starts.pop()
+    else:
+        consumed = len(data)
+    starts.append(consumed)
+
+    for start, end in zip(starts, starts[1:]):
+        match = _ELEMENT.match(data, start, end)
+        if match is None:
+            reason = TRUNCATED if final and end == len(data) and b"</d" not in data[start:end] else MALFORMED
+            report.damaged.append((offset + start, offset + end, reason))
+            continue
+        try:
+            p = match.group(2).decode("utf-8")
+            text = match.group(3).decode("utf-8") if match.group(3) else None
+        except UnicodeDecodeError:
+            report.damaged.append((offset + start, offset + match.end(), ENCODING))
+            continue
+        if text is not None:
+            if _CONTROL.search(text):
+                text = _CONTROL.sub("", text)
+                report.repaired += 1
+            text = unescape(normalize_newlines(text))
+        rows.append((unescape(p), text))
+        if spans is not None:
+            spans.append((offset + start, offset + match.end()))
+        report.recovered += 1
+    return rows, consumed
+
+
+def scan_file(path, report: ScanReport = None, chunk: int = 1 << 22,
+              with_spans: bool = False) -> Iterator[tuple]:
+    """
+    按块流式扫描文件（内存只与块大小有关）
+
+    :param path: 文件路径
+    :param report: 扫描报告
+    :param chunk: 每次读取的字节数
+    :param with_spans: 同时给出每条元素在文件中的字节范围
+    :return: 生成 (p属性, 文本)；with_spans 时生成 (p属性, 文本, 起始字节, 结束字节)
+    """
+    offset, pending = 0, b""
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(chunk)
+            data = pending + block
+            spans = [] if with_spans else None
+            rows, consumed = scan_bytes(data, report, offset, final=not block, spans=spans)
+            if with_spans:
+                yield from ((p, text, start, end) for (p, text), (start, end) in zip(rows, spans))
+            else:
+                yield from rows
+            if not block:
+                return
+            offset += consumed
+            pending = data[consumed:]
@@ -0,0 +1,308 @@
+# dm_simulate.py
+"""
+虚拟时钟容量预估
+
+用真实的发送循环（SendJob：发送间隔、重试队列、熔断、死信）对接服务器模型
+（mock_bili_server.MockBackend：响应延迟、错误率、按账号配额），所有等待只推进虚拟时钟，
+10万条的任务几秒内跑完，报告预计完成时间和各阶段耗时占比（瓶颈）。
+
+用法：
+    python dm_simulate.py danmaku.xml --latency 0.2 --p509 0.02 --quota 5000
+    python dm_simulate.py --rows 100000 --min-delay 1.5 --json plan.json
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from collections import Counter
+from typing import Callable, List, Optional
+
+from circuit_breaker import BreakerRegistry
+from clock_sync import ServerClock
+from credential_monitor import CredentialMonitor
+from dead_letter import DeadLetterStore
+from dm_engine import SendJob
+from dm_store import format_time, load_xml
+from instrument import Instrumentation
+from metrics_exporter import RestoreMetrics
+from mock_bili_server import MockBackend, MockConfig
+from word_filter import WordFilter
+
+# 阶段 -> 报告中的说明
+STAGE_LABELS = {
+    "wait": "发送间隔",
+    "network": "请求耗时",
+    "retry": "等待重试到期",
+    "breaker": "熔断冷却",
+    "build": "构造请求",
+}
+
+# 虚拟时间上限，超过仍未完成视为按当前设置无法完成
+DEFAULT_HORIZON = 30 * 86400
+
+SIM_ACCOUNT = "simulated"
+
+
+class VirtualClock:
+    """
+    虚拟时钟（接口与 time 模块的 monotonic / perf_counter / time / sleep 一致）
+
+    sleep() 不真正等待，只把时间向前推进。
+    """
+
+    def __init__(self, epoch: float = None):
+        self.epoch = time.time() if epoch is None else epoch
+        self.now = 0.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    perf_counter = monotonic
+
+    def time(self) -> float:
+        return self.epoch + self.now
+
+    def sleep(self, seconds: float) -> None:
+        if seconds > 0:
+            self.now += seconds
+
+
+class ModelTransport:
+    """把发送请求交给服务器模型，按模型延迟推进虚拟时钟"""
+
+    def __init__(self, backend: MockBackend, clock: VirtualClock, sessdata: str = SIM_ACCOUNT):
+        self.backend = backend
+        self.clock = clock
+        self.cookies = {"SESSDATA": sessdata}
+
+    def __call__(self, data: dict):
+        self.clock.sleep(self.backend.delay())
+        status, payload = self.backend.handle("POST", "/x/v2/dm/post", {}, data, self.cookies)
+        # 与真实请求一致：412 的响应体不解析
+        return status, payload if status != 412 else None
+
+
+class _CountingDeadLetters(DeadLetterStore):
+    """只统计原因，不写死信文件"""
+
+    def __init__(self):
+        super().__init__(path="")
+        self.reasons = Counter()
+
+    def add(self, dm, oid, code, reason, message=""):
+        self.reasons[reason] += 1
+
+
+class SimulationReport:
+    """
+    模拟结果
+
+    :param total: 弹幕总数
+    :param done: 已处理条数（成功 + 死信）
+    :param success: 成功条数
+    :param dead: 死信条数
+    :param virtual_s: 虚拟耗时（秒），即预计完成时间
+    :param wall_s: 模拟本身的实际耗时（秒）
+    :param finished: 是否在虚拟时间上限内处理完
+    :param stages: Instrumentation 阶段汇总（虚拟时间）
+    :param counters: Instrumentation 计数（http_* / code_*）
+    :param dead_reasons: 死信原因 -> 条数
+    """
+
+    def __init__(self, total: int, done: int, success: int, dead: int, virtual_s: float, wall_s: float,
+                 finished: bool, stages: dict, counters: dict, dead_reasons: dict):
+        self.total = total
+        self.done = done
+        self.success = success
+        self.dead = dead
+        self.virtual_s = virtual_s
+        self.wall_s = wall_s
+        self.finished = finished
+        self.stages = stages
+        self.counters = counters
+        self.dead_reasons = dead_reasons
+
+    @property
+    def throughput(self) -> float:
+        """每小时处理条数"""
+        return self.done / self.virtual_s * 3600 if self.virtual_s else 0.0
+
+    def bottlenecks(self) -> List[tuple]:
+        """[(阶段, 说明, 虚拟秒数, 占比), ...]，按耗时从高到低"""
+        total = self.virtual_s or 1.0
+        return [(name, STAGE_LABELS.get(name, name), s["total_s"], s["total_s"] / total)
+                for name, s in self.stages.items()]
+
+    def to_dict(self) -> dict:
+        return {
+            "total": self.total,
+            "done": self.done,
+            "success": self.success,
+            "dead": self.dead,
+            "finished": self.finished,
+            "virtual_s": round(self.virtual_s, 3),
+            "wall_s": round(self.wall_s, 3),
+            "throughput_per_hour": round(self.throughput, 1),
+            "stages": self.stages,
+            "counters": self.counters,
+            "dead_reasons": self.dead_reasons
+        }
+
+    def summary(self) -> str:
+        head = "预计完成" if self.finished else "在模拟上限内未完成，已运行"
+        lines = [
+            f"{head} {format_time(self.virtual_s)}（模拟用时 {self.wall_s:.1f}s）",
+            f"处理 {self.done}/{self.total} 条：成功 {self.success}，死信 {self.dead}，"
+            f"约 {self.throughput:.0f} 条/小时"
+        ]
+        lines.append("耗时分布：")
+        for _, label, seconds, share in self.bottlenecks():
+            if share >= 0.001:
+                lines.append(f"  {label:<8}{format_time(seconds):>12}{share:>8.1%}")
+        if self.dead_reasons:
+            lines.append("死信原因：" + "，".join(f"{k} {v}" for k, v in self.dead_reasons.most_common()))
+        errors = {k: v for k, v in self.counters.items()
+                  if k.startswith(("code_", "http_")) and k not in ("code_0", "http_200")}
+        if errors:
+            lines.append("错误响应：" + "，".join(f"{k} ×{v}" for k, v in sorted(errors.items())))
+        return "\n".join(lines)
+
+
+def virtual_config(config: dict, model: MockConfig = None, seed: int = 0) -> dict:
+    """
+    把任务配置换成虚拟时钟下的模拟配置
+
+    发送间隔、重试、熔断等沿用原配置，请求交给服务器模型，指标、死信、熔断器、敏感词学习
+    都换成只在内存中的新对象，不写断点和任务历史，也不影响界面上真实任务的统计。
+
+    :param config: SendJob 配置（至少包含 danmaku_list / oid / csrf / min_delay / retry_limit / account）
+    :param model: 服务器模型，为空时全部成功且无延迟
+    :param seed: 随机种子（发送间隔抖动、退避抖动、服务器模型）
+    :return: 新的配置（clock 为 VirtualClock）
+    """
+    model = model or MockConfig()
+    if model.seed is None:
+        model.seed = seed
+    clock = VirtualClock()
+    metrics = RestoreMetrics()
+    return dict(
+        config,
+        simulate_mode=False,
+        server_clock=ServerClock(url="", clock=clock.monotonic),
+        instrument=Instrumentation(enabled=True, clock=clock.perf_counter),
+        metrics=metrics,
+        sent_history=set(),
+        dead_letters=_CountingDeadLetters(),
+        breakers=BreakerRegistry(metrics=metrics, clock=clock.monotonic),
+        credential_monitor=CredentialMonitor(url=""),
+        word_filter=WordFilter(),
+        save_checkpoint=lambda idx: None,
+        history=None,
+        clock=clock,
+        rng=random.Random(seed),
+        poll_interval=float("inf"),
+        transport=ModelTransport(MockBackend(model, clock=clock.time), clock)
+    )
+
+
+def job_report(job: SendJob, wall_s: float) -> SimulationReport:
+    """由运行结束的 SendJob（virtual_config 配置）生成模拟结果"""
+    config = job.config
+    snapshot = config['instrument'].snapshot()
+    total = len(config['danmaku_list'])
+    done = job.success_count + job.dead_count
+    return SimulationReport(
+        total=total, done=done, success=job.success_count, dead=job.dead_count,
+        virtual_s=config['clock'].now, wall_s=wall_s, finished=done >= total,
+        stages=snapshot["stages"], counters=snapshot["counters"],
+        dead_reasons=config['dead_letters'].reasons
+    )
+
+
+def simulate(danmaku_list: List[dict], model: MockConfig = None, min_delay: float = 1.5,
+             retry_limit: int = 3, seed: int = 0, horizon: float = DEFAULT_HORIZON,
+             on_log: Optional[Callable[[str, bool], None]] = None) -> SimulationReport:
+    """
+    在虚拟时钟下运行一次完整的发送任务
+
+    :param danmaku_list: 弹幕列表（与界面发送时相同的字典）
+    :param model: 服务器模型（延迟、错误率、配额），为空时全部成功且无延迟
+    :param min_delay: 发送间隔（与界面设置相同）
+    :param retry_limit: 每条最多尝试次数
+    :param seed: 随机种子（发送间隔抖动、退避抖动、服务器模型）
+    :param horizon: 虚拟时间上限（秒），超过后停止并报告未完成
+    :param on_log: 日志回调 (内容, 是否错误)
+    :return: 模拟结果
+    """
+    config = virtual_config({
+        'danmaku_list': danmaku_list,
+        'headers': {},
+        'oid': 1,
+        'csrf': SIM_ACCOUNT,
+        'min_delay': min_delay,
+        'retry_limit': retry_limit,
+        'api_url': "",
+        'account': SIM_ACCOUNT
+    }, model, seed)
+    clock = config['clock']
+
+    def progress(done, total):
+        if clock.now > horizon:
+            job.stop()
+
+    job = SendJob(config, on_progress=progress, on_log=on_log)
+    started = time.perf_counter()
+    job.run()
+    return job_report(job, time.perf_counter() - started)
+
+
+def synthetic_list(rows: int) -> List[dict]:
+    """按条数生成占位弹幕（模拟只关心条数和发送顺序）"""
+    return [{"time": float(i), "mode": 1, "font_size": 25, "color": 16777215, "content": f"sim{i}"}
+            for i in range(rows)]
+
+
+def model_args(parser):
+    """服务器模型参数（与 mock_bili_server 命令行一致）"""
+    parser.add_argument("--latency", type=float, default=0.1, help="基础响应延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.1, help="随机延迟上限（秒）")
+    parser.add_argument("--p412", type=float, default=0.0)
+    parser.add_argument("--p509", type=float, default=0.0)
+    parser.add_argument("--p400", type=float, default=0.0)
+    parser.add_argument("--quota", type=int, default=None, help="每账号成功条数上限")
+    parser.add_argument("--min-delay", type=float, default=1.5, help="发送间隔（秒）")
+    parser.add_argument("--retry-limit", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def model_from_args(args) -> MockConfig:
+    return MockConfig(latency=args.latency, jitter=args.jitter, p412=args.p412, p509=args.p509,
+                      p400=args.p400, quota=args.quota, seed=args.seed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="虚拟时钟容量预估")
+    parser.add_argument("file", nargs="?", default=None, help="弹幕XML文件")
+    parser.add_argument("--rows", type=int, default=None, help="不读文件，按条数模拟")
+    model_args(parser)
+    parser.add_argument("--horizon", type=float, default=DEFAULT_HORIZON / 86400, help="虚拟时间上限（天）")
+    parser.add_argument("--json", default=None, help="结果输出文件")
+    args = parser.parse_args(argv)
+    if args.file:
+        danmaku_list = load_xml(args.file).to_dicts()
+    elif args.rows:
+        danmaku_list = synthetic_list(args.rows)
+    else:
+        parser.error("需要弹幕文件或 --rows")
+
+    report = simulate(danmaku_list, model_from_args(args), args.min_delay, args.retry_limit,
+                      args.seed, args.horizon * 86400)
+    print(report.summary())
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report.to_dict(), f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
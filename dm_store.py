@@ -0,0 +1,597 @@
+# dm_store.py
+"""
+列式弹幕存储与选区索引
+
+解析后的弹幕按列存入 array（时间 float64、模式/字号/池 int8 等），内容单独存列表。
+在此之上维护：
+- 按时间排序的序号索引：时间段选区用二分查找定位，不再逐条比较字典
+- 模式 / 弹幕池索引：值 -> 该值的全部序号
+
+    store = DanmakuStore.from_dicts(danmaku_list)
+    rows = store.select(parse_time("12:00"), parse_time("18:30"), modes=MODE_GROUPS["scroll"], pools={0})
+    danmaku_list = store.to_dicts(rows)
+"""
+import bisect
+import mmap
+import os
+import re
+import xml.etree.ElementTree as ET
+from array import array
+from collections import deque
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from dm_scan import INVALID, ScanReport, normalize_newlines, scan_bytes, unescape
+
+_D_TAG = re.compile(rb"<d[\s>/]")
+# 常规写法：<d p="时间,模式,字号,颜色,时间戳,弹幕池,用户hash,dmid[,权重]">文本</d>
+# 整数字段限制位数，匹配到的值一定在对应列的取值范围内；其余行走容错路径逐条校验
+_FAST_ROW = re.compile(rb'<d p="(-?[0-9]+(?:\.[0-9]+)?),([0-9]{1,2}),([0-9]{1,4}),([0-9]{1,9})(?:\.[0-9]*)?,'
+                       rb'([0-9]{1,18}),([0-9]{1,2}),[^,"]*,[^,"]*(?:,([0-9]{1,2})(?:,[^"]*)?)?">'
+                       rb'([^<\x00-\x08\x0b\x0c\x0e-\x1f]*)</d>')
+_ENCODING = re.compile(rb"""encoding\s*=\s*["']([^"']+)""")
+
+# 界面/命令行中的模式分组
+MODE_GROUPS = {
+    "scroll": {1, 2, 3},
+    "bottom": {4},
+    "top": {5},
+    "reverse": {6},
+    "advanced": {7},
+}
+
+MODE_GROUP_NAMES = {
+    "scroll": "滚动",
+    "bottom": "底部",
+    "top": "顶部",
+    "reverse": "逆向",
+    "advanced": "高级",
+}
+
+
+def _int_range(typecode: str) -> Tuple[int, int]:
+    bits = array(typecode).itemsize * 8
+    if typecode.isupper():
+        return 0, (1 << bits) - 1
+    return -(1 << bits - 1), (1 << bits - 1) - 1
+
+
+# 整数列 -> 取值范围（超出时 array 抛出 OverflowError）
+_RANGES = {name: _int_range(code) for name, code in
+           (("mode", "b"), ("font_size", "h"), ("color", "L"), ("ts", "q"), ("pool", "b"), ("weight", "b"))}
+# 发送时不使用的列：超出范围时按边界值保存，不丢弃整条弹幕
+_CLAMPED = {"ts", "weight"}
+
+
+def parse_time(text) -> Optional[float]:
+    """
+    解析视频时间
+
+    :param text: "HH:MM:SS"、"MM:SS"、秒数字符串或数字；空值返回None
+    :return: 秒
+    """
+    if text is None:
+        return None
+    if isinstance(text, (int, float)):
+        return float(text)
+    text = text.strip()
+    if not text:
+        return None
+    seconds = 0.0
+    for part in text.split(":"):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+def in_selection(dm: dict, start: Optional[float] = None, end: Optional[float] = None,
+                 modes: Optional[Set[int]] = None, pools: Optional[Set[int]] = None) -> bool:
+    """单条弹幕是否在选区内（条件与 DanmakuStore.select 一致，供逐条流式处理使用）"""
+    return ((start is None or dm["time"] >= start) and (end is None or dm["time"] <= end) and
+            (modes is None or dm["mode"] in modes) and (pools is None or dm.get("pool_type", 0) in pools))
+
+
+def format_time(seconds: float) -> str:
+    seconds = int(seconds)
+    h, rest = divmod(seconds, 3600)
+    m, s = divmod(rest, 60)
+    return f"{h}:{m:02d}:{s:02d}" if h else f"{m:02d}:{s:02d}"
+
+
+class DanmakuStore:
+    """
+    列式弹幕存储
+    功能：
+    - 数值字段存入定长数组，内存约为字典列表的几分之一
+    - select() 按时间段 / 模式 / 弹幕池筛选，返回文件顺序的序号
+    - to_dicts() 转回发送流程使用的字典列表
+    """
+
+    def __init__(self):
+        self.time = array("d")
+        self.mode = array("b")
+        self.font_size = array("h")
+        self.color = array("L")
+        self.ts = array("q")
+        self.pool = array("b")
+        self.weight = array("b")
+        self.content: List[str] = []
+        self._time_order = None
+        self._sorted_time = None
+        self._mode_index = None
+        self._pool_index = None
+
+    def __len__(self) -> int:
+        return len(self.content)
+
+    def append(self, time: float, mode: int, font_size: int, color: int, content: str,
+               pool: int = 0, weight: int = 0, ts: int = 0) -> bool:
+        """
+        追加一条（先转换并校验全部字段再写入，字段无效时抛出 ValueError，各列保持等长）
+
+        :return: 权重或时间戳是否超出范围、已按边界值保存
+        """
+        time = float(time)
+        fields = [("mode", int(mode)), ("font_size", int(font_size)), ("color", int(color)),
+                  ("ts", int(ts)), ("pool", int(pool)), ("weight", int(weight))]
+        clamped = False
+        for i, (name, value) in enumerate(fields):
+            low, high = _RANGES[name]
+            if low <= value <= high:
+                continue
+            if name not in _CLAMPED:
+                raise ValueError(f"{name} 超出范围: {value}")
+            fields[i] = (name, min(max(value, low), high))
+            clamped = True
+        self.time.append(time)
+        for name, value in fields:
+            getattr(self, name).append(value)
+        self.content.append(content)
+        self._time_order = None
+        self._mode_index = None
+        self._pool_index = None
+        return clamped
+
+    def extend(self, other: "DanmakuStore") -> None:
+        """追加另一份存储（按顺序合并分片解析结果）"""
+        for name in ("time", "mode", "font_size", "color", "ts", "pool", "weight"):
+            getattr(self, name).extend(getattr(other, name))
+        self.content.extend(other.content)
+        self._time_order = None
+        self._mode_index = None
+        self._pool_index = None
+
+    @classmethod
+    def from_dicts(cls, danmaku_list: Iterable[dict]) -> "DanmakuStore":
+        store = cls()
+        for dm in danmaku_list:
+            store.append(dm["time"], dm["mode"], dm.get("font_size", 25), dm.get("color", 16777215),
+                         dm["content"], dm.get("pool_type", 0), dm.get("weight", 0), dm.get("ts", 0))
+        return store
+
+    def row(self, i: int) -> dict:
+        return {
+            "time": self.time[i],
+            "mode": self.mode[i],
+            "font_size": self.font_size[i],
+            "color": self.color[i],
+            "pool_type": self.pool[i],
+            "weight": self.weight[i],
+            "content": self.content[i]
+        }
+
+    def to_dicts(self, rows: Iterable[int] = None) -> List[dict]:
+        if rows is None:
+            rows = range(len(self))
+        return [self.row(i) for i in rows]
+
+    # ---- 索引 ----
+
+    def _build_time_index(self) -> None:
+        times = self.time
+        self._time_order = array("l", sorted(range(len(times)), key=times.__getitem__))
+        self._sorted_time = array("d", (times[i] for i in self._time_order))
+
+    def _build_value_index(self, column) -> Dict[int, array]:
+        index: Dict[int, array] = {}
+        for i, value in enumerate(column):
+            rows = index.get(value)
+            if rows is None:
+                rows = index[value] = array("l")
+            rows.append(i)
+        return index
+
+    def mode_index(self) -> Dict[int, array]:
+        if self._mode_index is None:
+            self._mode_index = self._build_value_index(self.mode)
+        return self._mode_index
+
+    def pool_index(self) -> Dict[int, array]:
+        if self._pool_index is None:
+            self._pool_index = self._build_value_index(self.pool)
+        return self._pool_index
+
+    def time_range(self, start: Optional[float] = None, end: Optional[float] = None) -> array:
+        """
+        时间段内的序号（按时间排序）
+
+        :param start: 起始秒（含），None表示从头
+        :param end: 结束秒（含），None表示到尾
+        """
+        if self._time_order is None:
+            self._build_time_index()
+        lo = 0 if start is None else bisect.bisect_left(self._sorted_time, start)
+        hi = len(self._sorted_time) if end is None else bisect.bisect_right(self._sorted_time, end)
+        return self._time_order[lo:hi]
+
+    def select(self, start: Optional[float] = None, end: Optional[float] = None,
+               modes: Optional[Set[int]] = None, pools: Optional[Set[int]] = None) -> List[int]:
+        """
+        按时间段、模式、弹幕池筛选
+
+        :return: 符合条件的序号（文件顺序）
+        """
+        if start is None and end is None:
+            if modes is None and pools is None:
+                return list(range(len(self)))
+            # 无时间条件时从值索引取候选，避免扫描全部
+            if modes is not None:
+                index = self.mode_index()
+                candidates = [i for m in modes for i in index.get(m, ())]
+            else:
+                index = self.pool_index()
+                candidates = [i for p in pools for i in index.get(p, ())]
+        else:
+            candidates = self.time_range(start, end)
+
+        mode, pool = self.mode, self.pool
+        return sorted(i for i in candidates
+                      if (modes is None or mode[i] in modes) and (pools is None or pool[i] in pools))
+
+    def write_xml(self, path, rows: Iterable[int] = None) -> int:
+        """
+        导出为B站格式XML
+
+        :return: 导出条数
+        """
+        from xml.sax.saxutils import escape  # 连带导入 urllib.request，只在导出时加载
+        if rows is None:
+            rows = range(len(self))
+        count = 0
+        with open(path, "w", encoding="utf-8") as f:
+            f.write('<?xml version="1.0" encoding="UTF-8"?><i>\n')
+            for i in rows:
+                f.write(f'<d p="{self.time[i]:.5f},{self.mode[i]},{self.font_size[i]},{self.color[i]},'
+                        f'{self.ts[i]},{self.pool[i]},0,{i},{self.weight[i]}">'
+                        f'{escape(self.content[i])}</d>\n')
+                count += 1
+            f.write("</i>\n")
+        return count
+
+
+def iter_elements(path, encoding: str = None) -> Iterator[Tuple[Optional[str], Optional[str]]]:
+    """
+    流式遍历 <d> 元素（ElementTree，每个元素读取后立即从树上移除，内存占用与文件大小无关）
+
+    :param encoding: 非UTF-8编码（如gbk）；expat 不支持多字节编码，按该编码解码后再交给解析器
+    :return: 生成 (p属性, 文本)
+    """
+    parser = ET.XMLPullParser(events=("start", "end"))
+    root = None
+    with (open(path, encoding=encoding) if encoding else open(path, "rb")) as f:
+        while True:
+            block = f.read(1 << 20)
+            if block:
+                parser.feed(block)
+            else:
+                parser.close()
+            for event, elem in parser.read_events():
+                if root is None:
+                    root = elem
+                if event == "end" and elem.tag == "d":
+                    yield elem.get("p"), elem.text
+                    root.clear()
+            if not block:
+                return
+
+
+def count_rows(path, chunk: int = 1 << 20) -> int:
+    """快速统计 <d> 元素个数（按字节块扫描，不解析XML），用于进度估计"""
+    count, tail = 0, b""
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(chunk)
+            if not block:
+                return count
+            data = tail + block
+            count += len(_D_TAG.findall(data))
+            tail = data[-2:]
+
+
+def _exotic_encoding(head: bytes) -> Optional[str]:
+    """文件声明的非UTF-8编码，UTF-8/ASCII 或未声明时返回None"""
+    if head.startswith((b"\xff\xfe", b"\xfe\xff")):
+        return "utf-16"
+    match = _ENCODING.search(head)
+    if match and match.group(1).lower() not in (b"utf-8", b"utf8", b"us-ascii", b"ascii"):
+        return match.group(1).decode("ascii", "replace")
+    return None
+
+
+def _append_rows(store: DanmakuStore, rows: Iterable[Tuple[Optional[str], Optional[str]]],
+                 report: ScanReport = None, spans: List[Tuple[int, int]] = None) -> None:
+    """
+    逐条追加 (p属性, 文本)，无效行跳过
+
+    :param report: 扫描报告，记录按边界值保存的条数；与 spans 同时给出时把无效行的字节范围记为损坏
+    :param spans: 与 rows 一一对应的字节范围
+    """
+    for i, (p, text) in enumerate(rows):
+        try:
+            params = p.split(",")
+            clamped = store.append(float(params[0]), int(params[1]), int(params[2]),
+                                   int(params[3].split(".")[0]), (text or "").strip(),
+                                   int(params[5]) if len(params) > 5 else 0,
+                                   int(params[8]) if len(params) > 8 else 0,
+                                   int(params[4]) if len(params) > 4 else 0)
+            if clamped and report is not None:
+                report.clamped += 1
+        except (AttributeError, ValueError, IndexError):
+            if report is not None and spans is not None:
+                report.damaged.append((*spans[i], INVALID))
+                report.recovered -= 1
+
+
+def _extend(store: DanmakuStore, rows: List[Tuple[bytes, ...]]) -> None:
+    """按列写入快速路径的字段元组（float/int 直接接受字节串，不经过 str）"""
+    if not rows:
+        return
+    times, modes, sizes, colors, tss, pools, weights, texts = zip(*rows)
+    # 先整块解码文本（\x00 不会出现在常规行中，用作分隔符）：非UTF-8时抛出 UnicodeDecodeError，数组保持不变
+    joined = normalize_newlines(b"\x00".join(texts).decode())
+    if "&" in joined:
+        joined = unescape(joined)
+    content = list(map(str.strip, joined.split("\x00")))
+    store.time.extend(map(float, times))
+    store.mode.extend(map(int, modes))
+    store.font_size.extend(map(int, sizes))
+    store.color.extend(map(int, colors))
+    store.ts.extend(map(int, tss))
+    store.pool.extend(map(int, pools))
+    store.weight.extend(map(int, weights) if b"" not in weights else (int(w) if w else 0 for w in weights))
+    store.content.extend(content)
+    store._time_order = None
+    store._mode_index = None
+    store._pool_index = None
+
+
+def _lex(store: DanmakuStore, data, start: int, end: int, report: ScanReport, fast: bool = True) -> bool:
+    """
+    解析 data[start:end]（起止均在 <d 边界上）
+
+    整块都是常规写法时一次 findall 取出全部字段；否则常规行仍走快速路径，
+    其间的片段（属性顺序、单引号、控制字符、非UTF-8、损坏）交给容错扫描，保持文件顺序。
+
+    :param fast: 先尝试整块 findall（上一块有非常规写法时跳过，避免重复匹配）
+    :return: 本块是否全部为常规写法
+    """
+    if fast:
+        rows = _FAST_ROW.findall(data, start, end)
+        if len(rows) == len(_D_TAG.findall(data, start, end)):
+            try:
+                _extend(store, rows)
+                report.recovered += len(rows)
+                return True
+            except UnicodeDecodeError:
+                pass
+
+    clean, cursor, batch = True, start, []
+    for match in _FAST_ROW.finditer(data, start, end):
+        row = match.groups(b"")
+        try:
+            row[-1].decode()
+        except UnicodeDecodeError:
+            continue
+        # 行间通常只有换行；至少4字节（<d/>）才可能夹着未匹配的元素
+        if match.start() - cursor >= 4 and _D_TAG.search(data, cursor, match.start()):
+            _extend(store, batch)
+            report.recovered += len(batch)
+            batch = []
+            _scan_append(store, data[cursor:match.start()], report, cursor)
+            clean = False
+        batch.append(row)
+        cursor = match.end()
+    _extend(store, batch)
+    report.recovered += len(batch)
+    if _D_TAG.search(data, cursor, end):
+        _scan_append(store, data[cursor:end], report, cursor)
+        clean = False
+    return clean
+
+
+def _scan_append(store: DanmakuStore, data: bytes, report: ScanReport, offset: int) -> None:
+    """容错扫描一段字节并追加，字段无效的行记入报告"""
+    spans = []
+    rows, _ = scan_bytes(data, report, offset, spans=spans)
+    _append_rows(store, rows, report, spans)
+
+
+def _open_mmap(path) -> Optional[mmap.mmap]:
+    """只读映射文件，空文件返回None"""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _needs_elementtree(mm) -> Tuple[bool, Optional[str]]:
+    """非UTF-8编码、DTD、CDATA 不走快速路径，返回 (是否交给ElementTree, 编码)"""
+    head = mm[:4096]
+    encoding = _exotic_encoding(head)
+    return bool(encoding or b"<!DOCTYPE" in head or mm.find(b"<![CDATA[") != -1), encoding
+
+
+def _chunk_bounds(mm, start: int, end: int, chunk: int) -> Iterator[Tuple[int, int]]:
+    """把 [start, end) 切成约 chunk 字节的块，边界对齐到 <d"""
+    while start < end:
+        match = _D_TAG.search(mm, start + chunk, end)
+        stop = match.start() if match else end
+        yield start, stop
+        start = stop
+
+
+def _lex_range(store: DanmakuStore, mm, start: int, end: int, report: ScanReport, chunk: int) -> None:
+    fast = True
+    for start, stop in _chunk_bounds(mm, start, end, chunk):
+        fast = _lex(store, mm, start, stop, report, fast)
+
+
+def load_xml(path, report: ScanReport = None, chunk: int = 1 << 22) -> DanmakuStore:
+    """
+    解析XML弹幕文件到列式存储
+
+    文件以内存映射方式读取，按 <d 边界分块，常规写法的行用一个正则取出字段后直接写入数组，
+    不构造 Element 和拆分后的字符串列表；其余片段用容错扫描（dm_scan，损坏段跳过并记入报告）。
+    非UTF-8编码、DTD、CDATA 整份交给 ElementTree。
+
+    :param path: 文件路径
+    :param report: 扫描报告（dm_scan.ScanReport），记录损坏的字节范围
+    :param chunk: 分块字节数
+    """
+    store = DanmakuStore()
+    report = report if report is not None else ScanReport()
+    mm = _open_mmap(path)
+    if mm is None:
+        return store
+    with mm:
+        exotic, encoding = _needs_elementtree(mm)
+        if exotic:
+            _append_rows(store, iter_elements(path, encoding), report)
+        else:
+            _lex_range(store, mm, 0, len(mm), report, chunk)
+    return store
+
+
+def iter_chunks(path, report: ScanReport = None, chunk: int = 1 << 20,
+                batch: int = 20000) -> Iterator[Tuple[DanmakuStore, int, int]]:
+    """
+    逐块解析（界面后台加载用：每块解析完即可显示，随时停止迭代即取消）
+
+    :param path: 文件路径
+    :param report: 扫描报告
+    :param chunk: 快速路径每块字节数
+    :param batch: ElementTree 路径每块条数（无法得知字节进度，已处理字节数报告为0）
+    :return: 生成 (本块的存储, 已处理字节数, 文件总字节数)
+    """
+    report = report if report is not None else ScanReport()
+    mm = _open_mmap(path)
+    if mm is None:
+        return
+    with mm:
+        size = len(mm)
+        exotic, encoding = _needs_elementtree(mm)
+        if exotic:
+            elements = iter_elements(path, encoding)
+            while True:
+                rows = list(islice(elements, batch))
+                if not rows:
+                    return
+                store = DanmakuStore()
+                _append_rows(store, rows, report)
+                yield store, 0, size
+        fast = True
+        for start, stop in _chunk_bounds(mm, 0, size, chunk):
+            store = DanmakuStore()
+            fast = _lex(store, mm, start, stop, report, fast)
+            yield store, stop, size
+
+
+def shard_ranges(mm, shards: int) -> List[Tuple[int, int]]:
+    """把文件切成约 shards 段字节范围，边界对齐到 <d（每段都从一个完整元素开始）"""
+    size = len(mm)
+    step = max(size // max(shards, 1), 1)
+    bounds = [0]
+    for i in range(1, shards):
+        match = _D_TAG.search(mm, max(i * step, bounds[-1] + 1))
+        if match is None:
+            break
+        bounds.append(match.start())
+    bounds.append(size)
+    return list(zip(bounds, bounds[1:]))
+
+
+def _load_shard(path, start: int, end: int, chunk: int) -> Tuple[DanmakuStore, ScanReport]:
+    """子进程：解析一个字节范围（各自映射文件，不在进程间传递文件内容）"""
+    store, report = DanmakuStore(), ScanReport()
+    with _open_mmap(path) as mm:
+        _lex_range(store, mm, start, end, report, chunk)
+    return store, report
+
+
+def iter_shards(path, workers: int = None, shard_size: int = 1 << 24, report: ScanReport = None,
+                chunk: int = 1 << 22) -> Iterator[DanmakuStore]:
+    """
+    多进程分片解析，按文件顺序逐片产出
+
+    文件按 <d 边界切成约 shard_size 字节的分片交给进程池；同时在途的分片不超过 workers*2，
+    调用方逐片处理时内存有上限。只有一个分片或 workers=1 时在当前进程解析。
+
+    :param workers: 进程数，默认CPU核数
+    :param shard_size: 分片字节数
+    :param report: 扫描报告，各分片的报告按顺序合并
+    :return: 生成每个分片的 DanmakuStore
+    """
+    workers = workers or os.cpu_count() or 1
+    report = report if report is not None else ScanReport()
+    mm = _open_mmap(path)
+    if mm is None:
+        return
+    with mm:
+        exotic, encoding = _needs_elementtree(mm)
+        ranges = [] if exotic else shard_ranges(mm, -(-len(mm) // shard_size))
+    if exotic:
+        store = DanmakuStore()
+        _append_rows(store, iter_elements(path, encoding), report)
+        yield store
+        return
+
+    if workers == 1 or len(ranges) == 1:
+        for start, end in ranges:
+            store, part = _load_shard(path, start, end, chunk)
+            report.merge(part)
+            yield store
+        return
+
+    # 进程池只在多分片解析时导入（界面启动时不加载多进程模块）
+    from concurrent.futures import ProcessPoolExecutor
+    pending = deque()
+    with ProcessPoolExecutor(min(workers, len(ranges))) as pool:
+        try:
+            for start, end in ranges:
+                pending.append(pool.submit(_load_shard, path, start, end, chunk))
+                if len(pending) >= workers * 2:
+                    store, part = pending.popleft().result()
+                    report.merge(part)
+                    yield store
+            while pending:
+                store, part = pending.popleft().result()
+                report.merge(part)
+                yield store
+        finally:
+            # 调用方提前停止时不再启动剩余分片
+            for future in pending:
+                future.cancel()
+
+
+def load_xml_parallel(path, workers: int = None, report: ScanReport = None,
+                      shard_size: int = 1 << 24) -> DanmakuStore:
+    """
+    多进程解析整份文件，分片按文件顺序合并（结果与 load_xml 一致）
+
+    :param workers: 进程数，默认CPU核数
+    :param report: 扫描报告
+    :param shard_size: 分片字节数
+    """
+    store = DanmakuStore()
+    for part in iter_shards(path, workers, shard_size, report):
+        store.extend(part)
+    return store
@@ -0,0 +1,179 @@
+# dm_synth.py
+"""
+合成弹幕文件生成器
+
+生成 B站格式的 <d p="..."> XML 弹幕文件或 protobuf(DmSegMobileReply) 弹幕文件，
+行数可从一千到千万级，可按比例混入格式错误的行，供解析/校验基准测试使用。
+
+用法：
+    python dm_synth.py out.xml --rows 100000 --malformed 0.01
+    python dm_synth.py out.pb --rows 100000 --format pb
+"""
+import argparse
+import random
+from xml.sax.saxutils import escape
+
+MODES = [1, 1, 1, 1, 1, 1, 4, 5, 6, 7]
+FONT_SIZES = [25, 25, 25, 18, 36]
+COLORS = [16777215, 16777215, 16777215, 16711680, 65280, 255, 16776960, 16744319]
+WORDS = ["233333", "awsl", "前方高能", "哈哈哈哈", "名场面", "泪目", "好耶", "下次一定",
+         "空降成功", "来了来了", "经典", "yyds", "这个好", "打卡", "第一", "awsl!!!"]
+
+# 行级错误（ElementTree仍可解析整份文件，只是单条弹幕无效）
+MALFORMED_KINDS = ["missing_p", "short_p", "bad_number", "empty_text", "long_text", "bad_mode"]
+
+
+def random_row(rng: random.Random, index: int, duration: float):
+    """
+    生成一条正常弹幕
+
+    :return: (p属性字符串, 文本)
+    """
+    t = rng.random() * duration
+    mode = rng.choice(MODES)
+    p = (f"{t:.5f},{mode},{rng.choice(FONT_SIZES)},{rng.choice(COLORS)},"
+         f"{1600000000 + index},{0 if rng.random() < 0.95 else 1},"
+         f"{rng.getrandbits(32):08x},{10 ** 13 + index},{rng.randint(1, 11)}")
+    text = "".join(rng.choice(WORDS) for _ in range(rng.randint(1, 3)))
+    return p, text
+
+
+def malformed_row(rng: random.Random, index: int, duration: float):
+    """
+    生成一条格式错误的弹幕
+
+    :return: (p属性字符串或None, 文本)
+    """
+    p, text = random_row(rng, index, duration)
+    kind = rng.choice(MALFORMED_KINDS)
+    if kind == "missing_p":
+        return None, text
+    if kind == "short_p":
+        return ",".join(p.split(",")[:3]), text
+    if kind == "bad_number":
+        # 形似数字但无法转换或超出范围：时间 1.2.3 / 单独的点、模式 300、字号 99999、时间戳 1.5e9
+        params = p.split(",")
+        field, value = rng.choice([(0, "1.2.3"), (0, "."), (1, "300"), (2, "99999"), (4, "1.5e9")])
+        params[field] = value
+        return ",".join(params), text
+    if kind == "empty_text":
+        return p, ""
+    if kind == "long_text":
+        return p, "长" * 150
+    params = p.split(",")
+    params[1] = "9"
+    return ",".join(params), text
+
+
+def iter_rows(rows: int, malformed: float = 0.0, seed: int = 0, duration: float = 3600.0):
+    rng = random.Random(seed)
+    for i in range(rows):
+        if malformed and rng.random() < malformed:
+            yield malformed_row(rng, i, duration)
+        else:
+            yield random_row(rng, i, duration)
+
+
+def write_xml(path: str, rows: int, malformed: float = 0.0, seed: int = 0,
+              duration: float = 3600.0, chunk: int = 10000) -> None:
+    """
+    写出XML弹幕文件（分块写入，内存占用与行数无关）
+
+    :param path: 输出路径
+    :param rows: 行数
+    :param malformed: 错误行比例
+    :param seed: 随机种子
+    :param duration: 视频时长（秒）
+    """
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<i>\n'
+                '<chatserver>chat.bilibili.com</chatserver><chatid>10000</chatid>\n')
+        buf = []
+        for p, text in iter_rows(rows, malformed, seed, duration):
+            if p is None:
+                buf.append(f"<d>{escape(text)}</d>\n")
+            else:
+                buf.append(f'<d p="{p}">{escape(text)}</d>\n')
+            if len(buf) >= chunk:
+                f.write("".join(buf))
+                buf.clear()
+        f.write("".join(buf))
+        f.write("</i>\n")
+
+
+# ---------------- protobuf ----------------
+
+def _varint(value: int) -> bytes:
+    value &= (1 << 64) - 1
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _field_varint(number: int, value: int) -> bytes:
+    return _varint(number << 3) + _varint(value)
+
+
+def _field_bytes(number: int, value: bytes) -> bytes:
+    return _varint(number << 3 | 2) + _varint(len(value)) + value
+
+
+def encode_elem(p: str, text: str) -> bytes:
+    """
+    按 DanmakuElem 编码单条弹幕（id=1 progress=2 mode=3 fontsize=4 color=5
+    midHash=6 content=7 ctime=8 weight=9 pool=11 idStr=12）
+    """
+    params = p.split(",")
+    row_id = int(params[7])
+    return b"".join([
+        _field_varint(1, row_id),
+        _field_varint(2, int(float(params[0]) * 1000)),
+        _field_varint(3, int(params[1])),
+        _field_varint(4, int(params[2])),
+        _field_varint(5, int(params[3])),
+        _field_bytes(6, params[6].encode()),
+        _field_bytes(7, text.encode("utf-8")),
+        _field_varint(8, int(params[4])),
+        _field_varint(9, int(params[8])),
+        _field_varint(11, int(params[5])),
+        _field_bytes(12, str(row_id).encode())
+    ])
+
+
+def write_protobuf(path: str, rows: int, seed: int = 0, duration: float = 3600.0,
+                   chunk: int = 10000) -> None:
+    """写出 DmSegMobileReply 格式的protobuf弹幕文件（elems = 1，不含错误行）"""
+    with open(path, "wb") as f:
+        buf = []
+        for p, text in iter_rows(rows, 0.0, seed, duration):
+            buf.append(_field_bytes(1, encode_elem(p, text)))
+            if len(buf) >= chunk:
+                f.write(b"".join(buf))
+                buf.clear()
+        f.write(b"".join(buf))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="合成弹幕文件生成器")
+    parser.add_argument("output")
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--malformed", type=float, default=0.0, help="错误行比例（仅XML）")
+    parser.add_argument("--format", choices=["xml", "pb"], default="xml")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--duration", type=float, default=3600.0, help="视频时长（秒）")
+    args = parser.parse_args()
+
+    if args.format == "pb":
+        write_protobuf(args.output, args.rows, args.seed, args.duration)
+    else:
+        write_xml(args.output, args.rows, args.malformed, args.seed, args.duration)
+
+
+if __name__ == "__main__":
+    main()
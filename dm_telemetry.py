@@ -0,0 +1,105 @@
+# dm_telemetry.py
+"""
+发送遥测环形缓冲区
+
+固定容量的 NumPy 环形缓冲区，保存最近的 (时间, 成功, 失败, 速率, 请求耗时) 采样，
+写满后覆盖最旧的一条。绘图时按桶取最小/最大值降采样，点数只取决于桶数，
+任务运行多久重绘开销都不变，毛刺（单次慢请求、速率骤降）也不会被平均掉。
+
+    telemetry = TelemetryRing()
+    telemetry.extend(records)              # ProgressRing.read_since 的记录
+    x, y = telemetry.downsample(RATE, 400)
+"""
+import math
+from typing import Iterable, Tuple
+
+import numpy as np
+
+# 列序号
+TIME, SENT, FAILED, RATE, LATENCY = range(5)
+
+
+class TelemetryRing:
+    """
+    遥测采样环形缓冲区
+
+    :param capacity: 保留的采样数
+    :param window: 速率平滑的时间常数（秒）
+    """
+
+    def __init__(self, capacity: int = 4096, window: float = 5.0):
+        self.capacity = capacity
+        self.window = window
+        self.data = np.zeros((capacity, 5))
+        self.count = 0       # 累计写入条数
+        self.total = 0       # 任务总条数（显示进度百分比用）
+        self.start = None    # 第一条采样的时间戳
+
+    def __len__(self) -> int:
+        return min(self.count, self.capacity)
+
+    def clear(self) -> None:
+        self.count = 0
+        self.total = 0
+        self.start = None
+
+    def push(self, timestamp: float, sent: int, failed: int, latency: float) -> None:
+        """
+        写入一条采样（速率由与上一条的差值按时间常数平滑得到）
+
+        :param timestamp: 时间戳（秒）
+        :param sent: 累计成功条数
+        :param failed: 累计失败（死信）条数
+        :param latency: 最近一次请求耗时（秒）
+        """
+        if self.start is None:
+            self.start = timestamp
+        t = timestamp - self.start
+        rate = 0.0
+        if self.count:
+            last = self.data[(self.count - 1) % self.capacity]
+            dt = t - last[TIME]
+            if dt > 0:
+                instant = (sent + failed - last[SENT] - last[FAILED]) / dt
+                rate = last[RATE] + (instant - last[RATE]) * (1 - math.exp(-dt / self.window))
+            else:
+                rate = last[RATE]
+        self.data[self.count % self.capacity] = (t, sent, failed, rate, latency)
+        self.count += 1
+
+    def extend(self, records: Iterable[tuple]) -> None:
+        """写入 ProgressRing 记录 (时间戳, 已完成, 总数, 成功, 死信, 重试队列长度, 请求耗时)"""
+        for timestamp, _, total, success, dead, _, latency in records:
+            self.total = total
+            self.push(timestamp, success, dead, latency)
+
+    def columns(self) -> np.ndarray:
+        """按时间顺序排列的采样 (n, 5)"""
+        if self.count <= self.capacity:
+            return self.data[:self.count]
+        head = self.count % self.capacity
+        return np.concatenate((self.data[head:], self.data[:head]))
+
+    def latest(self):
+        return self.data[(self.count - 1) % self.capacity] if self.count else None
+
+    def downsample(self, column: int, buckets: int = 400) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        最小/最大值降采样
+
+        :param column: 列序号（SENT / FAILED / RATE / LATENCY）
+        :param buckets: 桶数，返回最多 2 * buckets 个点
+        :return: (时间, 数值)
+        """
+        samples = self.columns()
+        if len(samples) <= buckets * 2:
+            return samples[:, TIME], samples[:, column]
+        per = len(samples) // buckets
+        samples = samples[len(samples) - per * buckets:]  # 丢弃最旧的零头，保留最新采样
+        values = samples[:, column].reshape(buckets, per)
+        rows = np.arange(buckets) * per
+        low = rows + values.argmin(axis=1)
+        high = rows + values.argmax(axis=1)
+        # 每桶两个点按时间先后排列
+        index = np.stack((np.minimum(low, high), np.maximum(low, high)), axis=1).ravel()
+        return samples[index, TIME], samples[index, column]
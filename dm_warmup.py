@@ -0,0 +1,43 @@
+# dm_warmup.py
+"""
+启动预热
+
+界面脚本的模块顶部只导入显示窗口必需的部分，较重的依赖（requests、bilibili_api、
+numpy、http.server、多进程等）推迟到用到它的功能里再导入。窗口显示后调用 warm_up，
+在后台线程中提前导入这些模块，用户点击按钮时通常已经加载完毕：
+
+    window.show()
+    warm_up(("requests", "concurrent.futures.process"))
+
+未安装的模块直接跳过（用到该功能时再按原样报错）。
+"""
+import importlib
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional
+
+
+def warm_up(modules: Iterable[str],
+            on_done: Optional[Callable[[Dict[str, float]], None]] = None) -> threading.Thread:
+    """
+    在后台线程依次导入模块
+
+    :param modules: 模块名
+    :param on_done: 完成回调（在后台线程中调用），参数为 {模块名: 导入耗时秒数}，跳过的模块不计入
+    :return: 预热线程（守护线程，不阻止程序退出）
+    """
+    def run():
+        timings = {}
+        for name in modules:
+            start = time.perf_counter()
+            try:
+                importlib.import_module(name)
+            except ImportError:
+                continue
+            timings[name] = time.perf_counter() - start
+        if on_done:
+            on_done(timings)
+
+    thread = threading.Thread(target=run, name="warm-up", daemon=True)
+    thread.start()
+    return thread
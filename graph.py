@@ -1,16 +1,32 @@
+import os
 import sys
-import random
-import time
-import numpy as np
-from threading import Thread
-from queue import Queue
-import xml.etree.ElementTree as ET
-import pyqtgraph as pg
+from pathlib import Path
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QVBoxLayout, QHBoxLayout, QWidget, QLabel,
     QLineEdit, QPushButton, QComboBox, QCheckBox, QTextEdit, QFileDialog
 )
 from PyQt5.QtCore import Qt, QTimer
+from dm_store import load_xml
+from dm_warmup import warm_up
+
+API_BASE = os.environ.get("BILI_API_BASE", "https://api.bilibili.com")
+
+# numpy / pyqtgraph 在窗口显示后再导入（load_plotting），冷启动先出界面
+np = None
+pg = None
+
+# 窗口显示后在后台预先导入（pyqtgraph 含Qt部件，须在界面线程导入）
+WARM_MODULES = ("numpy", "dm_engine")
+
+
+def load_plotting():
+    """导入绘图依赖（重复调用无开销）"""
+    global np, pg
+    if pg is None:
+        import numpy
+        import pyqtgraph
+        pyqtgraph.setConfigOptions(antialias=True)  # 开启抗锯齿
+        np, pg = numpy, pyqtgraph
 
 class BiliDanmakuRestorer(QMainWindow):
     def __init__(self):
@@ -26,19 +42,23 @@ class BiliDanmakuRestorer(QMainWindow):
         self.part_combobox = QComboBox()
         
         # 数据存储
-        self.danmaku_queue = Queue()
-        self.progress_data = []
-        self.time_bins = []
+        self.store = None          # 已加载的弹幕
+        self.xml_path = None
+        self.density = None        # 弹幕时间密度（DensityPyramid）
+        self.sent_density = None   # 已发送弹幕的时间密度，发送中增量更新
         self.histogram = None
-        self.sending = False
+        self.sent_histogram = None
+        self.engine = None         # 发送引擎进程（EngineProcess）
+        self.engine_seq = 0        # 已读取的引擎进度记录数
+        self.telemetry = None      # 发送遥测（TelemetryRing），图表就绪后创建
+        self.sent_done = 0         # 已计入 sent_density 的完成条数
         
-        # 初始化UI
+        # 初始化UI（图表区先放占位，窗口显示后由 init_visualization 替换）
         self.init_ui()
         
-        # 设置定时器
+        # 设置定时器（图表就绪后启动）
         self.timer = QTimer()
         self.timer.timeout.connect(self.update_visualization)
-        self.timer.start(50)  # 20 FPS刷新率
 
     def init_ui(self):
         main_widget = QWidget()
@@ -49,11 +69,27 @@ class BiliDanmakuRestorer(QMainWindow):
         main_layout.addLayout(control_panel, stretch=1)
         
         # 右侧可视化面板
-        vis_widget = self.create_visualization_panel()
-        main_layout.addWidget(vis_widget, stretch=3)
+        self.vis_placeholder = QLabel("图表加载中…")
+        self.vis_placeholder.setAlignment(Qt.AlignCenter)
+        main_layout.addWidget(self.vis_placeholder, stretch=3)
+        self.main_layout = main_layout
+        self.vis_ready = False
         
         self.setCentralWidget(main_widget)
 
+    def init_visualization(self):
+        """导入 pyqtgraph 并创建图表，替换占位（首次需要图表时调用）"""
+        if self.vis_ready:
+            return
+        load_plotting()
+        from dm_telemetry import TelemetryRing
+        self.telemetry = TelemetryRing()
+        vis_widget = self.create_visualization_panel()
+        self.main_layout.replaceWidget(self.vis_placeholder, vis_widget)
+        self.vis_placeholder.deleteLater()
+        self.vis_ready = True
+        self.timer.start(50)  # 20 FPS刷新率
+
     def create_control_panel(self):
         layout = QVBoxLayout()
         
@@ -72,6 +108,10 @@ class BiliDanmakuRestorer(QMainWindow):
         # 分P选择
         layout.addWidget(QLabel("视频分P:"))
         layout.addWidget(self.part_combobox)
+        self.bvid_input.editingFinished.connect(self.fetch_parts)
+        
+        self.simulate_check = QCheckBox("模拟模式（不实际发送）")
+        layout.addWidget(self.simulate_check)
         
         # 文件操作
         self.xml_btn = QPushButton("加载弹幕文件")
@@ -98,12 +138,29 @@ class BiliDanmakuRestorer(QMainWindow):
         self.progress_plot = pg.PlotWidget(title="发送进度监控")
         self.progress_plot.setLabel('left', "完成百分比")
         self.progress_plot.setLabel('bottom', "时间 (s)")
-        self.progress_curve = self.progress_plot.plot(pen=pg.mkPen('y', width=2))
+        self.progress_plot.addLegend()
+        self.progress_curve = self.progress_plot.plot(pen=pg.mkPen('y', width=2), name="成功")
+        self.failed_curve = self.progress_plot.plot(pen=pg.mkPen('r', width=2), name="失败")
+        
+        # 发送速率与请求耗时
+        self.rate_plot = pg.PlotWidget(title="发送速率")
+        self.rate_plot.setLabel('left', "条/秒")
+        self.rate_plot.setLabel('bottom', "时间 (s)")
+        self.rate_curve = self.rate_plot.plot(pen=pg.mkPen('c', width=2))
+        self.latency_plot = pg.PlotWidget(title="请求耗时")
+        self.latency_plot.setLabel('left', "毫秒")
+        self.latency_plot.setLabel('bottom', "时间 (s)")
+        self.latency_curve = self.latency_plot.plot(pen=pg.mkPen('m', width=1))
+        curves = QHBoxLayout()
+        curves.addWidget(self.rate_plot)
+        curves.addWidget(self.latency_plot)
         
         # 时间分布直方图
         self.hist_plot = pg.PlotWidget(title="弹幕时间分布")
         self.hist_plot.setLabel('left', "数量")
         self.hist_plot.setLabel('bottom', "时间轴 (s)")
+        # 缩放/平移时按可见范围从密度金字塔中取合适的一层
+        self.hist_plot.sigXRangeChanged.connect(self.redraw_histogram)
         
         # 实时状态仪表
         self.status_plot = pg.PlotWidget(title="实时状态")
@@ -111,6 +168,7 @@ class BiliDanmakuRestorer(QMainWindow):
         self.status_plot.addItem(self.status_text)
         
         layout.addWidget(self.progress_plot)
+        layout.addLayout(curves)
         layout.addWidget(self.hist_plot)
         layout.addWidget(self.status_plot)
         
@@ -123,100 +181,202 @@ class BiliDanmakuRestorer(QMainWindow):
             
     def parse_xml(self, path):
         try:
-            tree = ET.parse(path)
-            root = tree.getroot()
-            times = []
+            store = load_xml(path)
             
-            for d in root.findall('d'):
-                params = d.attrib.get('p', '').split(',')
-                if len(params) >= 4:
-                    times.append(float(params[0]))
+            # 生成多分辨率密度（1秒到1分钟各一层），缩放时直接取层，不再重新分箱
+            self.init_visualization()
+            from dm_density import DensityPyramid
+            self.store, self.xml_path = store, path
+            self.density = DensityPyramid.from_store(store)
+            self.sent_density = DensityPyramid(capacity=self.density.capacity)
             
-            # 生成直方图数据
-            hist, edges = np.histogram(times, bins=20)
-            x = edges[:-1]
-            width = np.diff(edges)
+            self.hist_plot.setXRange(0, max(self.density.end, 1), padding=0.02)
+            self.redraw_histogram()
             
-            if self.histogram:
-                self.hist_plot.removeItem(self.histogram)
+            self.log_area.append(f"成功加载 {len(store)} 条弹幕")
             
+        except Exception as e:
+            self.log_area.append(f"<font color='red'>解析错误: {str(e)}</font>")
+
+    def redraw_histogram(self, *args):
+        """按可见范围重绘时间分布（已发送部分叠加显示）"""
+        if self.density is None:
+            return
+        start, end = self.hist_plot.viewRange()[0]
+        max_bins = max(self.hist_plot.width() // 2, 100)
+        x, hist, width = self.density.query(start, end, max_bins=max_bins)
+        level = self.density.levels.index(width)
+        sent_x, sent, _ = self.sent_density.query(start, end, level=level)
+        
+        if self.histogram is None:
             self.histogram = pg.BarGraphItem(
-                x=x, height=hist, width=width*0.8,
+                x0=x, height=hist, width=width*0.8,
                 brush='r', pen=pg.mkPen('w', width=1)
             )
+            self.sent_histogram = pg.BarGraphItem(
+                x0=sent_x, height=sent, width=width*0.8, brush='g', pen=None
+            )
             self.hist_plot.addItem(self.histogram)
+            self.hist_plot.addItem(self.sent_histogram)
+        else:
+            self.histogram.setOpts(x0=x, height=hist, width=width*0.8)
+            self.sent_histogram.setOpts(x0=sent_x, height=sent, width=width*0.8)
+        self.hist_plot.setTitle(f"弹幕时间分布（每 {width} 秒）")
+
+    def fetch_parts(self):
+        bvid = self.bvid_input.text().strip()
+        if not bvid.startswith("BV"):
+            return
+        try:
+            import requests
+            response = requests.get(
+                f"{API_BASE}/x/web-interface/view?bvid={bvid}",
+                headers=self.build_headers(),
+                timeout=10
+            )
+            data = response.json()
+            if data['code'] != 0:
+                raise Exception(data['message'])
             
-            self.log_area.append(f"成功加载 {len(times)} 条弹幕")
-            
+            self.part_combobox.clear()
+            for p in data['data']['pages']:
+                self.part_combobox.addItem(f"P{p['page']}: {p['part']}", p['cid'])
+            self.log_area.append(f"成功获取 {len(data['data']['pages'])} 个分P")
         except Exception as e:
-            self.log_area.append(f"<font color='red'>解析错误: {str(e)}</font>")
+            self.log_area.append(f"<font color='red'>获取分P失败: {str(e)}</font>")
+
+    def build_headers(self):
+        return {
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
+            "Cookie": f"SESSDATA={self.sessdata_input.text()};"
+                      f"bili_jct={self.bili_jct_input.text()};"
+                      f"buvid3={self.buvid3_input.text()};",
+            "Referer": f"https://www.bilibili.com/video/{self.bvid_input.text().strip()}"
+        }
 
     def toggle_sending(self):
-        if self.sending:
-            self.sending = False
-            self.start_btn.setText("开始发送")
-        else:
-            if self.validate_inputs():
-                self.sending = True
-                self.start_btn.setText("停止发送")
-                Thread(target=self.sending_thread).start()
+        if self.engine and self.engine.finished is None:
+            self.engine.stop()
+            self.log_area.append("已通知引擎停止，当前弹幕处理完后退出")
+        elif self.validate_inputs():
+            self.start_sending()
 
     def validate_inputs(self):
-        required = [
-            self.sessdata_input.text().strip(),
-            self.bili_jct_input.text().strip(),
-            self.bvid_input.text().strip(),
-            self.xml_path
-        ]
+        required = [self.xml_path]
+        if not self.simulate_check.isChecked():
+            required += [
+                self.sessdata_input.text().strip(),
+                self.bili_jct_input.text().strip(),
+                self.bvid_input.text().strip(),
+                self.part_combobox.currentData()
+            ]
         if not all(required):
             self.log_area.append("<font color='red'>错误：请填写所有必填项</font>")
             return False
         return True
 
-    def sending_thread(self):
-        # 模拟发送过程
-        total = 100
-        start_time = time.time()
-        
-        for i in range(total):
-            if not self.sending:
-                break
-            
-            # 模拟发送延迟
-            time.sleep(0.1 + random.random()*0.2)
-            
-            # 更新队列数据
-            self.danmaku_queue.put({
-                'progress': (i+1)/total,
-                'timestamp': time.time() - start_time,
-                'status': f"正在发送 {i+1}/{total}"
-            })
+    def start_sending(self):
+        """在独立进程中运行发送引擎，进度从共享内存读取后写入遥测缓冲区"""
+        from circuit_breaker import account_key
+        from dead_letter import DEFAULT_PATH
+        from dm_density import DensityPyramid
+        from dm_engine import EngineProcess
+        from run_history import DEFAULT_PATH as HISTORY_PATH
+        cookies = {
+            "SESSDATA": self.sessdata_input.text(),
+            "bili_jct": self.bili_jct_input.text(),
+            "buvid3": self.buvid3_input.text()
+        }
+        spec = {
+            'danmaku_list': self.store.to_dicts(),
+            'headers': self.build_headers(),
+            'oid': self.part_combobox.currentData(),
+            'csrf': cookies["bili_jct"],
+            'min_delay': 1.5,
+            'retry_limit': 3,
+            'api_url': f"{API_BASE}/x/v2/dm/post",
+            'simulate_mode': self.simulate_check.isChecked(),
+            'account': account_key(cookies["SESSDATA"]),
+            'cookies': cookies,
+            'clock_url': f"{API_BASE}/x/server/date",
+            'nav_url': f"{API_BASE}/x/web-interface/nav",
+            'sent_history': [],
+            'checkpoint_file': str(Path.home() / ".bili_dm_graph_checkpoint.json"),
+            'bvid': self.bvid_input.text().strip(),
+            'page': self.part_combobox.currentIndex() + 1,
+            'dead_letter_path': str(DEFAULT_PATH),
+            'profile': False,
+            'profile_path': str(Path.home() / ".bili_dm_graph_profile.json"),
+            'history_path': str(HISTORY_PATH)
+        }
+        self.init_visualization()
+        self.telemetry.clear()
+        self.sent_density = DensityPyramid(capacity=self.density.capacity)
+        self.sent_done = 0
+        self.engine_seq = 0
+        self.engine = EngineProcess(spec).start()
+        self.start_btn.setText("停止发送")
+        self.log_area.append(f"发送引擎已启动 (pid={self.engine.process.pid})")
+
+    def on_finished(self, success):
+        from dm_telemetry import SENT
+        self.start_btn.setText("开始发送")
+        latest = self.telemetry.latest()
+        sent = int(latest[SENT]) if latest is not None else 0
+        message = f"发送结束：成功 {sent}/{self.telemetry.total} 条"
+        self.log_area.append(message if success else f"<font color='red'>{message}</font>")
+
+    def mark_sent(self, done):
+        # 按完成数近似计入已发送分布（弹幕按文件顺序发送，重试的弹幕稍后才完成）
+        if done > self.sent_done:
+            store = self.store
+            self.sent_density.add_many(store.time[self.sent_done:done], store.mode[self.sent_done:done])
+            self.sent_done = done
+            self.redraw_histogram()
 
     def update_visualization(self):
-        # 处理队列数据
-        while not self.danmaku_queue.empty():
-            data = self.danmaku_queue.get()
-            
-            # 更新进度数据
-            if 'progress' in data:
-                self.progress_data.append(data['progress'])
-            
-            # 更新状态文本
-            if 'status' in data:
-                self.status_text.setText(data['status'], color=(255,255,255))
+        if self.engine is None:
+            return
+        
+        # 读取引擎写入共享内存的全部新记录（不经过管道，不阻塞）
+        records, self.engine_seq = self.engine.ring.read_since(self.engine_seq)
+        if records:
+            self.telemetry.extend(records)
+            self.mark_sent(records[-1][1])
+        for kind, *args in self.engine.poll_events():
+            if kind == "log":
+                text, is_error = args
+                self.log_area.append(f"<font color='red'>{text}</font>" if is_error else text)
+            elif kind == "finished":
+                self.on_finished(args[0])
+        if not records:
+            return
         
-        # 实时更新曲线
-        if self.progress_data:
-            x = np.linspace(0, len(self.progress_data)/10, len(self.progress_data))
-            self.progress_curve.setData(x, self.progress_data)
+        # 固定容量缓冲区 + 按桶最小/最大值降采样：点数与任务时长无关
+        from dm_telemetry import FAILED, LATENCY, RATE, SENT
+        telemetry = self.telemetry
+        buckets = max(self.progress_plot.width() // 2, 100)
+        percent = 100 / max(telemetry.total, 1)
+        x, y = telemetry.downsample(SENT, buckets)
+        self.progress_curve.setData(x, y * percent)
+        x, y = telemetry.downsample(FAILED, buckets)
+        self.failed_curve.setData(x, y * percent)
+        self.rate_curve.setData(*telemetry.downsample(RATE, buckets))
+        x, y = telemetry.downsample(LATENCY, buckets)
+        self.latency_curve.setData(x, y * 1000)
         
-        # 限制数据量
-        if len(self.progress_data) > 200:
-            self.progress_data = self.progress_data[-200:]
+        # 更新状态文本
+        _, sent, failed, rate, latency = telemetry.latest()
+        self.status_text.setText(
+            f"成功 {sent:.0f}/{telemetry.total}  失败 {failed:.0f}  "
+            f"速率 {rate:.2f} 条/秒  耗时 {latency*1000:.0f} ms",
+            color=(255,255,255)
+        )
 
 if __name__ == "__main__":
-    pg.setConfigOptions(antialias=True)  # 开启抗锯齿
     app = QApplication(sys.argv)
     window = BiliDanmakuRestorer()
     window.show()
+    warm_up(WARM_MODULES)
+    QTimer.singleShot(0, window.init_visualization)
     sys.exit(app.exec_())
@@ -0,0 +1,152 @@
+# instrument.py
+"""
+发送流程分阶段计时与计数
+
+阶段约定：
+- parse     XML解析
+- validate  弹幕校验
+- build     请求参数构造（quote_plus / urlencode 等）
+- network   HTTP请求（含TLS、服务器处理和响应解析）
+- retry     失败重试前的退避等待
+- wait      发送间隔的刻意等待
+- breaker   熔断冷却期间的等待
+
+关闭时 stage() 返回共享的空上下文，count() 直接返回，几乎没有额外开销。
+"""
+import json
+import threading
+import time
+from typing import Callable, Dict
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    __slots__ = ("owner", "name", "start")
+
+    def __init__(self, owner, name):
+        self.owner = owner
+        self.name = name
+
+    def __enter__(self):
+        self.start = self.owner.clock()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.owner.add_time(self.name, self.owner.clock() - self.start)
+        return False
+
+
+class Instrumentation:
+    """
+    轻量级计时器/计数器集合
+    功能：
+    - with inst.stage("network"): ... 统计阶段次数、总耗时、最大耗时
+    - inst.count("http_412") 计数
+    - snapshot() / export_json() 导出汇总
+    """
+
+    def __init__(self, enabled: bool = False, clock: Callable[[], float] = time.perf_counter):
+        """
+        :param enabled: 是否启用
+        :param clock: 计时函数（虚拟时钟模拟时传入 VirtualClock.perf_counter）
+        """
+        self.enabled = enabled
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._stages: Dict[str, list] = {}   # name -> [次数, 总秒数, 最大秒数]
+        self._counters: Dict[str, int] = {}
+        self._started = time.time()
+
+    def stage(self, name: str):
+        """
+        阶段计时上下文
+
+        :param name: 阶段名
+        """
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def add_time(self, name: str, seconds: float) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            entry = self._stages.get(name)
+            if entry is None:
+                self._stages[name] = [1, seconds, seconds]
+            else:
+                entry[0] += 1
+                entry[1] += seconds
+                if seconds > entry[2]:
+                    entry[2] = seconds
+
+    def count(self, name: str, n: int = 1) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stages.clear()
+            self._counters.clear()
+            self._started = time.time()
+
+    def snapshot(self) -> dict:
+        """
+        当前汇总
+
+        :return: {"elapsed_s", "stages": {name: {...}}, "counters": {...}}
+        """
+        with self._lock:
+            stages = {k: list(v) for k, v in self._stages.items()}
+            counters = dict(self._counters)
+            elapsed = time.time() - self._started
+        total = sum(v[1] for v in stages.values()) or 1.0
+        return {
+            "elapsed_s": round(elapsed, 3),
+            "stages": {
+                name: {
+                    "count": count,
+                    "total_s": round(spent, 6),
+                    "mean_ms": round(spent / count * 1000, 3),
+                    "max_ms": round(peak * 1000, 3),
+                    "share": round(spent / total, 4)
+                }
+                for name, (count, spent, peak) in sorted(stages.items(), key=lambda kv: -kv[1][1])
+            },
+            "counters": counters
+        }
+
+    def export_json(self, path) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+
+    def format_table(self) -> str:
+        """生成调试面板用的纯文本表格"""
+        snap = self.snapshot()
+        lines = [f"运行 {snap['elapsed_s']:.1f}s",
+                 f"{'阶段':<10}{'次数':>8}{'总耗时(s)':>12}{'平均(ms)':>11}{'最大(ms)':>11}{'占比':>8}"]
+        for name, s in snap["stages"].items():
+            lines.append(f"{name:<10}{s['count']:>8}{s['total_s']:>12.3f}"
+                         f"{s['mean_ms']:>11.2f}{s['max_ms']:>11.2f}{s['share']:>8.1%}")
+        if snap["counters"]:
+            lines.append("")
+            lines.extend(f"{k}: {v}" for k, v in sorted(snap["counters"].items()))
+        return "\n".join(lines)
+
+
+# 默认关闭的共享实例
+DISABLED = Instrumentation(enabled=False)
@@ -0,0 +1,240 @@
+# metrics_exporter.py
+"""
+Prometheus / OpenMetrics 指标导出
+
+长时间运行的补档任务可通过 HTTP 端点暴露运行指标，供 Prometheus 抓取：
+    BILI_DM_METRICS_PORT=9108 python safedm5.3.py
+    curl http://127.0.0.1:9108/metrics
+
+指标由发送线程写入、由独立的HTTP线程读取，抓取不会经过界面线程。
+错误码标签来自 dm_errors（与 diagnose_error 的诊断规则一致）。
+"""
+import bisect
+import os
+import threading
+import time
+from typing import Dict, Optional, Sequence, Tuple
+
+import dm_errors
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 15.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Tuple) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *label_values, amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def get(self, *label_values) -> float:
+        with self._lock:
+            return self._values.get(label_values, 0)
+
+    def _samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}_total{_format_labels(self.labels, k)} {v}" for k, v in items]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, help_text, labels=()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[Tuple, float] = {}
+
+    def set(self, value: float, *label_values) -> None:
+        with self._lock:
+            self._values[label_values] = value
+
+    def get(self, *label_values) -> Optional[float]:
+        with self._lock:
+            return self._values.get(label_values)
+
+    def _samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labels, k)} {v}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text)
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self._counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._sum += value
+
+    def _samples(self):
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        cumulative += counts[-1]
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {cumulative}')
+        lines.append(f"{self.name}_sum {total}")
+        lines.append(f"{self.name}_count {cumulative}")
+        return lines
+
+
+class RestoreMetrics:
+    """
+    补档任务指标集合
+    功能：
+    - 发送成功/失败（按错误码和原因）/跳过计数
+    - 发送间隔、重试队列深度、账号健康度、熔断器状态等状态量
+    - 请求延迟直方图和断点保存滞后
+    """
+
+    def __init__(self):
+        self.sent = Counter("dm_sent", "成功发送的弹幕数")
+        self.failed = Counter("dm_failed", "发送失败次数（按错误码）", ("code", "reason"))
+        self.skipped = Counter("dm_skipped", "跳过的弹幕数", ("reason",))
+        self.send_interval = Gauge("dm_send_interval_seconds", "最近一次请求后安排的发送间隔（秒）")
+        self.retry_queue_depth = Gauge("dm_retry_queue_depth", "等待重试的弹幕数")
+        self.account_health = Gauge("dm_account_health", "账号状态（1正常 0暂停）", ("account",))
+        self.breaker_state = Gauge("dm_breaker_state", "熔断器状态（0关闭 1半开 2打开）",
+                                   ("account", "endpoint"))
+        self.request_latency = Histogram("dm_request_latency_seconds", "发送请求耗时（秒）")
+        self.checkpoint_lag = Gauge("dm_checkpoint_lag", "最近一次断点之后已处理的弹幕数")
+        self.checkpoint_time = Gauge("dm_checkpoint_timestamp_seconds", "最近一次断点保存的时间戳")
+        self.progress = Gauge("dm_progress_index", "当前处理到的弹幕序号")
+        self.total = Gauge("dm_total", "本次任务弹幕总数")
+        self._last_checkpoint = 0
+        self._metrics = [self.sent, self.failed, self.skipped, self.send_interval,
+                         self.retry_queue_depth, self.account_health, self.breaker_state,
+                         self.request_latency, self.checkpoint_lag, self.checkpoint_time,
+                         self.progress, self.total]
+
+    def observe_response(self, status: int, resp_json: Optional[dict], latency: float) -> None:
+        """
+        记录一次发送结果
+
+        :param status: HTTP状态码
+        :param resp_json: 响应JSON，无法解析时为None
+        :param latency: 请求耗时（秒）
+        """
+        self.request_latency.observe(latency)
+        if status == dm_errors.HTTP_BLOCKED:
+            code, reason, _ = dm_errors.blocked()
+        elif resp_json is None:
+            code, reason = status, "bad_response"
+        else:
+            code, reason, _ = dm_errors.diagnose(resp_json)
+        if code == 0:
+            self.sent.inc()
+        else:
+            self.failed.inc(str(code), reason)
+
+    def observe_exception(self, exc: Exception) -> None:
+        self.failed.inc("exception", type(exc).__name__)
+
+    def observe_progress(self, index: int) -> None:
+        self.progress.set(index)
+        self.checkpoint_lag.set(max(0, index - self._last_checkpoint))
+
+    def observe_checkpoint(self, index: int) -> None:
+        self._last_checkpoint = index
+        self.checkpoint_lag.set(0)
+        self.checkpoint_time.set(time.time())
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """在后台线程提供 /metrics 端点"""
+
+    def __init__(self, metrics: RestoreMetrics, port: int, host: str = "127.0.0.1"):
+        self.metrics = metrics
+        # http.server 只在启用指标端点时导入，不拖慢界面启动
+        from http.server import ThreadingHTTPServer
+        handler = self._make_handler()
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def start(self) -> "MetricsServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _make_handler(self):
+        from http.server import BaseHTTPRequestHandler
+        metrics = self.metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type",
+                                 "application/openmetrics-text; version=1.0.0; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def start_from_env(metrics: RestoreMetrics) -> Optional[MetricsServer]:
+    """
+    按环境变量 BILI_DM_METRICS_PORT 启动指标端点
+
+    :return: 已启动的服务，未配置时返回None
+    """
+    port = os.environ.get("BILI_DM_METRICS_PORT")
+    if not port:
+        return None
+    return MetricsServer(metrics, int(port)).start()
@@ -0,0 +1,284 @@
+# mock_bili_server.py
+"""
+B站接口本地模拟服务器
+
+模拟 /x/v2/dm/post、/x/web-interface/view、/x/web-interface/nav、/x/server/date，
+支持延迟、错误注入（412 / -509 / -400 / -101）、按账号配额和请求记录，
+用于在不访问真实接口的情况下测试和压测发送流程。接口行为由 MockBackend 实现，
+dm_simulate 直接调用它（配合虚拟时钟）做离线容量预估。
+
+用法：
+    python mock_bili_server.py --port 8765 --latency 0.05 --p412 0.01
+    BILI_API_BASE=http://127.0.0.1:8765 python safedm5.3.py
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from datetime import datetime
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+
+class MockConfig:
+    """
+    模拟服务器配置
+
+    :param latency: 基础响应延迟（秒）
+    :param jitter: 额外随机延迟上限（秒）
+    :param p412: 返回HTTP 412（风控拦截）的概率
+    :param p509: 返回 -509（频率限制）的概率
+    :param p400: 返回 -400（时间戳/敏感词）的概率
+    :param p101: 返回 -101（未登录）的概率
+    :param quota: 每个账号可成功发送的条数，None为不限
+    :param accounts: 视为已登录的SESSDATA集合，None为全部视为已登录
+    :param clock_skew: 服务器时间相对本机的偏移（秒）
+    :param pages: 视频分P数量
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, p412: float = 0.0,
+                 p509: float = 0.0, p400: float = 0.0, p101: float = 0.0,
+                 quota: Optional[int] = None, accounts=None, clock_skew: float = 0.0,
+                 pages: int = 1, seed: Optional[int] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.p412 = p412
+        self.p509 = p509
+        self.p400 = p400
+        self.p101 = p101
+        self.quota = quota
+        self.accounts = set(accounts) if accounts is not None else None
+        self.clock_skew = clock_skew
+        self.pages = pages
+        self.seed = seed
+
+
+class MockBackend:
+    """
+    模拟接口的处理逻辑（不含HTTP）
+    功能：
+    - 按配置注入错误，按账号统计已成功条数（配额）
+    - delay() 按配置抽取响应延迟，由调用方等待（真实睡眠或推进虚拟时钟）
+    """
+
+    def __init__(self, config: MockConfig = None, clock: Callable[[], float] = time.time):
+        """
+        :param config: 模拟配置
+        :param clock: 服务器时间函数（/x/server/date 使用）
+        """
+        self.config = config or MockConfig()
+        self.clock = clock
+        self.sent_count: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._rng = random.Random(self.config.seed)
+
+    def delay(self) -> float:
+        cfg = self.config
+        if not cfg.jitter:
+            return cfg.latency
+        with self._lock:
+            return cfg.latency + self._rng.uniform(0, cfg.jitter)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.sent_count.clear()
+
+    def handle(self, method: str, path: str, query: dict, form: dict, cookies: dict):
+        """
+        处理单个请求
+
+        :return: (HTTP状态码, 响应JSON)
+        """
+        cfg = self.config
+        sessdata = cookies.get("SESSDATA", "")
+        logged_in = bool(sessdata) and (cfg.accounts is None or sessdata in cfg.accounts)
+
+        if path == "/x/server/date":
+            now = datetime.fromtimestamp(self.clock() + cfg.clock_skew)
+            return 200, {"code": 0, "message": "0", "data": now.strftime("%Y-%m-%d %H:%M:%S")}
+
+        if path == "/x/web-interface/view":
+            pages = [{"cid": 10000 + i, "page": i + 1, "part": f"P{i + 1}"} for i in range(cfg.pages)]
+            return 200, {"code": 0, "message": "0",
+                         "data": {"bvid": query.get("bvid", ""), "cid": pages[0]["cid"], "pages": pages}}
+
+        if path == "/x/web-interface/nav":
+            if not logged_in or self._roll(cfg.p101):
+                return 200, {"code": -101, "message": "账号未登录", "data": {"isLogin": False}}
+            return 200, {"code": 0, "message": "0", "data": {"isLogin": True, "uname": "mock"}}
+
+        if path == "/x/v2/dm/post" and method == "POST":
+            return self._post_danmaku(form, sessdata, logged_in)
+
+        return 404, {"code": -404, "message": "啥都木有"}
+
+    def _post_danmaku(self, form, sessdata, logged_in):
+        cfg = self.config
+        if self._roll(cfg.p412):
+            return 412, {"code": -412, "message": "请求被拦截"}
+        if not logged_in or self._roll(cfg.p101):
+            return 200, {"code": -101, "message": "账号未登录"}
+        if not form.get("csrf"):
+            return 200, {"code": -111, "message": "csrf 校验失败"}
+        if not form.get("oid"):
+            return 200, {"code": -400, "message": "oid error"}
+        with self._lock:
+            used = self.sent_count.get(sessdata, 0)
+        if self._roll(cfg.p509) or (cfg.quota is not None and used >= cfg.quota):
+            return 200, {"code": -509, "message": "请求过于频繁，请稍后再试"}
+        if self._roll(cfg.p400):
+            reason = self._rng.choice(["timestamp expired", "content filter"])
+            return 200, {"code": -400, "message": reason}
+        with self._lock:
+            self.sent_count[sessdata] = used + 1
+        return 200, {"code": 0, "message": "0", "data": {"dmid": self._rng.getrandbits(53)}}
+
+    def _roll(self, probability: float) -> bool:
+        if probability <= 0:
+            return False
+        with self._lock:
+            return self._rng.random() < probability
+
+
+class MockBiliServer:
+    """
+    模拟服务器
+    功能：
+    - 在后台线程中运行 ThreadingHTTPServer
+    - 按配置注入延迟和错误（MockBackend）
+    - 记录每个请求（路径、账号、返回码、耗时）
+    """
+
+    def __init__(self, config: MockConfig = None, host: str = "127.0.0.1", port: int = 0,
+                 record_path: Optional[str] = None):
+        self.backend = MockBackend(config)
+        self.config = self.backend.config
+        self.records: List[dict] = []
+        self.sent_count = self.backend.sent_count
+        self.record_path = record_path
+        self._lock = threading.Lock()
+        self._record_file = open(record_path, "a", encoding="utf-8") if record_path else None
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockBiliServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._record_file:
+            self._record_file.close()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.records.clear()
+        self.backend.reset()
+
+    def _record(self, entry: dict) -> None:
+        with self._lock:
+            self.records.append(entry)
+            if self._record_file:
+                self._record_file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                self._record_file.flush()
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                self._dispatch("GET")
+
+            def do_POST(self):
+                self._dispatch("POST")
+
+            def _dispatch(self, method):
+                start = time.perf_counter()
+                url = urlparse(self.path)
+                query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length).decode("utf-8", "replace") if length else ""
+                form = {k: v[-1] for k, v in parse_qs(body).items()}
+                cookie = SimpleCookie()
+                cookie.load(self.headers.get("Cookie", ""))
+                cookies = {k: m.value for k, m in cookie.items()}
+
+                if url.path == "/__mock__/records":
+                    with server._lock:
+                        status, payload = 200, {"records": list(server.records)}
+                elif url.path == "/__mock__/reset":
+                    server.reset()
+                    status, payload = 200, {"code": 0}
+                else:
+                    delay = server.backend.delay()
+                    if delay > 0:
+                        time.sleep(delay)
+                    status, payload = server.backend.handle(method, url.path, query, form, cookies)
+                    server._record({
+                        "ts": time.time(),
+                        "method": method,
+                        "path": url.path,
+                        "account": cookies.get("SESSDATA", "")[:8],
+                        "status": status,
+                        "code": payload.get("code"),
+                        "message": form.get("message", ""),
+                        "elapsed_ms": round((time.perf_counter() - start) * 1000, 3)
+                    })
+
+                raw = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(raw)))
+                self.end_headers()
+                self.wfile.write(raw)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="B站接口本地模拟服务器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="基础延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="随机延迟上限（秒）")
+    parser.add_argument("--p412", type=float, default=0.0)
+    parser.add_argument("--p509", type=float, default=0.0)
+    parser.add_argument("--p400", type=float, default=0.0)
+    parser.add_argument("--p101", type=float, default=0.0)
+    parser.add_argument("--quota", type=int, default=None, help="每账号成功条数上限")
+    parser.add_argument("--skew", type=float, default=0.0, help="服务器时钟偏移（秒）")
+    parser.add_argument("--record", default=None, help="请求记录输出文件(JSONL)")
+    args = parser.parse_args()
+
+    config = MockConfig(latency=args.latency, jitter=args.jitter, p412=args.p412,
+                        p509=args.p509, p400=args.p400, p101=args.p101,
+                        quota=args.quota, clock_skew=args.skew)
+    server = MockBiliServer(config, args.host, args.port, record_path=args.record)
+    print(f"模拟服务器已启动: {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+# retry_queue.py
+"""
+非阻塞延迟重试队列
+
+发送失败的弹幕按"到期时间"放入小顶堆，主循环每轮先取已到期的重试项，
+没有到期项时继续发送新弹幕，单条弹幕的退避等待不再阻塞整个任务。
+"""
+import heapq
+import itertools
+import random
+import time
+from typing import Any, Callable, Iterator, Optional, Tuple
+
+import dm_errors
+
+# 错误类别 -> (首次退避秒数, 退避上限秒数)
+DEFAULT_BACKOFF = {
+    "network": (5, 120),       # 超时、连接失败、5xx
+    "timestamp": (1, 10),      # 时间戳不同步，重新取时间即可
+    "rate_limit": (60, 900),   # -509 频率限制
+    "blocked": (120, 1800),    # 412 风控拦截
+    "default": (5, 300),
+}
+
+
+def error_class(status: Optional[int] = None, resp_json: Optional[dict] = None,
+                exc: Optional[Exception] = None) -> str:
+    """
+    由发送结果确定退避类别
+
+    :param status: HTTP状态码
+    :param resp_json: 响应JSON
+    :param exc: 请求异常
+    :return: DEFAULT_BACKOFF 中的类别名
+    """
+    if status == dm_errors.HTTP_BLOCKED:
+        return "blocked"
+    if resp_json is not None:
+        _, reason, _ = dm_errors.diagnose(resp_json)
+        if reason in ("rate_limit", "timestamp"):
+            return reason
+        return "default"
+    if exc is not None or (status is not None and status >= 500):
+        return "network"
+    return "default"
+
+
+class RetryScheduler:
+    """
+    按到期时间排序的重试调度器
+    功能：
+    - 按错误类别指数退避，并加入随机抖动避免同时到期
+    - 超过最大尝试次数时拒绝入队，由调用方放弃该条
+    - pop_due() 只返回已到期的项，从不等待
+    """
+
+    def __init__(self, max_attempts: int = 3, backoff: dict = None, jitter: float = 0.2,
+                 clock: Callable[[], float] = time.monotonic, rng: random.Random = None):
+        """
+        :param max_attempts: 每条弹幕最多尝试次数（含首次发送）
+        :param backoff: 错误类别 -> (首次退避秒数, 上限秒数)
+        :param jitter: 抖动比例（0.2 表示 ±20%）
+        :param clock: 单调时钟函数
+        :param rng: 随机数生成器
+        """
+        self.max_attempts = max_attempts
+        self.backoff = dict(DEFAULT_BACKOFF, **(backoff or {}))
+        self.jitter = jitter
+        self.clock = clock
+        self.rng = rng or random.Random()
+        self._heap = []
+        self._seq = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def delay_for(self, error_cls: str, attempt: int) -> float:
+        """
+        计算第 attempt 次失败后的退避时间
+
+        :param error_cls: 错误类别
+        :param attempt: 已失败次数（从1开始）
+        """
+        base, cap = self.backoff.get(error_cls, self.backoff["default"])
+        delay = min(cap, base * 2 ** (attempt - 1))
+        if self.jitter:
+            delay *= 1 + self.rng.uniform(-self.jitter, self.jitter)
+        return max(0.0, delay)
+
+    def schedule(self, item: Any, error_cls: str, attempt: int) -> Optional[float]:
+        """
+        安排重试
+
+        :param item: 待重试的弹幕（通常是序号）
+        :param error_cls: 错误类别
+        :param attempt: 已失败次数
+        :return: 退避秒数；已达最大尝试次数时返回None
+        """
+        if attempt >= self.max_attempts:
+            return None
+        delay = self.delay_for(error_cls, attempt)
+        heapq.heappush(self._heap, (self.clock() + delay, next(self._seq), item, attempt))
+        return delay
+
+    def defer(self, item: Any, attempt: int, delay: float) -> None:
+        """
+        推迟一项而不计入失败次数（如熔断期间未发出的请求）
+
+        :param item: 待发送的弹幕
+        :param attempt: 保持不变的已失败次数
+        :param delay: 推迟秒数
+        """
+        heapq.heappush(self._heap, (self.clock() + delay, next(self._seq), item, attempt))
+
+    def pop_due(self) -> Optional[Tuple[Any, int]]:
+        """
+        取出一个已到期的重试项
+
+        :return: (item, 已失败次数)，没有到期项时返回None
+        """
+        if self._heap and self._heap[0][0] <= self.clock():
+            _, _, item, attempt = heapq.heappop(self._heap)
+            return item, attempt
+        return None
+
+    def next_due_in(self) -> Optional[float]:
+        """距离最近一个重试项到期的秒数，队列为空时返回None"""
+        if not self._heap:
+            return None
+        return max(0.0, self._heap[0][0] - self.clock())
+
+    def pending(self) -> Iterator[Any]:
+        """遍历所有待重试项（无序）"""
+        return (entry[2] for entry in self._heap)
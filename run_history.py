@@ -0,0 +1,78 @@
+# run_history.py
+"""
+发送任务历史
+
+每次真实发送任务结束时由 SendJob 追加一行JSON（按账号）：处理条数、有效耗时、
+请求次数、各原因的结果分布、平均请求耗时和当时的发送间隔。dm_planner 据此
+估计完成时间和需要的账号数。
+"""
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+DEFAULT_PATH = Path.home() / ".bili_dm_history.jsonl"
+
+
+class RunHistory:
+    """
+    追加写入的任务历史文件
+
+    :param path: 文件路径
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    def record(self, account: str, success: int, dead: int, elapsed_s: float, requests: int,
+               outcomes: Dict[str, int], latency_s: float, min_delay: float) -> None:
+        """
+        写入一次任务的统计
+
+        :param account: 账号标识（circuit_breaker.account_key）
+        :param success: 成功条数
+        :param dead: 死信条数
+        :param elapsed_s: 有效耗时（不含用户暂停）
+        :param requests: 发出的请求数（含重试）
+        :param outcomes: 原因标识 -> 次数（见 dm_errors）
+        :param latency_s: 平均请求耗时
+        :param min_delay: 发送间隔设置
+        """
+        record = {
+            "account": account,
+            "finished_at": int(time.time()),
+            "success": success,
+            "dead": dead,
+            "elapsed_s": round(elapsed_s, 3),
+            "requests": requests,
+            "outcomes": dict(outcomes),
+            "latency_s": round(latency_s, 4),
+            "min_delay": min_delay
+        }
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+    def runs(self, account: Optional[str] = None, recent: Optional[int] = None) -> List[dict]:
+        """
+        读取历史记录（按时间先后，跳过损坏的行）
+
+        :param account: 只返回该账号的记录
+        :param recent: 只返回最近若干条
+        """
+        if not self.path.exists():
+            return []
+        records = []
+        with self._lock:
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if account is None or record.get("account") == account:
+                        records.append(record)
+        return records[-recent:] if recent else records
@@ -1,9 +1,17 @@
 # security.py
+import os
 import time
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
+from urllib.parse import urlparse
 from typing import Tuple
+from instrument import DISABLED
+from circuit_breaker import CircuitOpenError, account_key
+import dm_errors
+
+# 接口地址（可通过环境变量指向本地模拟服务器）
+API_BASE = os.environ.get("BILI_API_BASE", "https://api.bilibili.com")
 
 class SecurityManager:
     """
@@ -14,19 +22,29 @@ class SecurityManager:
     - 请求频率控制
     - Cookie有效性验证
     - 网络重试策略
+    - 按账号和接口熔断
     """
     
-    def __init__(self, sessdata: str, bili_jct: str, buvid3: str):
+    def __init__(self, sessdata: str, bili_jct: str, buvid3: str, server_clock=None,
+                 instrument=DISABLED, metrics=None, breakers=None):
         """
         初始化安全配置
         
         :param sessdata: 登录Cookie中的SESSDATA
         :param bili_jct: CSRF令牌
         :param buvid3: 设备标识
+        :param server_clock: 服务器时钟（clock_sync.ServerClock），为空时使用本地时间
+        :param instrument: 分阶段计时（instrument.Instrumentation），默认关闭
+        :param metrics: 指标集合（metrics_exporter.RestoreMetrics），为空时不记录
+        :param breakers: 熔断器集合（circuit_breaker.BreakerRegistry），为空时不熔断
         """
         self.sessdata = sessdata
         self.bili_jct = bili_jct
         self.buvid3 = buvid3
+        self.server_clock = server_clock
+        self.instrument = instrument
+        self.metrics = metrics
+        self.breakers = breakers
         self.last_request_time = 0
         self.base_interval = 20  # 基础请求间隔（秒）
 
@@ -53,7 +71,7 @@ class SecurityManager:
         return {
             "csrf": self.bili_jct,
             "csrf_token": self.bili_jct,
-            "ts": int(time.time() * 1000),
+            "ts": self.server_clock.now_ms() if self.server_clock else int(time.time() * 1000),
             **kwargs
         }
 
@@ -98,7 +116,7 @@ class SecurityManager:
         """
         try:
             response = requests.get(
-                "https://api.bilibili.com/x/web-interface/nav",
+                f"{API_BASE}/x/web-interface/nav",
                 cookies={
                     "SESSDATA": self.sessdata,
                     "buvid3": self.buvid3
@@ -127,6 +145,32 @@ class SecurityManager:
         :param method: HTTP方法
         :param url: 请求URL
         :return: 响应对象
+        :raises CircuitOpenError: 该账号在此接口上处于熔断状态，请求未发出
         """
-        self.enforce_rate_limit()
-        return session.request(method, url, **kwargs)
+        breaker = None
+        if self.breakers is not None:
+            key = (account_key(self.sessdata), urlparse(url).path)
+            breaker = self.breakers.get(*key)
+            if not breaker.allow():
+                raise CircuitOpenError(key, breaker.retry_after())
+        with self.instrument.stage("wait"):
+            self.enforce_rate_limit()
+        with self.instrument.stage("network"):
+            start = time.perf_counter()
+            try:
+                response = session.request(method, url, **kwargs)
+            except Exception:
+                if breaker:
+                    breaker.record_failure()
+                raise
+        if self.metrics or breaker:
+            try:
+                resp_json = response.json()
+            except ValueError:
+                resp_json = None
+            if self.metrics:
+                self.metrics.observe_response(response.status_code, resp_json, time.perf_counter() - start)
+            if breaker:
+                _, _, reason, _ = dm_errors.classify(response.status_code, resp_json)
+                breaker.record(reason)
+        return response
@@ -1,39 +1,59 @@
 import tkinter as tk
-from tkinter import ttk, filedialog, scrolledtext, messagebox
-import xml.etree.ElementTree as ET
+from tkinter import ttk, filedialog, scrolledtext, messagebox, simpledialog
 import time
 import threading
-import requests
 import re
 import random
-import asyncio
 import os
 import json
 import uuid
 import hashlib
 from pathlib import Path
 from queue import Queue
-from bilibili_api import video, Credential
-from datetime import datetime, timezone
 from urllib.parse import urlencode, quote_plus
+from clock_sync import ServerClock
+from instrument import Instrumentation
+from metrics_exporter import RestoreMetrics, start_from_env
+import dm_errors
+from retry_queue import RetryScheduler, error_class
+from dead_letter import DeadLetterStore
+from circuit_breaker import OPEN, BreakerRegistry, account_key
+from credential_monitor import CredentialMonitor, EXPIRED
+from word_filter import FLAG, REWRITE, WordFilter
+from dm_dedup import DedupConfig
+from dm_plan import SendPlan
+from dm_priority import FILE, STRATEGIES
+from dm_store import MODE_GROUP_NAMES, MODE_GROUPS, parse_time
+from dm_scan import ScanReport, scan_file
+from dm_control import EngineClient, describe, list_sessions
+from dm_warmup import warm_up
+
+# 接口地址（可通过环境变量指向本地模拟服务器）
+API_BASE = os.environ.get("BILI_API_BASE", "https://api.bilibili.com")
+
+# 窗口显示后在后台预先导入（发送、验证凭证时才用到）
+WARM_MODULES = ("requests", "bilibili_api")
 
 # 断点续传管理器
 class RestoreManager:
     _cache_path = Path("~/.bili_dm_cache").expanduser()
     
     @classmethod
-    def save_progress(cls, bvid, cid, index, danmaku_list):
+    def save_progress(cls, bvid, cid, window, index, fingerprint, pending=()):
         progress_data = {
             "bvid": bvid,
             "cid": cid,
+            "window": window,
             "index": index,
-            "content_hash": cls._hash_danmaku(danmaku_list)
+            "pending": sorted(pending),
+            "content_hash": fingerprint
         }
         encrypted = cls._encrypt_data(progress_data)
         cls._cache_path.write_text(encrypted)
     
     @classmethod
-    def load_progress(cls, current_bvid, current_cid, danmaku_list):
+    def load_progress(cls, current_bvid, current_cid, fingerprint):
+        """返回 (窗口序号, 下一条新弹幕的窗口内序号, 待重试的窗口内序号)，无匹配进度时返回None"""
         if not cls._cache_path.exists():
             return None
         
@@ -41,15 +61,17 @@ class RestoreManager:
             data = json.loads(cls._decrypt_data(cls._cache_path.read_text()))
             if (data["bvid"] == current_bvid and 
                 data["cid"] == current_cid and
-                data["content_hash"] == cls._hash_danmaku(danmaku_list)):
-                return data["index"]
+                data["content_hash"] == fingerprint):
+                return data.get("window", 0), data["index"], data.get("pending", [])
         except:
             pass
         return None
     
     @staticmethod
-    def _hash_danmaku(danmaku_list):
-        content = "|".join(f"{d['time']}:{d['content']}" for d in danmaku_list)
+    def fingerprint(xml_path, options):
+        """文件指纹：路径、大小、修改时间和影响窗口内容的设置（不必整份读入大文件）"""
+        stat = os.stat(xml_path)
+        content = f"{os.path.abspath(xml_path)}|{stat.st_size}|{stat.st_mtime_ns}|{options}"
         return hashlib.sha256(content.encode()).hexdigest()
     
     @staticmethod
@@ -73,12 +95,27 @@ class BiliDanmakuRestorer:
         self.color_format = tk.IntVar(value=0)
         self.xml_path = tk.StringVar()
         self.resume_mode = tk.BooleanVar(value=False)
+        self.profile_mode = tk.BooleanVar(value=False)
+        self.prefilter_mode = tk.StringVar(value="关闭")
+        self.dedup_mode = tk.BooleanVar(value=False)
+        self.dedup_config = DedupConfig()
+        self.send_order = tk.StringVar(value=STRATEGIES[FILE])
+        self.instrument = Instrumentation()
+        self.profile_path = Path("~/.bili_dm_profile.json").expanduser()
+        self.metrics = RestoreMetrics()
+        self.metrics_server = start_from_env(self.metrics)
+        self.dead_letters = DeadLetterStore()
+        self.breakers = BreakerRegistry(metrics=self.metrics)
+        self.credential_monitor = CredentialMonitor(url=f"{API_BASE}/x/web-interface/nav",
+                                                    metrics=self.metrics)
         
         self.cid_list = []
         self.pages = []
         self.current_index = 0
+        self.window_size = 1000  # 每批读回/发送的条数，内存占用与文件大小无关
         self.running = False
         self.stop_event = threading.Event()
+        self.attached = None  # 已连接的后台任务（EngineClient）
         self.log_queue = Queue()
         self.progress_queue = Queue()
         
@@ -121,6 +158,26 @@ class BiliDanmakuRestorer:
         ttk.Radiobutton(color_frame, text="十进制", variable=self.color_format, value=0).pack(side="left", padx=5)
         ttk.Radiobutton(color_frame, text="十六进制", variable=self.color_format, value=1).pack(side="left")
 
+        # 选区（留空表示全部）
+        select_frame = ttk.Frame(config_frame)
+        select_frame.grid(row=6, column=0, columnspan=6, pady=5, sticky="w")
+        ttk.Label(select_frame, text="时间段:").pack(side="left")
+        self.select_start = ttk.Entry(select_frame, width=10)
+        self.select_start.pack(side="left", padx=2)
+        ttk.Label(select_frame, text="至").pack(side="left")
+        self.select_end = ttk.Entry(select_frame, width=10)
+        self.select_end.pack(side="left", padx=2)
+        ttk.Label(select_frame, text="模式:").pack(side="left", padx=(10, 0))
+        self.select_mode = ttk.Combobox(select_frame, state="readonly", width=8,
+                                        values=["全部"] + list(MODE_GROUP_NAMES.values()))
+        self.select_mode.current(0)
+        self.select_mode.pack(side="left", padx=2)
+        ttk.Label(select_frame, text="弹幕池:").pack(side="left", padx=(10, 0))
+        self.select_pool = ttk.Combobox(select_frame, state="readonly", width=6,
+                                        values=["全部", "0", "1", "2"])
+        self.select_pool.current(0)
+        self.select_pool.pack(side="left", padx=2)
+
         # 控制面板
         control_frame = ttk.Frame(self.root)
         control_frame.pack(pady=5, fill="x")
@@ -132,6 +189,17 @@ class BiliDanmakuRestorer:
         self.progress = ttk.Progressbar(control_frame, mode="determinate")
         self.progress.pack(side="left", expand=True, fill="x", padx=10)
         ttk.Checkbutton(control_frame, text="自动关机", variable=self.auto_shutdown_choose).pack(side="left", padx=10)
+        ttk.Checkbutton(control_frame, text="性能统计", variable=self.profile_mode).pack(side="left", padx=10)
+        ttk.Checkbutton(control_frame, text="折叠重复", variable=self.dedup_mode).pack(side="left", padx=10)
+        ttk.Label(control_frame, text="发送顺序:").pack(side="left")
+        ttk.Combobox(control_frame, textvariable=self.send_order, state="readonly", width=12,
+                     values=list(STRATEGIES.values())).pack(side="left", padx=5)
+        ttk.Label(control_frame, text="敏感词预筛:").pack(side="left")
+        ttk.Combobox(control_frame, textvariable=self.prefilter_mode, state="readonly", width=8,
+                     values=["关闭", "跳过", "替换为*"]).pack(side="left", padx=5)
+        ttk.Button(control_frame, text="调试面板", command=self.show_debug_panel).pack(side="left", padx=10)
+        self.attach_btn = ttk.Button(control_frame, text="连接后台任务", command=self.toggle_attach)
+        self.attach_btn.pack(side="left", padx=10)
 
         # 日志区域
         log_frame = ttk.LabelFrame(self.root, text="运行日志")
@@ -145,6 +213,7 @@ class BiliDanmakuRestorer:
             self.log_area.see("end")
         while not self.progress_queue.empty():
             self.progress["value"] = self.progress_queue.get()
+        self.attach_btn.config(text="断开后台任务" if self.attached else "连接后台任务")
         self.root.after(100, self.process_queues)
 
     def log(self, message):
@@ -213,6 +282,42 @@ class BiliDanmakuRestorer:
                 self.start_btn.config(text="停止补档")
                 threading.Thread(target=self.restore_process, daemon=True).start()
 
+    def toggle_attach(self):
+        """连接/断开后台运行的任务（dm_engine 引擎进程），断开不影响任务"""
+        if self.attached:
+            self.attached.close()
+            return
+        sessions = list_sessions()
+        if not sessions:
+            self.log("没有运行中的后台任务")
+            return
+        choice = 1
+        if len(sessions) > 1:
+            prompt = "\n".join(f"{i}. {describe(s)}" for i, s in enumerate(sessions, 1))
+            choice = simpledialog.askinteger("连接后台任务", prompt + "\n\n输入序号:",
+                                             minvalue=1, maxvalue=len(sessions), parent=self.root)
+            if choice is None:
+                return
+        self.attached = EngineClient(sessions[choice - 1])
+        threading.Thread(target=self.follow_engine, args=(self.attached,), daemon=True).start()
+
+    def follow_engine(self, client):
+        """在后台线程接收任务事件，经由队列交给界面线程"""
+        self.log(f"已连接后台任务 pid={client.session['pid']}")
+        try:
+            for kind, data in client.events():
+                if kind == "state" and data.get("total"):
+                    self.progress_queue.put(data["done"] / data["total"] * 100)
+                elif kind == "log":
+                    self.log(data[0])
+                elif kind == "finished":
+                    self.log(f"后台任务已结束（{'完成' if data else '未完成'}）")
+        except (OSError, ValueError) as e:
+            self.log(f"后台任务连接中断: {str(e)}")
+        finally:
+            self.attached = None
+            self.log("已断开后台任务（任务不受影响）")
+
     def parse_color(self, raw_color):
         try:
             clean_color = str(raw_color).strip().lower().replace('0x', '').replace('#', '')
@@ -243,86 +348,175 @@ class BiliDanmakuRestorer:
             errors.append(f"字体大小越界: {dm['font_size']}")
         return errors
 
+    def show_debug_panel(self):
+        """实时显示各阶段耗时（每秒刷新）"""
+        panel = tk.Toplevel(self.root)
+        panel.title("调试面板")
+        text = scrolledtext.ScrolledText(panel, width=72, height=18, font=("Consolas", 10))
+        text.pack(fill="both", expand=True)
+
+        def refresh():
+            if not panel.winfo_exists():
+                return
+            text.delete("1.0", "end")
+            if self.instrument.enabled:
+                text.insert("end", self.instrument.format_table())
+            else:
+                text.insert("end", "未启用性能统计（勾选后重新开始补档）")
+            panel.after(1000, refresh)
+
+        refresh()
+
+    def parse_row(self, p, text):
+        """
+        解析并校验一条弹幕
+
+        :return: 弹幕字典；p属性字段不足时返回None
+        :raises ValueError: 字段无效或未通过校验
+        """
+        params = p.split(',')
+        if len(params) < 9:
+            return None
+        dm_data = {
+            'time': float(params[0]),
+            'mode': int(params[1]),
+            'font_size': int(params[2]),
+            'color': self.parse_color(params[3].split('.')[0]),
+            'pool_type': int(params[5]),
+            'weight': int(params[8]),
+            'content': (text or '').strip()
+        }
+        with self.instrument.stage("validate"):
+            errors = self.enhanced_validate(dm_data)
+        if errors:
+            raise ValueError(" | ".join(errors))
+        return dm_data
+
+    def skip_invalid(self, error):
+        self.metrics.skipped.inc("invalid")
+        self.log(f"弹幕过滤: {str(error)}")
+
     def parse_danmaku(self):
+        """整份文件解析为弹幕列表（容错扫描，损坏的字节段记入 scan_report 后跳过）"""
         try:
-            tree = ET.parse(self.xml_path.get())
+            self.scan_report = ScanReport()
             danmaku_list = []
-            for d in tree.findall('d'):
+            for p, text in scan_file(self.xml_path.get(), self.scan_report):
                 try:
-                    params = d.attrib['p'].split(',')
-                    if len(params) < 9:
-                        continue
-                    dm_data = {
-                        'time': float(params[0]),
-                        'mode': int(params[1]),
-                        'font_size': int(params[2]),
-                        'color': self.parse_color(params[3].split('.')[0]),
-                        'pool_type': int(params[5]),
-                        'content': d.text.strip()
-                    }
-                    if errors := self.enhanced_validate(dm_data):
-                        raise ValueError(" | ".join(errors))
-                    danmaku_list.append(dm_data)
+                    dm_data = self.parse_row(p, text)
                 except Exception as e:
-                    self.log(f"弹幕过滤: {str(e)}")
-            return danmaku_list[:500]
+                    self.skip_invalid(e)
+                    continue
+                if dm_data is not None:
+                    danmaku_list.append(dm_data)
+            if self.scan_report.damaged:
+                self.log(self.scan_report.summary())
+            return danmaku_list
         except Exception as e:
             self.log(f"XML解析失败: {str(e)}")
             return None
 
-    def get_server_timestamp(self, session):
-        for _ in range(3):
-            try:
-                response = session.get("https://api.bilibili.com/x/server/date", timeout=3)
-                server_time = response.json()["data"]
-                return int(datetime.strptime(server_time, "%Y-%m-%d %H:%M:%S").timestamp() * 1000)
-            except:
-                continue
-        return None
+    def get_selection(self):
+        """读取选区输入，返回 DanmakuStore.select 参数（时间格式错误时抛出ValueError）"""
+        groups = {name: key for key, name in MODE_GROUP_NAMES.items()}
+        mode = groups.get(self.select_mode.get())
+        pool = self.select_pool.get()
+        return {
+            "start": parse_time(self.select_start.get()),
+            "end": parse_time(self.select_end.get()),
+            "modes": MODE_GROUPS[mode] if mode else None,
+            "pools": {int(pool)} if pool.isdigit() else None
+        }
 
     def diagnose_error(self, resp_json):
-        code = resp_json.get("code", -1)
-        message = resp_json.get("message", "")
-        data = resp_json.get("data", {})
-        diagnosis = {
-            -400: [
-                ("oid" in message, "CID无效或视频不可用"),
-                ("csrf" in message, "CSRF Token验证失败"),
-                ("timestamp" in message, "时间戳不同步"),
-                ("filter" in message, "触发敏感词过滤"),
-                (data.get("message") == "啥都没有啊", "内容编码错误")
-            ],
-            -101: [True, "认证信息失效"],
-            -111: [True, "CSRF Token格式错误"],
-            -404: [True, "视频不存在"],
-            -509: [True, "触发频率限制"]
-        }
-        for condition, reason in diagnosis.get(code, []):
-            if condition is True or (callable(condition) and condition()):
-                return f"{message} ({reason})"
-        return f"{message} (未知错误代码: {code})"
+        _, _, reason = dm_errors.diagnose(resp_json)
+        return f"{resp_json.get('message', '')} ({reason})"
+
+    def calculate_delay(self, idx):
+        """智能延迟控制（35-60秒随机+动态补偿）"""
+        base_delay = 35 + random.randint(0, 25)
+        compensation = 5 * (idx % 15)  # 每15条增加补偿延迟
+        return base_delay + compensation
+
+    def save_checkpoint(self, window, index, pending=()):
+        RestoreManager.save_progress(
+            self.bvid_entry.get().strip(),
+            self.cid_list[self.part_combobox.current()],
+            window,
+            index,
+            self.fingerprint,
+            pending
+        )
+
+    def build_plan(self, xml_path, selection, strategy):
+        """
+        整份文件的发送计划：选区、折叠重复和发送顺序在整份文件上计算（而不是每批内），
+        之后按计划顺序分批读回内容发送（相同设置下结果确定，断点续传不受影响）
+        """
+        self.scan_report = ScanReport()
+        plan = SendPlan.build(xml_path, self.parse_row, selection,
+                              self.dedup_config if self.dedup_mode.get() else None, strategy,
+                              self.scan_report, self.skip_invalid)
+        self.dedup_result = plan.dedup
+        if plan.dedup.dropped:
+            self.metrics.skipped.inc("duplicate", amount=plan.dedup.dropped)
+        return plan
+
+    def prepare_window(self, window, action):
+        """敏感词预筛（用户词表 + 历史被拒内容），逐条判断，按批处理即可"""
+        if action:
+            with self.instrument.stage("validate"):
+                self.prefiltered += self.word_filter.screen(window, action)
+        return window
 
     def restore_process(self):
+        self.instrument = inst = Instrumentation(enabled=self.profile_mode.get())
+        server_clock = None
         try:
-            danmaku_list = self.parse_danmaku()
-            if not danmaku_list:
+            xml_path = self.xml_path.get()
+            try:
+                selection = self.get_selection()
+            except ValueError:
+                self.log("错误：时间段格式应为 时:分:秒 / 分:秒 / 秒")
+                return
+            strategy = {v: k for k, v in STRATEGIES.items()}.get(self.send_order.get(), FILE)
+            if strategy != FILE:
+                self.log(f"发送顺序：{self.send_order.get()}（整份文件排序）")
+            # 每次任务重新加载词表
+            self.word_filter = WordFilter.from_files()
+            action = {"跳过": FLAG, "替换为*": REWRITE}.get(self.prefilter_mode.get())
+            self.prefiltered = 0
+
+            plan = self.build_plan(xml_path, selection, strategy)
+            if not len(plan):
                 self.log("错误：无有效弹幕")
                 return
-            
-            # 断点续传初始化
+            total = len(plan)
+            self.metrics.total.set(total)
+            self.log(f"共 {plan.scanned} 条弹幕，待发送 {total} 条，每批 {self.window_size} 条")
+
+            # 断点续传初始化（指纹包含影响窗口内容的设置，设置变化后不会错位续传）
+            self.fingerprint = RestoreManager.fingerprint(xml_path, [
+                self.window_size, self.color_format.get(), sorted(selection.items()),
+                self.dedup_mode.get(), strategy, action
+            ])
+            resume_window, resume_index, resume_pending = 0, 0, []
             if self.resume_mode.get():
-                resume_index = RestoreManager.load_progress(
+                progress = RestoreManager.load_progress(
                     self.bvid_entry.get().strip(),
                     self.cid_list[self.part_combobox.current()],
-                    danmaku_list
+                    self.fingerprint
                 )
-                if resume_index is not None:
-                    if messagebox.askyesno("断点续传", f"检测到未完成进度，从第 {resume_index+1} 条继续？"):
-                        self.current_index = resume_index
+                if progress is not None:
+                    window_no, index, pending = progress
+                    if pending:
+                        index = min(index, *pending)
+                    if messagebox.askyesno("断点续传", f"检测到未完成进度，从第 {window_no+1} 批第 {index+1} 条继续？"):
+                        resume_window, resume_index, resume_pending = progress
             
-            total = len(danmaku_list)
-            success = 0
+            stats = {"success": 0, "dead": 0, "sent": 0}
             
+            import requests
             with requests.Session() as session:
                 session.headers.update({
                     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36",
@@ -331,98 +525,57 @@ class BiliDanmakuRestorer:
                     "Accept-Encoding": "gzip, deflate, br"
                 })
 
-                base_ts = self.get_server_timestamp(session) or int(datetime.now(timezone.utc).astimezone().timestamp() * 1000)
-
-                for idx in range(self.current_index, total):
-                    if self.stop_event.is_set():
-                        RestoreManager.save_progress(
-                            self.bvid_entry.get().strip(),
-                            self.cid_list[self.part_combobox.current()],
-                            idx,
-                            danmaku_list
-                        )
-                        self.log("进度已保存")
-                        break
-                        
-                    dm = danmaku_list[idx]
-
-                    try:
-                        safe_content = quote_plus(dm["content"], safe='')
-                        data = {
-                            "oid": self.cid_list[self.part_combobox.current()],
-                            "type": 1,
-                            "mode": dm["mode"],
-                            "color": dm["color"],
-                            "message": safe_content,
-                            "fontsize": dm["font_size"],
-                            "pool": dm["pool_type"],
-                            "csrf": self.bili_jct_entry.get().strip(),
-                            "ts": base_ts + idx * 1000,
-                            "rnd": random.randint(100000, 999999)
-                        }
-                    except Exception as e:
-                        self.log(f"参数错误: {str(e)}")
+                # 服务器时钟同步（后台定期校准，每次请求前取当前服务器时间）
+                server_clock = ServerClock(url=f"{API_BASE}/x/server/date")
+                server_clock.start()
+                if not server_clock.synced:
+                    self.log("警告：服务器时间同步失败，使用本地时间")
+
+                # 后台巡检账号状态，凭证失效或风控时暂停发送
+                account = account_key(self.sessdata_entry.get().strip())
+                self.credential_monitor.add_account(account, {
+                    "SESSDATA": self.sessdata_entry.get().strip(),
+                    "bili_jct": self.bili_jct_entry.get().strip(),
+                    "buvid3": self.buvid3_entry.get().strip()
+                })
+                self.credential_monitor.start()
+                breaker = self.breakers.get(account, "/x/v2/dm/post")
+                self.next_send_at = 0
+
+                # 按计划顺序逐批读回内容、预筛、发送，处理完的窗口即释放
+                completed = True
+                done = 0
+                for window_no, rows in enumerate(plan.batches(self.window_size)):
+                    if window_no < resume_window:
+                        done += len(rows)
                         continue
-
-                    for attempt in range(3):
-                        try:
-                            response = session.post(
-                                "https://api.bilibili.com/x/v2/dm/post",
-                                headers={
-                                    "X-CSRF-Token": data["csrf"],
-                                    "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
-                                    "Referer": f"https://www.bilibili.com/video/{self.bvid_entry.get()}"
-                                },
-                                cookies={
-                                    "SESSDATA": self.sessdata_entry.get().strip(),
-                                    "bili_jct": data["csrf"],
-                                    "buvid3": self.buvid3_entry.get().strip()
-                                },
-                                data=urlencode(data, doseq=True),
-                                timeout=15
-                            )
-                            response.raise_for_status()
-                            break
-                        except Exception as e:
-                            if attempt == 2:
-                                raise
-                            time.sleep(5 * (attempt + 1))
-
-                    try:
-                        resp_json = response.json()
-                        if resp_json["code"] == 0:
-                            success += 1
-                            if idx % 10 == 0:
-                                RestoreManager.save_progress(
-                                    self.bvid_entry.get().strip(),
-                                    		self.cid_list[self.part_combobox.current()],
-                                    idx,
-                                    danmaku_list
-                                )
-                        else:
-                            error_info = 	self.diagnose_error(resp_json)
-                            self.log(f"发送失败: {error_info}")
-                    except json.JSONDecodeError:
-                        self.log("错误：响应解析失败")
-                    self.progress_queue.put((idx + 1) / total * 100)
-
-                    # 智能延迟控制（35-60秒随机+动态补偿）
-                    base_delay = 35 + random.randint(0, 25)
-                    compensation = 5 * (idx % 15)  # 每15条增加补偿延迟
-                    delay = base_delay + compensation
-                    
-                    if idx < total - 1 and not 	self.stop_event.is_set():
-                        start_time = time.time()
-                        while time.time() - start_time < delay:
-                            remaining = delay - (time.time() - start_time)
-                            time.sleep(min(1.0, remaining))
-                            if self.stop_event.is_set():
-                                break
+                    with inst.stage("parse"):
+                        window = plan.load(rows, self.parse_row)
+                    window = self.prepare_window(window, action)
+                    start, pending = (resume_index, resume_pending) if window_no == resume_window else (0, [])
+                    span = (done, len(rows), total)
+                    if not self.send_window(window, window_no, start, span, session, server_clock,
+                                            account, breaker, stats, pending):
+                        completed = False
+                        break
+                    done += len(rows)
+                    self.save_checkpoint(window_no + 1, 0)
+
+                if self.scan_report.damaged or self.scan_report.repaired:
+                    self.log(self.scan_report.summary())
+                if self.dedup_result.dropped:
+                    self.dedup_result.write_report()
+                    self.log(self.dedup_result.summary())
+                if self.prefiltered:
+                    self.log(f"敏感词预筛：{self.prefiltered} 条命中（{self.prefilter_mode.get()}）")
+                if stats["dead"]:
+                    self.log(f"{stats['dead']} 条弹幕写入死信: {self.dead_letters.path}"
+                             "（可用 dead_letter.py export 导出修改后重新补档）")
 
                 # 任务完成处理
-                if self.current_index >= total - 1:
-                    self.log(f" 任务完成！成功发送 {success}/{total} 条弹幕")
-                    if self.auto_shutdown_choose.get() and success > 0:
+                if completed:
+                    self.log(f" 任务完成！成功发送 {stats['success']}/{stats['sent']} 条弹幕")
+                    if self.auto_shutdown_choose.get() and stats["success"] > 0:
                         self.log("系统将在60秒后关机...")
                         os.system("shutdown -s -t 60")
                     # 清除缓存文件
@@ -430,25 +583,227 @@ class BiliDanmakuRestorer:
                         RestoreManager._cache_path.unlink()
 
         except Exception as e:
-            # 异常时保存当前进度
-            if 'idx' in locals():
-                RestoreManager.save_progress(
-                    self.bvid_entry.get().strip(),
-                    self.cid_list[self.part_combobox.current()],
-                    idx,
-                    danmaku_list
-                )
-                self.log(f"异常中断！已保存进度到第 {idx+1} 条")
             self.log(f"错误详情：{str(e)}")
             import traceback
             self.log(traceback.format_exc())
         finally:
+            if server_clock is not None:
+                server_clock.stop()
+            self.credential_monitor.stop()
+            if inst.enabled:
+                try:
+                    inst.export_json(self.profile_path)
+                    self.log(f"性能统计已保存: {self.profile_path}")
+                except Exception as e:
+                    self.log(f"保存性能统计失败: {str(e)}")
             self.running = False
             self.start_btn.config(text="开始补档")
             self.progress_queue.put(100)
 
+    def send_window(self, danmaku_list, window_no, start, span, session, server_clock, account, breaker, stats,
+                    pending=()):
+        """
+        发送一个窗口（窗口内的重试全部结束后才返回）
+
+        :param danmaku_list: 处理后的窗口弹幕
+        :param window_no: 窗口序号
+        :param start: 从窗口内第几条开始（断点续传）
+        :param span: (之前窗口的计划条数, 本窗口计划条数, 计划总条数)，用于估算进度
+        :param stats: 跨窗口累计的 success / dead / sent
+        :param pending: 断点时仍在重试队列中的窗口内序号（续传时重新入队）
+        :return: 窗口是否发送完毕（用户停止时为False）
+        """
+        inst = self.instrument
+        monitor = self.credential_monitor
+        planned_before, planned_count, planned_total = span
+        total = len(danmaku_list)
+        stats["sent"] += total - start + len(pending)
+
+        # 失败的弹幕进入延迟重试队列，主循环继续发送新弹幕
+        retry_queue = RetryScheduler(max_attempts=3)
+        for item in pending:
+            retry_queue.defer(item, 0, 0)
+        # 断点保存下一条未取出的新弹幕和重试队列中的序号，续传时只重发这些，已成功的弹幕不会重复发送
+        next_fresh = start
+        done = start - len(pending)
+        idx = start
+        paused = False
+
+        try:
+            while True:
+                if self.stop_event.is_set():
+                    self.save_checkpoint(window_no, next_fresh, retry_queue.pending())
+                    self.log("进度已保存")
+                    return False
+
+                # 账号凭证失效或风控期间暂停，巡检恢复后自动继续
+                if not monitor.is_active(account):
+                    if not paused:
+                        self.log(f"账号状态异常({monitor.state(account)})，暂停发送，恢复后自动继续")
+                        paused = True
+                    with inst.stage("wait"):
+                        monitor.wait_active(account, 1.0)
+                    continue
+                if paused:
+                    self.log("账号已恢复，继续发送")
+                    paused = False
+
+                # 熔断期间不发出任何请求
+                cooldown = breaker.retry_after()
+                if cooldown > 0:
+                    with inst.stage("wait"):
+                        self.stop_event.wait(min(1.0, cooldown))
+                    continue
+
+                entry = retry_queue.pop_due()
+                if entry:
+                    idx, attempt = entry
+                else:
+                    if next_fresh >= total:
+                        if not retry_queue:
+                            return True
+                        with inst.stage("retry"):
+                            self.stop_event.wait(min(1.0, retry_queue.next_due_in()))
+                        continue
+                    idx, attempt = next_fresh, 0
+                    next_fresh += 1
+
+                dm = danmaku_list[idx]
+                if dm.get("filtered"):
+                    self.dead_letters.add(dm, self.cid_list[self.part_combobox.current()], -400,
+                                          "prefilter", "命中本地敏感词: " + ",".join(dm["filtered"]))
+                    self.metrics.skipped.inc("prefilter")
+                    stats["dead"] += 1
+                    done += 1
+                    position = planned_before + planned_count * done / total
+                    self.metrics.observe_progress(int(position))
+                    self.progress_queue.put(position / planned_total * 100)
+                    continue
+
+                # 发送间隔在发送前等待，跨窗口同样生效
+                delay = self.next_send_at - time.monotonic()
+                if delay > 0:
+                    with inst.stage("wait"):
+                        if self.stop_event.wait(delay):
+                            retry_queue.defer(idx, attempt, 0)
+                            continue
+
+                try:
+                    with inst.stage("build"):
+                        safe_content = quote_plus(dm["content"], safe='')
+                        data = {
+                            "oid": self.cid_list[self.part_combobox.current()],
+                            "type": 1,
+                            "mode": dm["mode"],
+                            "color": dm["color"],
+                            "message": safe_content,
+                            "fontsize": dm["font_size"],
+                            "pool": dm["pool_type"],
+                            "csrf": self.bili_jct_entry.get().strip(),
+                            "ts": server_clock.now_ms(),
+                            "rnd": random.randint(100000, 999999)
+                        }
+                        body = urlencode(data, doseq=True)
+                except Exception as e:
+                    self.log(f"参数错误: {str(e)}")
+                    done += 1
+                    continue
+
+                if not breaker.allow():
+                    retry_queue.defer(idx, attempt, breaker.retry_after())
+                    continue
+                sent_at = time.perf_counter()
+                status, resp_json, error = None, None, None
+                try:
+                    with inst.stage("network"):
+                        response = session.post(
+                            f"{API_BASE}/x/v2/dm/post",
+                            headers={
+                                "X-CSRF-Token": data["csrf"],
+                                "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
+                                "Referer": f"https://www.bilibili.com/video/{self.bvid_entry.get()}"
+                            },
+                            cookies={
+                                "SESSDATA": self.sessdata_entry.get().strip(),
+                                "bili_jct": data["csrf"],
+                                "buvid3": self.buvid3_entry.get().strip()
+                            },
+                            data=body,
+                            timeout=15
+                        )
+                        status = response.status_code
+                        inst.count(f"http_{status}")
+                        response.raise_for_status()
+                        resp_json = response.json()
+                except Exception as e:
+                    error = e
+                interval = self.calculate_delay(idx)
+                self.next_send_at = time.monotonic() + interval
+                self.metrics.send_interval.set(interval)
+                if status is None:
+                    self.metrics.observe_exception(error)
+                else:
+                    self.metrics.observe_response(status, resp_json, time.perf_counter() - sent_at)
+
+                # 按错误类别决定去向：成功 / 稍后重试 / 暂停账号 / 死信
+                outcome, code, reason, text = dm_errors.classify(status, resp_json, error)
+                breaker.record(reason)
+                if breaker.state == OPEN:
+                    self.log(f"账号连续被拦截/限流，暂停发送 {breaker.retry_after():.0f} 秒后单条探测")
+                if resp_json is not None:
+                    inst.count(f"code_{code}")
+                    text = self.diagnose_error(resp_json)
+                elif error is not None:
+                    text = str(error)
+
+                if outcome == dm_errors.SUCCESS:
+                    stats["success"] += 1
+                    done += 1
+                    if idx % 10 == 0:
+                        self.save_checkpoint(window_no, next_fresh, retry_queue.pending())
+                        self.metrics.observe_checkpoint(idx)
+                elif outcome == dm_errors.RETRY:
+                    retry_delay = retry_queue.schedule(idx, error_class(status, resp_json, error), attempt + 1)
+                    if retry_delay is None:
+                        self.log(f"弹幕#{idx+1} 发送失败: {text}，重试 {attempt+1} 次后放弃，已写入死信")
+                        self.dead_letters.add(dm, data["oid"], code, reason, text)
+                        stats["dead"] += 1
+                        done += 1
+                    else:
+                        self.log(f"弹幕#{idx+1} 发送失败: {text}，{retry_delay:.0f}秒后重试")
+                elif outcome == dm_errors.PAUSE_ACCOUNT:
+                    # 凭证失效时继续发送只会全部失败：交给巡检暂停账号，该条恢复后重发
+                    # （计入尝试次数：巡检认为账号正常而该条始终返回-101时不会无限重发）
+                    monitor.report(account, EXPIRED, text)
+                    if attempt + 1 < retry_queue.max_attempts:
+                        retry_queue.defer(idx, attempt + 1, 0)
+                    else:
+                        self.log(f"弹幕#{idx+1} 尝试 {attempt+1} 次均返回账号异常({text})，已写入死信")
+                        self.dead_letters.add(dm, data["oid"], code, reason, text)
+                        stats["dead"] += 1
+                        done += 1
+                else:
+                    self.log(f"弹幕#{idx+1} 发送失败: {text}，已写入死信")
+                    self.dead_letters.add(dm, data["oid"], code, reason, text)
+                    if reason == "filter":
+                        self.word_filter.learn(dm["content"])
+                    stats["dead"] += 1
+                    done += 1
+                # 进度按计划条数估算：之前窗口 + 本窗口已完成的比例
+                position = planned_before + planned_count * done / total
+                self.metrics.retry_queue_depth.set(len(retry_queue))
+                self.metrics.observe_progress(int(position))
+                self.progress_queue.put(position / planned_total * 100)
+        except Exception:
+            # 异常时保存当前进度
+            self.save_checkpoint(window_no, next_fresh, retry_queue.pending())
+            self.log(f"异常中断！已保存进度到第 {window_no+1} 批第 {next_fresh+1} 条（另有 {len(retry_queue)} 条待重试）")
+            raise
+
     def check_credential_valid(self):
         """验证凭证有效性（新增重试机制）"""
+        import asyncio
+        from bilibili_api import Credential
         for _ in range(3):
             try:
                 loop = asyncio.new_event_loop()
@@ -469,4 +824,5 @@ class BiliDanmakuRestorer:
 if __name__ == "__main__":
     root = tk.Tk()
     app = BiliDanmakuRestorer(root)
+    root.after_idle(lambda: warm_up(WARM_MODULES))
     root.mainloop()
@@ -0,0 +1,6 @@
+# conftest.py
+"""测试直接导入仓库根目录下的模块"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
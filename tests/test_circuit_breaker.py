@@ -0,0 +1,111 @@
+# test_circuit_breaker.py
+"""熔断器"""
+import pytest
+
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, BreakerRegistry, CircuitBreaker, account_key
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker(failure_threshold=3, recovery_timeout=10, max_recovery_timeout=35, clock=clock)
+
+
+def trip(breaker):
+    for _ in range(breaker.failure_threshold):
+        assert breaker.allow()
+        breaker.record("blocked")
+
+
+def test_opens_after_consecutive_failures(breaker):
+    breaker.record("rate_limit")
+    breaker.record("network")
+    assert breaker.state == CLOSED
+    breaker.record("blocked")
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.retry_after() == 10
+
+
+def test_success_resets_failure_count(breaker):
+    breaker.record("blocked")
+    breaker.record("blocked")
+    breaker.record("ok")
+    breaker.record("blocked")
+    assert breaker.state == CLOSED
+
+
+def test_content_errors_do_not_trip(breaker):
+    for _ in range(10):
+        breaker.record("filter")
+    assert breaker.state == CLOSED
+
+
+def test_half_open_allows_single_probe(breaker, clock):
+    trip(breaker)
+    clock.now = 10
+    assert breaker.retry_after() == 0
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()
+    breaker.record("ok")
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+
+def test_failed_probe_doubles_cooldown_up_to_cap(breaker, clock):
+    trip(breaker)
+    cooldowns = []
+    for _ in range(4):
+        clock.now += breaker.retry_after()
+        assert breaker.allow()
+        breaker.record("blocked")
+        assert breaker.state == OPEN
+        cooldowns.append(breaker.retry_after())
+    assert cooldowns == [20, 35, 35, 35]
+
+
+def test_neutral_probe_closes(breaker, clock):
+    trip(breaker)
+    clock.now = 10
+    assert breaker.allow()
+    breaker.record("filter")
+    assert breaker.state == CLOSED
+    assert breaker.trips == 0
+
+
+def test_registry_reuses_breakers_and_reports_state(clock):
+    changes = []
+
+    class Gauge:
+        def set(self, value, *labels):
+            changes.append((labels, value))
+
+    class Metrics:
+        breaker_state = Gauge()
+
+    registry = BreakerRegistry(metrics=Metrics(), clock=clock, failure_threshold=1)
+    breaker = registry.get("acc", "/x/v2/dm/post")
+    assert registry.get("acc", "/x/v2/dm/post") is breaker
+    assert registry.get("other", "/x/v2/dm/post") is not breaker
+    breaker.record("blocked")
+    assert registry.states()[("acc", "/x/v2/dm/post")] == OPEN
+    assert changes[-1] == (("acc", "/x/v2/dm/post"), 2)
+
+
+def test_account_key_hides_credential():
+    key = account_key("SESSDATA-secret")
+    assert len(key) == 8 and "secret" not in key
+    assert key == account_key("SESSDATA-secret")
@@ -0,0 +1,73 @@
+# test_dm_control.py
+"""任务登记与清理"""
+import json
+import os
+import socket
+import subprocess
+import sys
+
+import pytest
+
+import dm_control
+from dm_control import ControlServer, EventHub, describe, list_sessions
+
+
+@pytest.fixture(autouse=True)
+def session_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(dm_control, "SESSION_DIR", tmp_path)
+    return tmp_path
+
+
+def write_session(directory, name, **info):
+    path = directory / f"{name}.json"
+    path.write_text(json.dumps(dict({"token": "t", "started": 0}, **info)))
+    return path
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_running_engine_is_listed(session_dir):
+    server = ControlServer(EventHub(), {}).start(bvid="BV1")
+    try:
+        sessions = list_sessions()
+        assert [s["pid"] for s in sessions] == [os.getpid()]
+        assert sessions[0]["reachable"]
+    finally:
+        server.stop(grace=0)
+
+
+def test_slow_engine_is_kept(session_dir):
+    # 监听但从不处理请求：连接成功、读取超时
+    with socket.socket() as busy:
+        busy.bind(("127.0.0.1", 0))
+        busy.listen()
+        path = write_session(session_dir, "busy", pid=os.getpid(), port=busy.getsockname()[1])
+        sessions = list_sessions()
+    assert path.exists()
+    assert sessions[0]["reachable"] is False
+    assert describe(sessions[0]).endswith("（暂无响应）")
+
+
+def test_refused_port_is_removed(session_dir):
+    path = write_session(session_dir, "closed", pid=os.getpid(), port=free_port())
+    assert list_sessions() == []
+    assert not path.exists()
+
+
+def test_exited_process_is_removed(session_dir):
+    child = subprocess.Popen([sys.executable, "-c", "pass"])
+    child.wait()
+    path = write_session(session_dir, "exited", pid=child.pid, port=free_port())
+    assert list_sessions() == []
+    assert not path.exists()
+
+
+def test_corrupt_session_file_is_removed(session_dir):
+    path = session_dir / "broken.json"
+    path.write_text("{")
+    assert list_sessions() == []
+    assert not path.exists()
@@ -0,0 +1,139 @@
+# test_dm_engine.py
+"""SendJob 断点续传（虚拟时钟 + 服务器模型）"""
+import json
+import random
+import time
+
+from circuit_breaker import BreakerRegistry
+from clock_sync import ServerClock
+from credential_monitor import CredentialMonitor
+from dm_engine import Checkpoint, SendJob
+from dm_simulate import ModelTransport, VirtualClock, _CountingDeadLetters, synthetic_list
+from instrument import Instrumentation
+from metrics_exporter import RestoreMetrics
+from mock_bili_server import MockBackend, MockConfig
+from run_history import RunHistory
+from word_filter import WordFilter
+
+
+class RecordingTransport(ModelTransport):
+    """记录服务器接受的弹幕内容"""
+
+    def __init__(self, backend, clock):
+        super().__init__(backend, clock)
+        self.accepted = []
+
+    def __call__(self, data):
+        status, payload = super().__call__(data)
+        if status == 200 and payload["code"] == 0:
+            self.accepted.append(data["message"])
+        return status, payload
+
+
+def make_job(danmaku_list, sent_history, checkpoint, model, stop_after=None):
+    clock = VirtualClock(epoch=0)
+    metrics = RestoreMetrics()
+    transport = RecordingTransport(MockBackend(model, clock=clock.time), clock)
+    config = {
+        'danmaku_list': danmaku_list,
+        'headers': {},
+        'oid': 1,
+        'csrf': "test",
+        'min_delay': 0.5,
+        'retry_limit': 5,
+        'api_url': "",
+        'simulate_mode': False,
+        'server_clock': ServerClock(url="", clock=clock.monotonic),
+        'instrument': Instrumentation(enabled=False),
+        'metrics': metrics,
+        'sent_history': sent_history,
+        'dead_letters': _CountingDeadLetters(),
+        'breakers': BreakerRegistry(metrics=metrics, clock=clock.monotonic),
+        'account': "test",
+        'credential_monitor': CredentialMonitor(url=""),
+        'word_filter': WordFilter(),
+        'save_checkpoint': checkpoint.save,
+        'clock': clock,
+        'rng': random.Random(0),
+        'poll_interval': float("inf"),
+        'transport': transport
+    }
+
+    def progress(done, total):
+        if stop_after is not None and done >= stop_after:
+            job.stop()
+
+    job = SendJob(config, on_progress=progress)
+    return job, transport
+
+
+def test_resume_from_checkpoint_sends_each_item_once(tmp_path):
+    danmaku_list = synthetic_list(40)
+    path = tmp_path / "checkpoint.json"
+    model = MockConfig(p509=0.2, seed=1)
+
+    first_history = set()
+    job, first = make_job(danmaku_list, first_history, Checkpoint(path, "BV1", 1, first_history, every=1),
+                          model, stop_after=15)
+    job.run()
+    assert 0 < len(first.accepted) < len(danmaku_list)
+
+    saved = json.loads(path.read_text())
+    assert set(saved["sent"]) == first_history
+    resumed_history = set(saved["sent"])
+    job, second = make_job(danmaku_list, resumed_history, Checkpoint(path, "BV1", 1, resumed_history, every=1),
+                           MockConfig(p509=0.2, seed=2))
+    job.run()
+
+    sent = first.accepted + second.accepted
+    assert len(sent) == len(set(sent))
+    assert sorted(sent) == sorted(dm["content"] for dm in danmaku_list)
+    assert job.success_count == len(second.accepted)
+
+
+def test_checkpoint_writes_every_n(tmp_path):
+    path = tmp_path / "checkpoint.json"
+    history = {"0", "1", "2"}
+    checkpoint = Checkpoint(path, "BV1xx", 42, history, every=10)
+    checkpoint.save(3)
+    assert not path.exists()
+    checkpoint.save(10)
+    data = json.loads(path.read_text())
+    assert sorted(data["sent"]) == ["0", "1", "2"]
+    assert (data["bvid"], data["cid"], data["progress"]) == ("BV1xx", 42, 10)
+    assert not path.with_suffix(".tmp").exists()
+
+
+def test_simulate_mode_runs_on_virtual_clock(tmp_path):
+    history = RunHistory(tmp_path / "history.jsonl")
+    sent_history, saved, logs = set(), [], []
+    config = {
+        'danmaku_list': synthetic_list(300),
+        'headers': {},
+        'oid': 1,
+        'csrf': "test",
+        'min_delay': 30,
+        'retry_limit': 3,
+        'api_url': "",
+        'simulate_mode': True,
+        'server_clock': None,
+        'instrument': Instrumentation(enabled=False),
+        'metrics': RestoreMetrics(),
+        'sent_history': sent_history,
+        'dead_letters': None,
+        'breakers': None,
+        'account': "test",
+        'credential_monitor': None,
+        'word_filter': None,
+        'save_checkpoint': saved.append,
+        'history': history
+    }
+    job = SendJob(config, on_log=lambda text, is_error: logs.append(text))
+    started = time.perf_counter()
+    assert job.run()
+    assert time.perf_counter() - started < 10
+    assert job.success_count == 300
+    # 模拟结果不写入真实任务的断点、已发送记录和任务历史
+    assert not sent_history and not saved and history.runs() == []
+    assert job.config['clock'].now > 300 * 30
+    assert "[模拟]" in logs[-1]
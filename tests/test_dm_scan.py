@@ -0,0 +1,80 @@
+# test_dm_scan.py
+"""容错扫描器"""
+import pytest
+
+from dm_scan import ENCODING, MALFORMED, TRUNCATED, ScanReport, scan_bytes, scan_file, unescape
+
+GOOD = '<d p="1.0,1,25,16777215,1600000000,0,abcd,{0},5">text{0}</d>\n'
+
+
+def document(*parts):
+    return ('<?xml version="1.0" encoding="UTF-8"?><i>\n' + "".join(parts)).encode("utf-8")
+
+
+def test_clean_document():
+    report = ScanReport()
+    rows, consumed = scan_bytes(document(GOOD.format(1), GOOD.format(2), "</i>\n"), report)
+    assert [text for _, text in rows] == ["text1", "text2"]
+    assert rows[0][0].startswith("1.0,1,25")
+    assert report.recovered == 2 and not report.damaged
+
+
+def test_truncated_tail():
+    report = ScanReport()
+    rows, _ = scan_bytes(document(GOOD.format(1), '<d p="2.0,1,25,1677'), report)
+    assert len(rows) == 1
+    assert [reason for _, _, reason in report.damaged] == [TRUNCATED]
+
+
+def test_malformed_element_resyncs():
+    report = ScanReport()
+    rows, _ = scan_bytes(document(GOOD.format(1), "<d >no p</d>\n", GOOD.format(3), "</i>"), report)
+    assert [text for _, text in rows] == ["text1", "text3"]
+    assert [reason for _, _, reason in report.damaged] == [MALFORMED]
+
+
+def test_invalid_utf8_skipped():
+    report = ScanReport()
+    data = document(GOOD.format(1)) + b'<d p="2,1,25,0,0,0,x,2,5">\xff\xfe</d>\n' + GOOD.format(3).encode()
+    rows, _ = scan_bytes(data, report)
+    assert [text for _, text in rows] == ["text1", "text3"]
+    assert [reason for _, _, reason in report.damaged] == [ENCODING]
+
+
+def test_control_characters_repaired():
+    report = ScanReport()
+    rows, _ = scan_bytes(document('<d p="1,1,25,0,0,0,x,1,5">a\x01b&amp;c</d>\n'), report)
+    assert rows[0][1] == "ab&c"
+    assert report.repaired == 1
+
+
+def test_damaged_ranges_are_file_offsets():
+    report = ScanReport()
+    data = document(GOOD.format(1), "<d >bad</d>\n")
+    scan_bytes(data, report, offset=100)
+    start, end, _ = report.damaged[0]
+    assert data[start - 100:end - 100].startswith(b"<d >bad")
+
+
+def test_unescape():
+    assert unescape("&lt;&#65;&#x42;&unknown;") == "<AB&unknown;"
+
+
+@pytest.mark.parametrize("chunk", [7, 64, 1 << 20])
+def test_scan_file_matches_whole_buffer(tmp_path, chunk):
+    data = document(*(GOOD.format(i) for i in range(200)), "<d >bad</d>\n", GOOD.format(999), "</i>\n")
+    path = tmp_path / "dm.xml"
+    path.write_bytes(data)
+    expected_report, report = ScanReport(), ScanReport()
+    expected, _ = scan_bytes(data, expected_report)
+    assert list(scan_file(path, report, chunk=chunk)) == expected
+    assert report.damaged == expected_report.damaged
+
+
+def test_scan_file_spans_cover_elements(tmp_path):
+    data = document(GOOD.format(1), GOOD.format(2), "</i>\n")
+    path = tmp_path / "dm.xml"
+    path.write_bytes(data)
+    for p, text, start, end in scan_file(path, chunk=16, with_spans=True):
+        element, _ = scan_bytes(data[start:end])
+        assert element == [(p, text)]
@@ -0,0 +1,181 @@
+# test_dm_store.py
+"""列式存储与选区索引"""
+import random
+
+import pytest
+
+import dm_synth
+from dm_scan import INVALID, ScanReport
+from dm_store import DanmakuStore, in_selection, iter_chunks, load_xml, load_xml_parallel, parse_time
+
+ROW = '<d p="{},1,25,16777215,1600000000,0,abcd,{},{}">{}</d>'
+
+
+def make_list(rows=500, seed=0):
+    rng = random.Random(seed)
+    return [{"time": round(rng.random() * 600, 3), "mode": rng.choice([1, 1, 4, 5, 7]), "font_size": 25,
+             "color": 16777215, "pool_type": rng.choice([0, 0, 1]), "weight": rng.randint(0, 10),
+             "content": f"dm{i}"} for i in range(rows)]
+
+
+def columns(store):
+    return [len(getattr(store, name)) for name in
+            ("time", "mode", "font_size", "color", "ts", "pool", "weight", "content")]
+
+
+def test_parse_time():
+    assert parse_time("1:02:03") == 3723
+    assert parse_time("02:03") == 123
+    assert parse_time("4.5") == 4.5
+    assert parse_time("") is None
+    assert parse_time(None) is None
+
+
+def test_round_trip_dicts():
+    danmaku_list = make_list(50)
+    assert DanmakuStore.from_dicts(danmaku_list).to_dicts() == danmaku_list
+
+
+@pytest.mark.parametrize("selection", [
+    {"start": 60.0, "end": 120.0},
+    {"start": None, "end": 30.0},
+    {"start": 500.0, "end": None},
+    {"modes": {4, 5}},
+    {"pools": {1}},
+    {"start": 100.0, "end": 400.0, "modes": {1}, "pools": {0}},
+])
+def test_select_matches_linear_filter(selection):
+    danmaku_list = make_list()
+    store = DanmakuStore.from_dicts(danmaku_list)
+    expected = [i for i, dm in enumerate(danmaku_list) if in_selection(dm, **selection)]
+    assert store.select(**selection) == expected
+
+
+def test_select_bounds_are_inclusive():
+    store = DanmakuStore.from_dicts([{"time": t, "mode": 1, "content": str(t)} for t in (1.0, 2.0, 3.0)])
+    assert store.select(2.0, 3.0) == [1, 2]
+    assert store.select(2.5, 2.6) == []
+
+
+def test_index_rebuilt_after_append():
+    store = DanmakuStore.from_dicts([{"time": 5.0, "mode": 1, "content": "a"}])
+    assert store.select(modes={4}) == []
+    store.append(1.0, 4, 25, 0, "b")
+    assert store.select(modes={4}) == [1]
+    assert store.select(0.0, 2.0) == [1]
+
+
+@pytest.mark.parametrize("field, value", [
+    ("font_size", 99999), ("mode", 300), ("pool", -200), ("color", -1)
+])
+def test_append_out_of_range_leaves_columns_aligned(field, value):
+    store = DanmakuStore.from_dicts(make_list(3))
+    row = {"time": 1.0, "mode": 1, "font_size": 25, "color": 0, "content": "x", "pool": 0, "weight": 0}
+    row[field] = value
+    with pytest.raises(ValueError):
+        store.append(**row)
+    assert columns(store) == [3] * 8
+
+
+def test_append_clamps_unused_columns():
+    store = DanmakuStore()
+    assert not store.append(1.0, 1, 25, 0, "a", weight=10)
+    assert store.append(2.0, 1, 25, 0, "b", weight=500)
+    assert store.append(3.0, 1, 25, 0, "c", weight=-500, ts=1 << 70)
+    assert list(store.weight) == [10, 127, -128]
+    assert store.ts[2] == (1 << 63) - 1
+    assert columns(store) == [3] * 8
+
+
+def test_append_bad_number_leaves_columns_aligned():
+    store = DanmakuStore()
+    with pytest.raises(ValueError):
+        store.append("1.2.3", 1, 25, 0, "x")
+    assert columns(store) == [0] * 8
+
+
+def write_rows(path, rows):
+    path.write_text('<?xml version="1.0" encoding="UTF-8"?><i>\n' + "\n".join(rows) + "\n</i>\n",
+                    encoding="utf-8")
+    return path
+
+
+@pytest.mark.parametrize("time, weight", [("1.2.3", "5"), (".", "5"), ("2", "5x")])
+def test_load_xml_reports_bad_numbers_as_damaged(tmp_path, time, weight):
+    path = write_rows(tmp_path / "dm.xml", [ROW.format("1.5", 1, 5, "ok"),
+                                            ROW.format(time, 2, weight, "bad"),
+                                            ROW.format("3", 3, 7, "ok2")])
+    report = ScanReport()
+    store = load_xml(path, report)
+    assert store.content == ["ok", "ok2"]
+    assert list(store.weight) == [5, 7]
+    assert columns(store) == [2] * 8
+    assert report.recovered == 2
+    assert [reason for _, _, reason in report.damaged] == [INVALID]
+
+
+def test_load_xml_rejects_out_of_range_columns(tmp_path):
+    path = write_rows(tmp_path / "dm.xml", [
+        '<d p="1,1,99999,16777215,1600000000,0,abcd,1,5">font</d>',
+        '<d p="2,300,25,16777215,1600000000,0,abcd,2,5">mode</d>',
+        ROW.format("3", 3, 0, "ok"),
+    ])
+    report = ScanReport()
+    store = load_xml(path, report)
+    assert store.content == ["ok"]
+    assert len(report.damaged) == 2
+
+
+def test_load_xml_clamps_weight_and_ts(tmp_path):
+    path = write_rows(tmp_path / "dm.xml", [
+        ROW.format("1", 1, 500, "heavy"),
+        '<d p="2,1,25,16777215,99999999999999999999,0,abcd,2,5">late</d>',
+        ROW.format("3", 3, 0, "ok"),
+    ])
+    report = ScanReport()
+    store = load_xml(path, report)
+    assert store.content == ["heavy", "late", "ok"]
+    assert list(store.weight) == [127, 5, 0]
+    assert report.clamped == 2 and not report.damaged
+
+
+@pytest.mark.parametrize("head", ["", "<!DOCTYPE i>"])
+def test_load_xml_normalizes_newlines(tmp_path, head):
+    # 快速路径、容错扫描（单引号）和 ElementTree（DOCTYPE）得到相同的文本
+    path = tmp_path / "dm.xml"
+    path.write_bytes(f'<?xml version="1.0" encoding="UTF-8"?>{head}<i>\r\n'.encode() +
+                     ROW.format("1", 1, 0, "a\r\nb\rc&#13;d").encode() + b"\r\n" +
+                     ROW.format("2", 2, 0, "d\r\ne").replace('"', "'").encode() + b"\r\n</i>\r\n")
+    assert load_xml(path).content == ["a\nb\nc\rd", "d\ne"]
+
+
+def test_load_xml_optional_weight(tmp_path):
+    path = write_rows(tmp_path / "dm.xml", [
+        '<d p="1,1,25,16777215,1600000000,0,abcd,1">eight</d>',
+        '<d p="2,1,25,16777215,1600000000,0,abcd,2,7,extra">extra</d>',
+    ])
+    assert list(load_xml(path).weight) == [0, 7]
+
+
+def test_write_xml_round_trip(tmp_path):
+    store = DanmakuStore.from_dicts(make_list(100))
+    store.write_xml(tmp_path / "out.xml")
+    loaded = load_xml(tmp_path / "out.xml")
+    assert loaded.content == store.content
+    assert list(loaded.mode) == list(store.mode)
+    assert list(loaded.weight) == list(store.weight)
+
+
+def test_loaders_agree_on_malformed_file(tmp_path):
+    path = tmp_path / "synth.xml"
+    dm_synth.write_xml(str(path), 5000, malformed=0.05, seed=7)
+    report = ScanReport()
+    store = load_xml(path, report, chunk=1 << 14)
+    assert 0 < len(store) < 5000
+    assert columns(store) == [len(store)] * 8
+    chunked = DanmakuStore()
+    for part, _, _ in iter_chunks(path, chunk=1 << 12):
+        chunked.extend(part)
+    assert chunked.to_dicts() == store.to_dicts()
+    parallel = load_xml_parallel(path, workers=2, shard_size=1 << 15)
+    assert parallel.to_dicts() == store.to_dicts()
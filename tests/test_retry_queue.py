@@ -0,0 +1,78 @@
+# test_retry_queue.py
+"""延迟重试队列"""
+import pytest
+
+from retry_queue import RetryScheduler, error_class
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def test_pop_due_never_waits(clock):
+    queue = RetryScheduler(backoff={"default": (10, 100)}, jitter=0, clock=clock)
+    assert queue.schedule("a", "default", 1) == 10
+    assert queue.pop_due() is None
+    assert queue.next_due_in() == 10
+    clock.now = 10
+    assert queue.pop_due() == ("a", 1)
+    assert not queue and queue.next_due_in() is None
+
+
+def test_due_order_and_fifo_on_ties(clock):
+    queue = RetryScheduler(jitter=0, clock=clock)
+    queue.defer("late", 0, 5)
+    queue.defer("first", 0, 1)
+    queue.defer("second", 0, 1)
+    clock.now = 5
+    assert [queue.pop_due()[0] for _ in range(3)] == ["first", "second", "late"]
+
+
+def test_exponential_backoff_with_cap(clock):
+    queue = RetryScheduler(max_attempts=10, backoff={"network": (5, 30)}, jitter=0, clock=clock)
+    assert [queue.delay_for("network", n) for n in (1, 2, 3, 4)] == [5, 10, 20, 30]
+
+
+def test_unknown_class_uses_default(clock):
+    queue = RetryScheduler(backoff={"default": (3, 3)}, jitter=0, clock=clock)
+    assert queue.delay_for("whatever", 1) == 3
+
+
+def test_jitter_stays_in_bounds(clock):
+    queue = RetryScheduler(backoff={"default": (100, 100)}, jitter=0.2, clock=clock)
+    delays = [queue.delay_for("default", 1) for _ in range(200)]
+    assert all(80 <= d <= 120 for d in delays)
+    assert len(set(delays)) > 1
+
+
+def test_schedule_refuses_after_max_attempts(clock):
+    queue = RetryScheduler(max_attempts=3, clock=clock)
+    assert queue.schedule(1, "default", 2) is not None
+    assert queue.schedule(2, "default", 3) is None
+    assert list(queue.pending()) == [1]
+
+
+def test_defer_keeps_attempt(clock):
+    queue = RetryScheduler(clock=clock)
+    queue.defer(7, 2, 0)
+    assert queue.pop_due() == (7, 2)
+
+
+@pytest.mark.parametrize("args, expected", [
+    ((412, None, None), "blocked"),
+    ((200, {"code": -509, "message": ""}, None), "rate_limit"),
+    ((None, None, TimeoutError()), "network"),
+    ((502, None, None), "network"),
+    ((200, {"code": -111, "message": ""}, None), "default"),
+])
+def test_error_class(args, expected):
+    assert error_class(*args) == expected
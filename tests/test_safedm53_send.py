@@ -0,0 +1,172 @@
+# test_safedm53_send.py
+"""safedm5.3 分批发送：断点位置与重试（替身 session，不发出网络请求）"""
+import importlib.util
+import threading
+from pathlib import Path
+from queue import Queue
+from urllib.parse import parse_qs
+
+import pytest
+
+from circuit_breaker import BreakerRegistry
+from clock_sync import ServerClock
+from credential_monitor import CredentialMonitor
+from dead_letter import DeadLetterStore
+from instrument import Instrumentation
+from metrics_exporter import RestoreMetrics
+from word_filter import WordFilter
+
+ROOT = Path(__file__).resolve().parent.parent
+ACCOUNT = "test"
+
+
+@pytest.fixture(scope="module")
+def safedm():
+    spec = importlib.util.spec_from_file_location("safedm53", ROOT / "safedm5.3.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class Field:
+    def __init__(self, value=""):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+    def current(self):
+        return 0
+
+
+class Response:
+    def __init__(self, payload):
+        self.status_code = 200
+        self.payload = payload
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.payload
+
+
+class Session:
+    """按弹幕内容返回预设结果，发出 stop_after 个请求后按下停止"""
+
+    def __init__(self, app, stop_after=None, codes=None):
+        self.app = app
+        self.stop_after = stop_after
+        self.codes = codes or {}
+        self.posted = []
+
+    def post(self, url, data=None, **kwargs):
+        message = parse_qs(data)["message"][0]
+        self.posted.append(message)
+        if self.stop_after is not None and len(self.posted) >= self.stop_after:
+            self.app.stop_event.set()
+        code = self.codes.get(message, 0)
+        return Response({"code": code, "message": "0" if code == 0 else "error"})
+
+
+@pytest.fixture
+def app(safedm, tmp_path):
+    app = safedm.BiliDanmakuRestorer.__new__(safedm.BiliDanmakuRestorer)
+    app.instrument = Instrumentation()
+    app.credential_monitor = CredentialMonitor(url="")
+    app.metrics = RestoreMetrics()
+    app.dead_letters = DeadLetterStore(tmp_path / "dead.jsonl")
+    app.word_filter = WordFilter()
+    app.cid_list = [10000]
+    app.part_combobox = Field()
+    for name in ("bili_jct_entry", "sessdata_entry", "buvid3_entry", "bvid_entry"):
+        setattr(app, name, Field("x"))
+    app.next_send_at = 0
+    app.calculate_delay = lambda idx: 0
+    app.progress_queue = Queue()
+    app.log_queue = Queue()
+    app.stop_event = threading.Event()
+    app.checkpoints = []
+    app.save_checkpoint = lambda window, index, pending=(): app.checkpoints.append((window, index, sorted(pending)))
+    return app
+
+
+def window(rows):
+    return [{"time": float(i), "mode": 1, "font_size": 25, "color": 16777215, "pool_type": 0,
+             "weight": 0, "content": f"dm{i}"} for i in range(rows)]
+
+
+def send(app, danmaku_list, session, start=0, pending=()):
+    stats = {"success": 0, "dead": 0, "sent": 0}
+    breaker = BreakerRegistry().get(ACCOUNT, "/x/v2/dm/post")
+    finished = app.send_window(danmaku_list, 0, start, (0, len(danmaku_list), len(danmaku_list)), session,
+                               ServerClock(url=""), ACCOUNT, breaker, stats, pending)
+    return finished, stats
+
+
+def test_stop_saves_next_unsent_item(app):
+    danmaku_list = window(10)
+    session = Session(app, stop_after=4)
+    finished, _ = send(app, danmaku_list, session)
+    assert not finished
+    assert app.checkpoints[-1] == (0, 4, [])
+
+    app.stop_event.clear()
+    resumed = Session(app)
+    finished, stats = send(app, danmaku_list, resumed, start=app.checkpoints[-1][1])
+    assert finished and stats["success"] == 6
+    assert session.posted + resumed.posted == [f"dm{i}" for i in range(10)]
+
+
+def test_stop_keeps_pending_retry(app):
+    danmaku_list = window(10)
+    session = Session(app, stop_after=4, codes={"dm1": -509})
+    finished, _ = send(app, danmaku_list, session)
+    assert not finished
+    # dm1 仍在重试队列中：续传从 dm4 继续，只重发 dm1
+    assert app.checkpoints[-1] == (0, 4, [1])
+
+    app.stop_event.clear()
+    resumed = Session(app)
+    _, start, pending = app.checkpoints[-1]
+    finished, stats = send(app, danmaku_list, resumed, start=start, pending=pending)
+    assert finished and stats["success"] == 7
+    succeeded = [m for m in session.posted if m != "dm1"] + resumed.posted
+    assert len(succeeded) == len(set(succeeded))
+    assert sorted(succeeded) == sorted(dm["content"] for dm in danmaku_list)
+
+
+class AlwaysActive:
+    """巡检始终认为账号正常（该条始终返回-101的情况）"""
+
+    def __init__(self):
+        self.reports = 0
+
+    def is_active(self, account):
+        return True
+
+    def report(self, account, state, message=""):
+        self.reports += 1
+
+
+def test_expired_item_goes_to_dead_letters_after_retry_limit(app):
+    app.credential_monitor = AlwaysActive()
+    session = Session(app, codes={"dm1": -101})
+    finished, stats = send(app, window(3), session)
+    assert finished
+    assert session.posted.count("dm1") == 3
+    assert app.credential_monitor.reports == 3
+    assert (stats["success"], stats["dead"]) == (2, 1)
+    assert len(app.dead_letters.path.read_text().splitlines()) == 1
+
+
+def test_filtered_items_report_progress(app):
+    danmaku_list = window(4)
+    for dm in danmaku_list[2:]:
+        dm["filtered"] = ["x"]
+    finished, stats = send(app, danmaku_list, Session(app))
+    assert finished and stats["dead"] == 2
+    progress = []
+    while not app.progress_queue.empty():
+        progress.append(app.progress_queue.get())
+    assert progress == [25, 50, 75, 100]
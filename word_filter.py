@@ -0,0 +1,174 @@
+# word_filter.py
+"""
+敏感词本地预筛
+
+接口返回 -400 filter 时已经消耗了一次限流配额和 35-60 秒等待。发送前用
+Aho-Corasick 自动机对全部弹幕做一次多模式匹配，命中的弹幕直接标记跳过或把命中词替换为*。
+
+词表来源：
+- 用户维护的词表 ~/.bili_dm_filter_words.txt（每行一个词，#开头为注释）
+- 自动学习的被拒内容 ~/.bili_dm_filter_learned.txt（接口判定为敏感词的整条弹幕）
+
+匹配前统一做全角转半角和大小写折叠，且逐字符转换，命中位置与原文一一对应。
+"""
+import threading
+import unicodedata
+from functools import lru_cache
+from collections import deque
+from pathlib import Path
+from typing import Iterable, List, Tuple
+
+WORDS_PATH = Path.home() / ".bili_dm_filter_words.txt"
+LEARNED_PATH = Path.home() / ".bili_dm_filter_learned.txt"
+
+FLAG = "flag"        # 标记后跳过发送，写入死信
+REWRITE = "rewrite"  # 命中词替换为*后照常发送
+
+
+@lru_cache(maxsize=65536)
+def _fold(ch: str) -> str:
+    folded = unicodedata.normalize("NFKC", ch).casefold()
+    return folded if len(folded) == 1 else ch
+
+
+def normalize(text: str) -> str:
+    """逐字符归一化（长度不变）"""
+    if text.isascii():
+        return text.lower()
+    return "".join(map(_fold, text))
+
+
+def read_words(path) -> List[str]:
+    path = Path(path)
+    if not path.exists():
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+class WordFilter:
+    """
+    Aho-Corasick 多模式匹配
+    功能：
+    - 一次扫描找出文本中所有命中词，耗时与词表大小无关
+    - learn() 把被接口拒绝的内容追加到学习文件并立即生效
+    - screen() 对整份弹幕列表做一次预筛
+    """
+
+    def __init__(self, words: Iterable[str] = (), learned_path=None):
+        """
+        :param words: 初始词表
+        :param learned_path: 学习文件路径，为空时 learn() 只在内存中生效
+        """
+        self.learned_path = Path(learned_path) if learned_path else None
+        self._words = set()
+        self._lock = threading.Lock()
+        self._dirty = True
+        for word in words:
+            self.add(word)
+
+    @classmethod
+    def from_files(cls, words_path=WORDS_PATH, learned_path=LEARNED_PATH) -> "WordFilter":
+        return cls(read_words(words_path) + read_words(learned_path), learned_path)
+
+    def __len__(self) -> int:
+        return len(self._words)
+
+    def add(self, word: str) -> None:
+        word = normalize(word.strip())
+        if word and word not in self._words:
+            with self._lock:
+                self._words.add(word)
+                self._dirty = True
+
+    def learn(self, content: str) -> None:
+        """
+        记录一条被接口判定为敏感的内容
+
+        :param content: 弹幕原文
+        """
+        content = content.strip().replace("\n", " ")
+        if not content or normalize(content) in self._words:
+            return
+        self.add(content)
+        if self.learned_path:
+            with self._lock:
+                with open(self.learned_path, "a", encoding="utf-8") as f:
+                    f.write(content + "\n")
+
+    def _build(self) -> None:
+        # goto表用字典实现：每个状态 {字符: 下一状态}
+        goto, fail, out = [{}], [0], [[]]
+        for word in self._words:
+            state = 0
+            for ch in word:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    fail.append(0)
+                    out.append([])
+                state = nxt
+            out[state].append(word)
+
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                out[nxt] = out[nxt] + out[fail[nxt]]
+        self._goto, self._fail, self._out = goto, fail, out
+        self._dirty = False
+
+    def find(self, text: str) -> List[Tuple[int, int, str]]:
+        """
+        查找所有命中词
+
+        :return: [(起始位置, 结束位置, 命中词), ...]
+        """
+        with self._lock:
+            if self._dirty:
+                self._build()
+            goto, fail, out = self._goto, self._fail, self._out
+        hits = []
+        state = 0
+        for i, ch in enumerate(normalize(text)):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for word in out[state]:
+                hits.append((i - len(word) + 1, i + 1, word))
+        return hits
+
+    def mask(self, text: str, hits=None, char: str = "*") -> str:
+        chars = list(text)
+        for start, end, _ in hits if hits is not None else self.find(text):
+            chars[start:end] = char * (end - start)
+        return "".join(chars)
+
+    def screen(self, danmaku_list: List[dict], action: str = FLAG) -> int:
+        """
+        预筛整份弹幕列表（原地修改，不改变顺序和序号，断点续传不受影响）
+
+        :param danmaku_list: 解析后的弹幕列表
+        :param action: FLAG 在弹幕上记录 "filtered" 命中词；REWRITE 把命中词替换为*
+        :return: 命中的弹幕条数
+        """
+        if not self._words:
+            return 0
+        flagged = 0
+        for dm in danmaku_list:
+            hits = self.find(dm["content"])
+            if not hits:
+                continue
+            flagged += 1
+            if action == REWRITE:
+                dm["content"] = self.mask(dm["content"], hits)
+            else:
+                dm["filtered"] = sorted({word for _, _, word in hits})
+        return flagged